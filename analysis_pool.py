@@ -0,0 +1,403 @@
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from itertools import count, islice
+
+from steg_detector import SteganographyDetector
+
+# Detector owned by the current worker process, created once by _init_worker
+_worker_detector = None
+# Queue on which the worker reports when each task starts; written
+# synchronously, so the notice arrives even if the task kills the worker
+_worker_started = None
+
+# Times an item is run again after its pool broke or was restarted under
+# it, before it is reported as crashed
+MAX_RESUBMITS = 2
+
+
+def _init_worker(settings, cache, started):
+    """Create the warm detector for a worker process."""
+    global _worker_detector, _worker_started
+    _worker_detector = SteganographyDetector(cache=cache.worker_copy() if cache is not None else None)
+    for name, value in settings.items():
+        setattr(_worker_detector, name, value)
+    _worker_started = started
+
+
+def _run_task(func, item, task_id):
+    _worker_started.put((task_id, os.getpid(), time.monotonic()))
+    return func(_worker_detector, item)
+
+
+def _stop_process(pid):
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except OSError:
+        pass
+
+
+def detector_settings(detector):
+    """
+    Collect the tunable settings of a detector so workers can mirror them.
+
+    Args:
+        detector: SteganographyDetector instance
+
+    Returns:
+        dict: Attribute names and values, without the cache
+    """
+    settings = dict(vars(detector))
+    settings.pop("cache", None)
+    return settings
+
+
+class AnalysisPool:
+    """Pool of worker processes, each holding a warm SteganographyDetector.
+
+    One pool may be shared by several threads, each running its own map.
+    A timed-out item leaves its worker busy. That worker is stopped, and
+    the pool restarted, only once no other map has items running, so a
+    timeout in one map never costs another map's items their work.
+    """
+
+    def __init__(self, processes=None, timeout=None, detector=None, max_pending=None):
+        """
+        Configure the pool; worker processes are started on first use.
+
+        Args:
+            processes: Number of worker processes (defaults to the CPU count,
+                0 runs everything in the calling process)
+            timeout: Seconds a single item may run before it is reported as
+                timed out and its worker is stopped
+            detector: Detector whose settings the workers copy
+            max_pending: Maximum number of items in flight (defaults to
+                twice the number of processes)
+        """
+        self.processes = os.cpu_count() if processes is None else processes
+        self.timeout = timeout
+        self.detector = detector or SteganographyDetector()
+        self.max_pending = max_pending or 2 * max(self.processes, 1)
+        # Guards everything below; map calls wait on it for a pending restart
+        self._lock = threading.Condition(threading.RLock())
+        self._executor = None
+        self._started = None
+        self._task_ids = count()
+        # Task ID -> (worker PID, start time), as reported by the workers
+        self._started_at = {}
+        # Map call -> {task ID: future} of the tasks it is waiting for
+        self._running = {}
+        # PIDs of workers still busy with a timed-out task
+        self._stuck = set()
+        # Task ID -> future of running tasks whose map call was abandoned
+        self._abandoned = {}
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "timeouts": 0, "abandoned": 0,
+                       "restarts": 0}
+
+    def _get_executor(self):
+        if self._executor is None:
+            # A fresh queue per executor, since a stopped worker may leave
+            # the old one unusable
+            self._started = multiprocessing.SimpleQueue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processes,
+                initializer=_init_worker,
+                initargs=(detector_settings(self.detector), self.detector.cache, self._started),
+            )
+        return self._executor
+
+    def _reset_executor(self, stop=()):
+        """Drop the executor, first stopping the stuck workers and those with the given PIDs."""
+        self._collect_starts()
+        for pid in self._stuck.union(stop):
+            _stop_process(pid)
+        self._stuck.clear()
+        for task_id in self._abandoned:
+            self._started_at.pop(task_id, None)
+        self._abandoned.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._started.close()
+            self._started = None
+
+    def _collect_starts(self):
+        """Record the start notices the workers have sent so far."""
+        while self._started is not None and not self._started.empty():
+            task_id, pid, started = self._started.get()
+            self._started_at[task_id] = (pid, started)
+
+    def _overdue(self, task_id, now):
+        started = self._started_at.get(task_id)
+        return started is not None and self.timeout is not None and started[1] + self.timeout <= now
+
+    def _check_abandoned(self):
+        """Count the workers of abandoned tasks that have run past the timeout as stuck."""
+        self._collect_starts()
+        now = time.monotonic()
+        for task_id, future in list(self._abandoned.items()):
+            if future.done() or self._overdue(task_id, now):
+                del self._abandoned[task_id]
+                started = self._started_at.pop(task_id, None)
+                if not future.done() and started is not None:
+                    self._stuck.add(started[0])
+
+    def _busy_until(self, call):
+        """
+        When the running items of the other map calls reach their timeout, or None if they have none.
+
+        Items that have not started yet do not count, since they are simply
+        resubmitted after a restart, nor do items that are already overdue.
+        """
+        self._collect_starts()
+        now = time.monotonic()
+        deadlines = [self._started_at[task_id][1] + self.timeout
+                     for other, tasks in self._running.items() if other is not call
+                     for task_id, future in tasks.items()
+                     if task_id in self._started_at and not future.done() and not self._overdue(task_id, now)]
+        return min(deadlines, default=None)
+
+    def _restart(self, call):
+        """Restart the pool after a timeout, stopping the workers of the call's own running items too."""
+        self._collect_starts()
+        now = time.monotonic()
+        stop = [self._started_at[task_id][0]
+                for other, tasks in self._running.items()
+                for task_id, future in tasks.items()
+                if task_id in self._started_at and not future.done()
+                and (other is call or self._overdue(task_id, now))]
+        self._stats["restarts"] += 1
+        self._reset_executor(stop)
+
+    def _notify(self, _):
+        with self._lock:
+            self._lock.notify_all()
+
+    def _submit(self, call, func, item, resubmits=0):
+        """Submit an item of a map call, restarting a broken executor."""
+        task_id = next(self._task_ids)
+        try:
+            executor = self._get_executor()
+            future = executor.submit(_run_task, func, item, task_id)
+        except BrokenProcessPool:
+            # A worker died since the last result came in
+            self._stats["restarts"] += 1
+            self._reset_executor()
+            executor = self._get_executor()
+            future = executor.submit(_run_task, func, item, task_id)
+        self._running.setdefault(call, {})[task_id] = future
+        future.add_done_callback(self._notify)
+        return item, task_id, future, executor, resubmits
+
+    def _forget(self, call, task_id):
+        self._running.get(call, {}).pop(task_id, None)
+        self._started_at.pop(task_id, None)
+
+    def _resubmit(self, call, func, pending):
+        """Resubmit the items of a map call that were lost with a replaced executor."""
+        now = time.monotonic()
+        for index, (item, task_id, future, executor, resubmits) in enumerate(pending):
+            if executor is self._executor or self._overdue(task_id, now):
+                continue
+            if future.done() and not future.cancelled() and not isinstance(future.exception(), BrokenProcessPool):
+                continue
+            # Only an item that was running can have brought the pool down
+            started = task_id in self._started_at
+            self._forget(call, task_id)
+            pending[index] = self._submit(call, func, item, resubmits + started)
+
+    def _wait(self, task_id, future, idle):
+        """
+        Wait for a task until it has run for the pool's timeout.
+
+        The deadline counts from when a worker picked the task up, not from
+        when it was submitted, so time spent queued behind other items is
+        not held against it.
+
+        Args:
+            task_id: ID the task was submitted with
+            future: Its future
+            idle: Called whenever the task is still waiting for a worker
+                after another timeout's worth of time
+
+        Raises:
+            TimeoutError: The task ran for longer than the timeout
+        """
+        if self.timeout is None:
+            return future.result()
+        while True:
+            with self._lock:
+                self._collect_starts()
+                started = self._started_at.get(task_id)
+            if started is None:
+                # Not picked up yet; check again once it could have been
+                remaining = self.timeout
+            else:
+                remaining = max(started[1] + self.timeout - time.monotonic(), 0)
+            try:
+                return future.result(timeout=remaining)
+            except TimeoutError:
+                if started is not None:
+                    raise
+                idle()
+
+    def map(self, func, items):
+        """
+        Apply func(detector, item) to every item, yielding results in order.
+
+        At most max_pending items are in flight at once, so results that
+        finish early do not pile up while an earlier item is still running.
+        A failing, crashing or timed-out item yields an error dict instead of
+        a result and does not affect the other items. After a crash the pool
+        is restarted at once. After a timeout it is restarted when no other
+        map has items running, and until then new items wait. Unfinished
+        items are resubmitted either way.
+
+        Args:
+            func: Picklable module-level function taking (detector, item)
+            items: Iterable of picklable work items
+
+        Yields:
+            tuple: (item, result)
+        """
+        if self.processes == 0:
+            for item in items:
+                with self._lock:
+                    self._stats["submitted"] += 1
+                try:
+                    result = func(self.detector, item)
+                    outcome = "completed"
+                except Exception as e:
+                    outcome = "failed"
+                    result = {"error": str(e)}
+                with self._lock:
+                    self._stats[outcome] += 1
+                yield item, result
+            return
+
+        items = iter(items)
+        pending = deque()
+        call = object()
+        timed_out = {"error": f"Analysis timed out after {self.timeout} seconds"}
+
+        def submit(item):
+            with self._lock:
+                # Let the other calls' running items finish before the stuck
+                # workers are stopped
+                self._check_abandoned()
+                while self._stuck:
+                    busy_until = self._busy_until(call)
+                    if busy_until is None:
+                        self._restart(call)
+                        self._resubmit(call, func, pending)
+                        break
+                    self._lock.wait(busy_until - time.monotonic())
+                self._stats["submitted"] += 1
+                pending.append(self._submit(call, func, item))
+
+        def unstick():
+            # Every worker may be stuck on items nobody waits for any more
+            with self._lock:
+                self._check_abandoned()
+                if self._stuck and self._busy_until(call) is None:
+                    self._restart(call)
+                    self._resubmit(call, func, pending)
+
+        try:
+            for item in islice(items, self.max_pending):
+                submit(item)
+
+            while pending:
+                entry = pending.popleft()
+                item, task_id, future, executor, resubmits = entry
+                try:
+                    result = self._wait(task_id, future, unstick)
+                    outcome = "completed"
+                except TimeoutError:
+                    outcome, result = "timeouts", dict(timed_out)
+                    with self._lock:
+                        pid = self._started_at[task_id][0]
+                        if executor is not self._executor:
+                            # Its pool has been replaced already
+                            _stop_process(pid)
+                        else:
+                            self._stuck.add(pid)
+                            if self._busy_until(call) is None:
+                                self._restart(call)
+                                self._resubmit(call, func, pending)
+                except (BrokenProcessPool, CancelledError):
+                    with self._lock:
+                        self._collect_starts()
+                        if self._overdue(task_id, time.monotonic()):
+                            # Stopped by another call's restart after its timeout
+                            outcome, result = "timeouts", dict(timed_out)
+                        else:
+                            # A worker died, or another call restarted the
+                            # pool; restart it unless that already happened
+                            if executor is self._executor:
+                                self._stats["restarts"] += 1
+                                self._reset_executor()
+                            if resubmits < MAX_RESUBMITS:
+                                # Every item in flight fails with the worker
+                                # that died, so try this one again
+                                pending.appendleft(entry)
+                                self._resubmit(call, func, pending)
+                                continue
+                            outcome = "failed"
+                            result = {"error": "A worker process crashed before this item finished"}
+                            self._resubmit(call, func, pending)
+                except Exception as e:
+                    outcome = "failed"
+                    result = {"error": str(e)}
+                with self._lock:
+                    self._stats[outcome] += 1
+                    self._forget(call, task_id)
+                    self._lock.notify_all()
+                yield item, result
+
+                for next_item in islice(items, 1):
+                    submit(next_item)
+        finally:
+            # Nobody waits for the items of an abandoned call any more; drop
+            # the queued ones, and stop the running ones if they overrun
+            with self._lock:
+                for task_id, future in self._running.pop(call, {}).items():
+                    self._stats["abandoned"] += 1
+                    if future.cancel() or future.done() or self.timeout is None:
+                        self._started_at.pop(task_id, None)
+                    else:
+                        self._abandoned[task_id] = future
+                self._lock.notify_all()
+
+    def stats(self):
+        """
+        Report the pool size and the item counters.
+
+        Returns:
+            dict: Counters of submitted, completed, failed, timed-out and
+            abandoned items, pool restarts, and the number of worker processes
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["processes"] = self.processes
+        stats["in_flight"] = (stats["submitted"] - stats["completed"] - stats["failed"]
+                              - stats["timeouts"] - stats["abandoned"])
+        return stats
+
+    def close(self):
+        """Shut down the worker processes."""
+        with self._lock:
+            executor, started, stuck = self._executor, self._started, set(self._stuck)
+            self._executor = self._started = None
+            self._stuck.clear()
+        # Outside the lock, since finishing futures call back into the pool
+        for pid in stuck:
+            _stop_process(pid)
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+            started.close()
@@ -1,47 +1,300 @@
-from flask import Flask, request, jsonify
+from flask import (Flask, Request, Response, copy_current_request_context, g, request, jsonify,
+                   stream_with_context, url_for)
 from werkzeug.utils import secure_filename
+import cProfile
+import io
 import os
-import tempfile
+import random
+import time
 import zipfile
 import base64
-import mimetypes
-from steg_detector import SteganographyDetector
+import copy
+import hashlib
+from collections import Counter, OrderedDict, deque
+from functools import partial
+from steg_detector import SteganographyDetector, resolve_methods
+from cover_index import CoverIndex
+from image_context import ImageContext
+from bitplanes import bitplane_preview
+from localization import HEATMAP_BLOCK_SIZE, heatmap_png
+from previews import PreviewStore, lsb_png
+from analysis_pool import AnalysisPool
+from jobs import JobQueue, JobQueueFull
+from result_cache import ResultCache
+from zip_ingest import ZipImageReader, ZipLimitError
+from metrics import MetricsRegistry
 from flask_cors import CORS
-from PIL import Image
 import numpy as np
 import base64
 
+class InMemoryRequest(Request):
+    """Request that keeps uploaded files in memory instead of spooling them to disk."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
 app = Flask(__name__)
-detector = SteganographyDetector()
+app.request_class = InMemoryRequest
+
+# Results of previously seen images, keyed on their content
+app.config['CACHE_SIZE'] = int(os.environ.get('STEG_CACHE_SIZE', 1024))
+app.config['CACHE_PATH'] = os.environ.get('STEG_CACHE_PATH')
+app.config['CACHE_MAX_BYTES'] = int(os.environ.get('STEG_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+result_cache = ResultCache(max_entries=app.config['CACHE_SIZE'],
+                           path=app.config['CACHE_PATH'],
+                           max_disk_bytes=app.config['CACHE_MAX_BYTES']) if app.config['CACHE_SIZE'] > 0 else None
+detector = SteganographyDetector(cache=result_cache)
+# Working memory per image for the tiled statistics; unset analyzes images whole
+app.config['MEMORY_BUDGET'] = int(os.environ['STEG_MEMORY_BUDGET']) if 'STEG_MEMORY_BUDGET' in os.environ else None
+detector.memory_budget = app.config['MEMORY_BUDGET']
+# Index of known clean covers (built with cover_index.py) that uploads are diffed against
+app.config['COVER_INDEX'] = os.environ.get('STEG_COVER_INDEX')
+detector.cover_index = CoverIndex(app.config['COVER_INDEX']) if app.config['COVER_INDEX'] else None
+# Side in pixels of the blocks of the suspicion heatmap; 0 turns the heatmap off
+app.config['HEATMAP_BLOCK_SIZE'] = int(os.environ.get('STEG_HEATMAP_BLOCK', HEATMAP_BLOCK_SIZE))
+
+# Memory for uploaded images and their rendered previews, served by /preview
+app.config['PREVIEW_MAX_BYTES'] = int(os.environ.get('STEG_PREVIEW_MAX_BYTES', 512 * 1024 * 1024))
+# Largest ?size= a preview can be asked for
+app.config['PREVIEW_MAX_SIDE'] = 8192
+# Directory where uploads are also kept so that every server process can preview them
+app.config['PREVIEW_DIR'] = os.environ.get('STEG_PREVIEW_DIR')
+app.config['PREVIEW_MAX_DISK_BYTES'] = int(os.environ.get('STEG_PREVIEW_MAX_DISK_BYTES', 1024 * 1024 * 1024))
+preview_store = PreviewStore(max_bytes=app.config['PREVIEW_MAX_BYTES'],
+                             path=app.config['PREVIEW_DIR'],
+                             max_disk_bytes=app.config['PREVIEW_MAX_DISK_BYTES'])
+
+# Uploads are held in memory, so bound their size
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('STEG_MAX_UPLOAD_BYTES', 512 * 1024 * 1024))
+# Limits applied to zip archives before and while their members are read
+app.config['ZIP_MAX_MEMBERS'] = int(os.environ.get('STEG_ZIP_MAX_MEMBERS', 10000))
+app.config['ZIP_MAX_TOTAL_BYTES'] = int(os.environ.get('STEG_ZIP_MAX_TOTAL_BYTES', 1024 * 1024 * 1024))
+app.config['ZIP_MAX_RATIO'] = float(os.environ.get('STEG_ZIP_MAX_RATIO', 100))
+app.config['MAX_IMAGE_PIXELS'] = int(os.environ.get('STEG_MAX_IMAGE_PIXELS', 100_000_000))
+# Distinct images of an archive whose results are kept for repeats later in it
+app.config['ZIP_REPEAT_RESULTS'] = 1024
+
+# Worker processes for zip analysis; 0 analyzes in the request thread
+app.config['ANALYSIS_POOL_SIZE'] = int(os.environ.get('STEG_POOL_SIZE', os.cpu_count() or 1))
+# Seconds allowed per image before it is reported as timed out
+app.config['ANALYSIS_TIMEOUT'] = float(os.environ['STEG_IMAGE_TIMEOUT']) if 'STEG_IMAGE_TIMEOUT' in os.environ else None
+
+# Background analysis jobs: jobs run at once, jobs allowed to wait, and
+# seconds a finished job's results are kept
+app.config['JOB_WORKERS'] = int(os.environ.get('STEG_JOB_WORKERS', 1))
+app.config['JOB_QUEUE_DEPTH'] = int(os.environ.get('STEG_JOB_QUEUE_DEPTH', 16))
+app.config['JOB_TTL'] = float(os.environ.get('STEG_JOB_TTL', 3600))
+# SQLite file holding the jobs, shared by all server processes; unset keeps them in memory
+app.config['JOB_DB'] = os.environ.get('STEG_JOB_DB')
+# Seconds between keep-alive comments on an idle job event stream
+app.config['JOB_EVENTS_KEEPALIVE'] = 15
+job_queue = JobQueue(workers=app.config['JOB_WORKERS'],
+                     max_queued=app.config['JOB_QUEUE_DEPTH'],
+                     result_ttl=app.config['JOB_TTL'],
+                     path=app.config['JOB_DB'])
+
+# Directory for cProfile dumps of sampled requests; profiling is off when unset
+app.config['PROFILE_DIR'] = os.environ.get('STEG_PROFILE_DIR')
+# Fraction of requests profiled automatically (others can ask with ?profile=1)
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('STEG_PROFILE_SAMPLE_RATE', 0))
+
+metrics = MetricsRegistry()
+analysis_pool = None
+
+def get_analysis_pool():
+    global analysis_pool
+    if analysis_pool is None:
+        analysis_pool = AnalysisPool(processes=app.config['ANALYSIS_POOL_SIZE'],
+                                     timeout=app.config['ANALYSIS_TIMEOUT'],
+                                     detector=detector)
+    return analysis_pool
 
 CORS(app)
 
-def create_lsb_pic(tmpdir, filepath):
-    img = Image.open(filepath)
-    img = img.convert("RGB")
-    img_array = np.array(img)
+@app.before_request
+def start_profiling():
+    if not app.config['PROFILE_DIR']:
+        return
+    if request.args.get('profile') == '1' or random.random() < app.config['PROFILE_SAMPLE_RATE']:
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.teardown_request
+def stop_profiling(exc):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+    profiler.disable()
+    os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint}-{os.getpid()}-{id(profiler):x}.prof"
+    profiler.dump_stats(os.path.join(app.config['PROFILE_DIR'], name))
 
-    # Extract the least significant bit (LSB) of each pixel
-    lsb_array = img_array & 1
-    lsb_image_array = (lsb_array * 255).astype(np.uint8)
+def create_lsb_pic(image):
+    # Reuse the decoded image when the caller already has a context
+    context = ImageContext.coerce(image)
 
     try:
-        lsb_image = Image.fromarray(lsb_image_array)
-
-        # Save the LSB image to a temporary file
-        base_name = os.path.splitext(os.path.basename(filepath))[0]
-        lsb_image_path = os.path.join(tmpdir, f"{base_name}_lsb.png")
-        lsb_image.save(lsb_image_path)
-
-        # Encode the LSB image in base64
-        with open(lsb_image_path, "rb") as image_file:
-            encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-            # Return the base64-encoded LSB image as a string
-            return encoded_string
+        # Encode the LSB image as PNG in memory, then in base64
+        return base64.b64encode(lsb_png(context)).decode('utf-8')
     except Exception as e:
         print(f"Error processing LSB image: {e}")
         return None
 
+def record_stage_time(analysis_data, stage, start):
+    """Time a stage run after the analysis, such as a preview, and count it in the result's total."""
+    milliseconds = (time.perf_counter() - start) * 1000
+    timings = analysis_data.setdefault('timings_ms', {})
+    timings[stage] = milliseconds
+    timings['total'] = timings.get('total', 0.0) + milliseconds
+
+def attach_lsb_pic(analysis_data, context):
+    """Add the LSB preview to a result and time its generation."""
+    start = time.perf_counter()
+    try:
+        analysis_data['lsbpic'] = create_lsb_pic(context)
+    except Exception as e:
+        print(f"error creating LSB pic for image {context.filename}: {e}")
+        analysis_data['lsbpic'] = None
+    record_stage_time(analysis_data, 'lsb_preview', start)
+    return analysis_data
+
+def attach_preview_urls(analysis_data, data, mime_type, analysis_id=None):
+    """
+    Keep an uploaded image for /preview and add its analysis ID and preview URLs to a result.
+
+    The LSB preview and the original are only rendered when a client asks
+    for them, so results stay small however large the image. Uploads that
+    Pillow could not identify as an image (mime_type None) are not kept,
+    so /preview never serves back arbitrary content.
+    """
+    if 'error' in analysis_data or mime_type is None:
+        return analysis_data
+    analysis_id = preview_store.put(data, mime_type, analysis_id=analysis_id)
+    analysis_data['analysis_id'] = analysis_id
+    analysis_data['image_url'] = url_for('preview', analysis_id=analysis_id, kind='original')
+    analysis_data['lsbpic_url'] = url_for('preview', analysis_id=analysis_id, kind='lsb')
+    return analysis_data
+
+def wants_inline():
+    """True when the client asked for the previews to be embedded in the results as base64."""
+    return request.args.get('inline', '').lower() in ('1', 'true', 'yes')
+
+def attach_heatmap(analysis_data, context, detector):
+    """Add the block suspicion heatmap and its PNG overlay to a result and time their generation."""
+    if not app.config['HEATMAP_BLOCK_SIZE']:
+        return analysis_data
+    start = time.perf_counter()
+    try:
+        stats = detector.localize(context, block_size=app.config['HEATMAP_BLOCK_SIZE'])
+        analysis_data['heatmap'] = {
+            'block_size': stats['block_size'],
+            **{key: np.round(np.nan_to_num(stats[key]), 3).tolist()
+               for key in ('suspicion', 'embedding_rate', 'pair_p_value', 'transition_rate', 'ones_ratio')},
+        }
+        analysis_data['heatmappic'] = heatmap_png(stats['suspicion'])
+    except Exception as e:
+        print(f"error creating heatmap for image {context.filename}: {e}")
+        analysis_data['heatmap'] = None
+        analysis_data['heatmappic'] = None
+    record_stage_time(analysis_data, 'heatmap', start)
+    return analysis_data
+
+def parse_bitplanes(value):
+    """
+    Turn ?bitplanes=G1,B2 (or "all") into (channel, bit) pairs.
+
+    Raises:
+        ValueError: If a plane name is not a channel letter and a bit from 0 to 7
+    """
+    if value == 'all':
+        return [(channel, bit) for channel in range(3) for bit in range(8)]
+    planes = []
+    for name in value.split(','):
+        name = name.strip().upper()
+        if len(name) != 2 or name[0] not in 'RGB' or name[1] not in '01234567':
+            raise ValueError(f"Unknown bit plane: {name}")
+        planes.append(('RGB'.index(name[0]), int(name[1])))
+    return planes
+
+def attach_bitplane_pics(analysis_data, context, planes):
+    """Add previews of the requested bit planes to a result and time their generation."""
+    start = time.perf_counter()
+    try:
+        rgb = context.rgb
+        analysis_data['bitplane_pics'] = {
+            f"{'RGB'[channel]}{bit}": bitplane_preview(np.ascontiguousarray(rgb[:, :, channel]), bit)
+            for channel, bit in planes
+        }
+    except Exception as e:
+        print(f"error creating bit plane pics for image {context.filename}: {e}")
+        analysis_data['bitplane_pics'] = None
+    record_stage_time(analysis_data, 'bitplane_previews', start)
+    return analysis_data
+
+# Values of ?frames=: analyze every frame, or stop at the first flagged one
+FRAME_MODES = ('all', 'until_detected')
+
+def parse_frames(value):
+    """
+    Read the ?frames= option of /analyze.
+
+    Raises:
+        ValueError: If the value is not one of FRAME_MODES
+    """
+    if value not in FRAME_MODES:
+        raise ValueError(f"frames must be one of: {', '.join(FRAME_MODES)}")
+    return value
+
+def attach_frame_analysis(analysis_data, context, frames, options):
+    """Analyze every frame of an animation or multi-page TIFF and fold the worst verdict in."""
+    frame_analysis = detector.analyze_frames(context, stop_on_detection=(frames == 'until_detected'),
+                                             pool=get_analysis_pool(), first_result=analysis_data, **options)
+    analysis_data['frame_analysis'] = frame_analysis
+    if frame_analysis.get('steganography_detected', 0) > analysis_data.get('steganography_detected', 0):
+        analysis_data['steganography_detected'] = frame_analysis['steganography_detected']
+        analysis_data['conclusion'] = frame_analysis['conclusion']
+    return analysis_data
+
+def finish_result(analysis_data):
+    """Record a result in the metrics and drop its timings unless ?timings=1 was given."""
+    metrics.record_result(analysis_data)
+    if request.args.get('timings') != '1':
+        analysis_data.pop('timings_ms', None)
+    return analysis_data
+
+def analysis_options(early_exit_default):
+    """
+    Read the method selection of a request from its query string.
+
+    ?methods=lsb,chi_square picks the detection methods and ?early_exit=0/1
+    controls whether the remaining methods are skipped once the verdict is
+    decided.
+
+    Raises:
+        ValueError: If an unknown method is requested
+    """
+    early_exit = request.args.get('early_exit')
+    return {
+        'methods': resolve_methods(request.args.get('methods')) if request.args.get('methods') else None,
+        'early_exit': early_exit_default if early_exit is None else early_exit.lower() in ('1', 'true', 'yes'),
+    }
+
+def analyze_zip_member(detector, member, methods=None, early_exit=False, inline=False):
+    """Analyze one zip member from its bytes; runs inside a pool worker."""
+    name, data, _, error = member
+    if error:
+        return {"filename": name, "error": error}
+
+    context = ImageContext(data, filename=name)
+    analysis_data = detector.analyze_image(context, methods=methods, early_exit=early_exit, timings=True)
+    analysis_data['mime_type'] = context.mime_type
+
+    # The original and its LSB pic are embedded only on request
+    if inline:
+        analysis_data['image_data'] = base64.b64encode(data).decode('utf-8')
+        attach_lsb_pic(analysis_data, context)
+    return attach_heatmap(analysis_data, context, detector)
+
 @app.route('/analyze', methods=['POST'])
 def analyze_image():
     if 'image' not in request.files:
@@ -51,15 +304,128 @@ def analyze_image():
     if file.filename == '':
         return jsonify({"error": "No file selected"}), 400
 
-    filename = secure_filename(file.filename)
-    with tempfile.TemporaryDirectory() as tmpdir:
-        filepath = os.path.join(tmpdir, filename)
-        file.save(filepath)
+    try:
+        options = analysis_options(early_exit_default=False)
+        bitplanes = parse_bitplanes(request.args['bitplanes']) if request.args.get('bitplanes') else None
+        frames = parse_frames(request.args['frames']) if request.args.get('frames') else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # The upload is analyzed straight from its in-memory buffer
+    context = ImageContext(file.stream, filename=secure_filename(file.filename))
+    result = detector.analyze_image(context, timings=True, **options)
+    if wants_inline():
+        attach_lsb_pic(result, context)
+    attach_preview_urls(result, context.data, context.mime_type, analysis_id=context.content_hash)
+    attach_heatmap(result, context, detector)
+    if bitplanes:
+        attach_bitplane_pics(result, context, bitplanes)
+    if frames:
+        attach_frame_analysis(result, context, frames, options)
+    return jsonify(finish_result(result))
+
+def open_zip_reader(stream):
+    """Open an uploaded archive with the configured decompression limits."""
+    return ZipImageReader(stream,
+                          max_members=app.config['ZIP_MAX_MEMBERS'],
+                          max_total_bytes=app.config['ZIP_MAX_TOTAL_BYTES'],
+                          max_ratio=app.config['ZIP_MAX_RATIO'],
+                          max_pixels=app.config['MAX_IMAGE_PIXELS'])
+
+def iter_zip_results(reader, options):
+    """
+    Yield (name, analysis) pairs in order, fanned out to the worker pool.
 
-        result = detector.analyze_image(filepath)
-        lsb_pic = create_lsb_pic(tmpdir, filepath)
-        result['lsbpic'] = lsb_pic
-        return jsonify(result)
+    Members with the same bytes as an earlier member are not sent to the
+    pool: the earlier member's result is copied to them once it arrives,
+    as a cache hit, whichever worker produced it. Results are remembered
+    for the last ZIP_REPEAT_RESULTS distinct images of the archive.
+    """
+    task = partial(analyze_zip_member, inline=wants_inline(), **options)
+    order = deque()          # (name, digest, analyzed) of every member read, in archive order
+    results = OrderedDict()  # digest -> result of the first member with those bytes
+    analyzing = set()        # digests sent to the pool whose result has not arrived
+    awaited = Counter()      # digest -> repeats in order still waiting for its result
+
+    def unique_members():
+        for member in reader:
+            name, data, _, error = member
+            digest = None if error else hashlib.sha256(data).hexdigest()
+            if digest is not None and (digest in results or digest in analyzing):
+                awaited[digest] += 1
+                order.append((name, digest, False))
+                continue
+            if digest is not None:
+                analyzing.add(digest)
+            order.append((name, digest, True))
+            yield member
+
+    def repeats():
+        while order and not order[0][2]:
+            name, digest, _ = order.popleft()
+            awaited[digest] -= 1
+            results.move_to_end(digest)
+            analysis_data = copy.deepcopy(results[digest])
+            analysis_data['filename'] = name
+            analysis_data['timings_ms'] = {'cache_lookup': 0.0, 'total': 0.0}
+            yield name, finish_result(analysis_data)
+
+    for member, analysis_data in get_analysis_pool().map(task, unique_members()):
+        yield from repeats()
+        name, digest, _ = order.popleft()
+        attach_preview_urls(analysis_data, member[1], analysis_data.get('mime_type'))
+        if digest is not None:
+            analyzing.discard(digest)
+            results[digest] = analysis_data
+            for old in list(results):
+                if len(results) <= app.config['ZIP_REPEAT_RESULTS']:
+                    break
+                if not awaited[old]:
+                    del results[old]
+        yield name, finish_result(analysis_data)
+    yield from repeats()
+
+def summarize_results(summary, analysis_data):
+    """Fold one image's analysis into the running batch summary."""
+    summary['analyzed'] += 1
+    if 'error' in analysis_data:
+        summary['errors'] += 1
+    elif analysis_data.get('steganography_detected') == 2:
+        summary['high_probability'] += 1
+    elif analysis_data.get('steganography_detected') == 1:
+        summary['possible'] += 1
+    return summary
+
+def new_summary():
+    return {'analyzed': 0, 'high_probability': 0, 'possible': 0, 'errors': 0}
+
+def wants_stream():
+    """True when the client asked for newline-delimited JSON results."""
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'application/x-ndjson' in request.headers.get('Accept', '')
+
+def ndjson_record(record):
+    return app.json.dumps(record) + '\n'
+
+def stream_zip_results(reader, options):
+    """
+    Generate the NDJSON body for a streamed zip analysis.
+
+    The first record carries the number of archive members (an upper bound
+    on the number of images), then one record per image is sent as soon as
+    it is analyzed, and a final summary closes the stream. Only the
+    in-flight images are held in memory.
+    """
+    try:
+        summary = new_summary()
+        yield ndjson_record({'members': len(reader.members)})
+        for name, analysis_data in iter_zip_results(reader, options):
+            summarize_results(summary, analysis_data)
+            yield ndjson_record({'file': {name: analysis_data}})
+        yield ndjson_record({'summary': summary})
+    finally:
+        reader.close()
 
 @app.route('/analyzezip', methods=['POST'])
 def analyze_zip():
@@ -70,56 +436,232 @@ def analyze_zip():
     if file.filename == '':
         return jsonify({"error": "No file selected"}), 400
 
-    filename = secure_filename(file.filename)
-    with tempfile.TemporaryDirectory() as tmpdir:
-        zip_path = os.path.join(tmpdir, filename)
-        file.save(zip_path)
+    # Bulk triage stops analyzing an image once its verdict is decided
+    try:
+        options = analysis_options(early_exit_default=True)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
+    # The archive is read member by member straight from the upload buffer
+    try:
+        reader = open_zip_reader(file.stream)
+    except zipfile.BadZipFile:
+        return jsonify({"error": "Uploaded file is not a valid zip file"}), 400
+    except ZipLimitError as e:
+        return jsonify({"error": str(e)}), 413
+
+    if wants_stream():
+        return Response(stream_with_context(stream_zip_results(reader, options)),
+                        mimetype='application/x-ndjson')
+
+    try:
+        results = {'files': [], 'summary': new_summary()}
+        for name, analysis_data in iter_zip_results(reader, options):
+            summarize_results(results['summary'], analysis_data)
+            results['files'].append({name: analysis_data})
+    finally:
+        reader.close()
+
+    return jsonify(results)
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queue the analysis of an uploaded image ("image") or zip file ("zip").
+
+    Answers at once with the job ID; the analysis runs in the background
+    with the same options as /analyze and /analyzezip. Poll
+    GET /jobs/<job_id> or subscribe to GET /jobs/<job_id>/events for
+    progress and results.
+    """
+    field = next((name for name in ('zip', 'image') if name in request.files), None)
+    if field is None:
+        return jsonify({"error": "No file part in the request"}), 400
+    file = request.files[field]
+    if file.filename == '':
+        return jsonify({"error": "No file selected"}), 400
 
-        if not zipfile.is_zipfile(zip_path):
+    try:
+        options = analysis_options(early_exit_default=field == 'zip')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # The upload buffer is closed with the request, so the job keeps the bytes
+    file.stream.seek(0)
+    data = file.stream.read()
+    if field == 'zip':
+        try:
+            reader = open_zip_reader(io.BytesIO(data))
+        except zipfile.BadZipFile:
             return jsonify({"error": "Uploaded file is not a valid zip file"}), 400
+        except ZipLimitError as e:
+            return jsonify({"error": str(e)}), 413
+        members = reader.members
+    else:
+        reader = [(secure_filename(file.filename), data, file.mimetype, None)]
+        members = reader
+
+    # The job reads this request's options and builds preview URLs after it has returned
+    @copy_current_request_context
+    def work(job):
+        job.summary = new_summary()
+        try:
+            for name, analysis_data in iter_zip_results(reader, options):
+                summarize_results(job.summary, analysis_data)
+                job.add_result(name, analysis_data)
+                if job.cancel_requested:
+                    break
+        finally:
+            if field == 'zip':
+                reader.close()
+
+    try:
+        job_id = job_queue.submit(work, members=len(members))
+    except JobQueueFull as e:
+        if field == 'zip':
+            reader.close()
+        return jsonify({"error": str(e)}), 429, {'Retry-After': '10'}
+
+    status_url = url_for('job_status', job_id=job_id)
+    return jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': status_url,
+        'events_url': url_for('job_events', job_id=job_id),
+    }), 202, {'Location': status_url}
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status, progress and summary of a job, with its results from ?since=N on (default all)."""
+    since = request.args.get('since', '0')
+    description = job_queue.describe(job_id, since=int(since) if since.isdigit() else 0)
+    if description is None:
+        return jsonify({"error": "Unknown or expired job ID"}), 404
+    return jsonify(description)
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a job; results already produced are kept."""
+    if not job_queue.cancel(job_id):
+        return jsonify({"error": "Unknown or expired job ID"}), 404
+    return jsonify(job_queue.describe(job_id, since=None))
+
+def sse_event(event, data, event_id=None):
+    """Format one server-sent event with a JSON payload."""
+    head = f"event: {event}\n" + (f"id: {event_id}\n" if event_id is not None else "")
+    return f"{head}data: {app.json.dumps(data)}\n\n"
+
+def iter_job_events(job_id, seen):
+    """
+    Generate the server-sent events of a job after its first `seen` results.
+
+    Each result is a "result" event whose ID is its position, so a client
+    that reconnects with Last-Event-ID picks up where it left off. A
+    "progress" event follows every batch of results and an "end" event
+    with the final status and summary closes the stream.
+    """
+    while True:
+        records, finished = job_queue.wait(job_id, seen, timeout=app.config['JOB_EVENTS_KEEPALIVE'])
+        for record in records:
+            seen += 1
+            yield sse_event('result', record, event_id=seen)
+        if records or finished:
+            job = job_queue.describe(job_id, since=None) or {}
+        if records:
+            yield sse_event('progress', {'completed': seen, 'members': job.get('members'), 'summary': job.get('summary')})
+        if finished:
+            yield sse_event('end', {'status': job.get('status', 'expired'), 'summary': job.get('summary'),
+                                    'error': job.get('error')})
+            return
+        if not records:
+            yield ": keep-alive\n\n"
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    if job_queue.describe(job_id, since=None) is None:
+        return jsonify({"error": "Unknown or expired job ID"}), 404
+    last_id = request.headers.get('Last-Event-ID', '')
+    return Response(iter_job_events(job_id, int(last_id) if last_id.isdigit() else 0),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def parse_preview_size(value):
+    """
+    Turn ?size= into the longest side of a preview, or None for full size.
+
+    Raises:
+        ValueError: If the size is not a whole number from 1 to PREVIEW_MAX_SIDE
+    """
+    if not value:
+        return None
+    size = int(value) if value.isdigit() else 0
+    if not 1 <= size <= app.config['PREVIEW_MAX_SIDE']:
+        raise ValueError(f"Preview size must be from 1 to {app.config['PREVIEW_MAX_SIDE']}")
+    return size
+
+@app.route('/preview/<analysis_id>/<kind>', methods=['GET'])
+def preview(analysis_id, kind):
+    """
+    Serve the original ("original") or LSB plane ("lsb") of an analyzed image.
+
+    ?size=N scales it down to fit N pixels. Previews are rendered on first
+    request and cached; an analysis ID is a content hash, so a preview
+    never changes and clients may keep it for good.
+    """
+    try:
+        max_side = parse_preview_size(request.args.get('size'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    etag = f"{analysis_id}-{kind}-{max_side or 'full'}"
+    if etag in request.if_none_match and preview_store.has(analysis_id):
+        response = Response(status=304)
+    else:
+        try:
+            found = preview_store.get(analysis_id, kind, max_side)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 404
+        except Exception as e:
+            return jsonify({"error": f"Could not render preview: {e}"}), 422
+        if found is None:
+            return jsonify({"error": "Unknown or expired analysis ID"}), 404
+        data, mime_type = found
+        response = Response(data, mimetype=mime_type)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+# Statistics that can go down; every other one is a count that only grows
+GAUGE_STATS = {'hit_ratio', 'memory_entries', 'queued', 'running', 'entries', 'bytes', 'processes', 'in_flight'}
 
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(tmpdir)
-
-        results = {'files': []}
-        for root, _, files in os.walk(tmpdir):
-            for name in files:
-                file_path = os.path.join(root, name)
-                if file_path == zip_path:
-                    continue
-                mime_type, _ = mimetypes.guess_type(file_path)
-                if not mime_type or not mime_type.startswith('image/'):
-                    continue
-                    
-                analysis_data = detector.analyze_image(file_path)
-                
-                try:
-                    with open(file_path, 'rb') as image_file:
-                        image_data = base64.b64encode(image_file.read()).decode('utf-8')
-                        analysis_data['image_data'] = image_data
-                        analysis_data['mime_type'] = mime_type
-                except Exception as e:
-                    print(f"error reading or encoding image {name}: {e}")
-                    analysis_data['image_data'] = None
-                    analysis_data['mime_type'] = None
-
-                # Add LSB pic to the analysis data
-                try:
-                    lsb_pic = create_lsb_pic(tmpdir, file_path)
-                    analysis_data['lsbpic'] = lsb_pic
-                except Exception as e:
-                    print(f"error creating LSB pic for image {name}: {e}")
-                    analysis_data['lsbpic'] = None
-
-                results['files'].append({name: analysis_data})
-
-        return jsonify(results)
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    sources = [('steg_jobs', job_queue), ('steg_preview', preview_store)]
+    if result_cache is not None:
+        sources.append(('steg_cache', result_cache))
+    if analysis_pool is not None:
+        sources.append(('steg_pool', analysis_pool))
+    gauges, counters = {}, {}
+    for prefix, source in sources:
+        for name, value in source.stats().items():
+            if name in GAUGE_STATS:
+                gauges[f'{prefix}_{name}'] = value
+            else:
+                counters[f'{prefix}_{name}_total'] = value
+    return Response(metrics.render(gauges, counters), mimetype='text/plain; version=0.0.4')
 
+@app.route('/cachestats', methods=['GET'])
+def cache_stats():
+    if result_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **result_cache.stats()})
 
 @app.route('/')
 def index():
     return "Steganography Detection API is running."
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Development server; set FLASK_DEBUG=1 for the debugger and reloader.
+    # Serve production traffic with gunicorn -c gunicorn.conf.py app:app
+    app.run()
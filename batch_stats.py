@@ -0,0 +1,105 @@
+import numpy as np
+import cv2
+
+from chi_square import EXACT_HISTOGRAM_PIXELS, channel_histograms
+
+# Images per calcHist call; the image index is stored as a uint8
+HISTOGRAM_BATCH = 256
+
+
+def stack_histograms(stack):
+    """
+    Compute the 256-bin histogram of every channel of every image in a stack.
+
+    Each channel of up to HISTOGRAM_BATCH images is counted by a single
+    two-dimensional calcHist over (image index, value) pairs.
+
+    Args:
+        stack: uint8 array of shape (n_images, height, width, n_channels)
+
+    Returns:
+        np.ndarray: int64 array of shape (n_images, n_channels, 256)
+    """
+    n, height, width, channels = stack.shape
+    if height * width >= EXACT_HISTOGRAM_PIXELS:
+        return np.stack([channel_histograms(image) for image in stack])
+
+    hists = []
+    for start in range(0, n, HISTOGRAM_BATCH):
+        part = stack[start:start + HISTOGRAM_BATCH]
+        count = part.shape[0]
+        pairs = np.empty((count, height * width, 2), dtype=np.uint8)
+        pairs[:, :, 0] = np.arange(count, dtype=np.uint8)[:, np.newaxis]
+        part_hists = np.empty((count, channels, 256), dtype=np.int64)
+        for channel in range(channels):
+            pairs[:, :, 1] = part[..., channel].reshape(count, -1)
+            part_hists[:, channel] = cv2.calcHist([pairs.reshape(-1, 1, 2)], [0, 1], None,
+                                                  [count, 256], [0, count, 0, 256])
+        hists.append(part_hists)
+    return np.concatenate(hists)
+
+
+def _channel_sums(planes):
+    """Exact per-image, per-channel sums of a uint8 stack, as uint64."""
+    n, channels = planes.shape[0], planes.shape[-1]
+    sums = cv2.reduce(planes.reshape(n, -1, channels), 1, cv2.REDUCE_SUM, dtype=cv2.CV_64F)
+    return sums.reshape(n, channels).astype(np.uint64)
+
+
+def histogram_features(hists):
+    """
+    Comb, peak and even/odd statistics of 256-bin histograms.
+
+    Uses the same integer comparisons as a bin-by-bin scan, for any number
+    of histograms at once.
+
+    Args:
+        hists: int64 array of shape (..., 256)
+
+    Returns:
+        tuple: (comb_scores, unusual_peaks, even_odd_ratios), arrays of shape (...)
+    """
+    # Odd bins noticeably lower than both even neighbours ("comb" pattern)
+    before, middle, after = hists[..., 0:253:2], hists[..., 1:254:2], hists[..., 2:255:2]
+    comb = (before > 0) & (after > 0) & (middle < (before + after) / 4)
+    # Bins standing well above their neighbours
+    peaks = hists[..., 1:255] > 3 * (hists[..., 0:254] + hists[..., 2:256]) / 2
+    even_sum = hists[..., 0::2].sum(axis=-1)
+    odd_sum = hists[..., 1::2].sum(axis=-1)
+    total = even_sum + odd_sum
+    with np.errstate(divide="ignore", invalid="ignore"):
+        even_odd_ratios = np.where(total > 0, np.abs(even_sum - odd_sum) / total, 0)
+    return comb.sum(axis=-1), peaks.sum(axis=-1), even_odd_ratios
+
+
+def stack_lsb_counts(stack):
+    """
+    Count LSB transitions and set bits per channel for every image in a stack.
+
+    A transition is a pair of horizontal or vertical neighbours whose LSBs
+    differ, as detect_lsb counts them for a single image.
+
+    Args:
+        stack: uint8 array of shape (n_images, height, width, 3)
+
+    Returns:
+        tuple: (transitions, ones), uint64 arrays of shape (n_images, 3)
+    """
+    lsb = stack & 1
+    transitions = (_channel_sums(lsb[:, :, 1:] ^ lsb[:, :, :-1])
+                   + _channel_sums(lsb[:, 1:] ^ lsb[:, :-1]))
+    return transitions, _channel_sums(lsb)
+
+
+def stack_ycrcb(stack):
+    """
+    Convert a stack of RGB images to YCrCb in one call.
+
+    Args:
+        stack: uint8 array of shape (n_images, height, width, 3)
+
+    Returns:
+        np.ndarray: YCrCb stack of the same shape
+    """
+    n, height, width, _ = stack.shape
+    return cv2.cvtColor(stack.reshape(n * height, width, 3), cv2.COLOR_RGB2YCrCb).reshape(stack.shape)
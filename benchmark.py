@@ -0,0 +1,353 @@
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+import zipfile
+
+import numpy as np
+import cv2
+from PIL import Image
+
+from corpus import cover_image, embed_lsb, image_shape
+from image_context import ImageContext
+from steg_detector import DETECTION_METHODS, SteganographyDetector, resolve_methods
+
+# Image formats of the detector suite: encoder extension and channel count
+FORMATS = {
+    "png": (".png", 3),
+    "jpeg": (".jpg", 3),
+    "gray": (".png", 1),
+    "rgba": (".png", 4),
+}
+
+# Metrics compared against a baseline, by the direction that counts as better;
+# the others (min_s, p99_s, mp_per_s, ...) are reported only
+LOWER_IS_BETTER = ("median_s", "p50_s")
+HIGHER_IS_BETTER = ("images_per_s", "analyze_image_per_s", "analyze_batch_per_s")
+# Changes smaller than this many seconds are never reported as regressions
+MIN_REGRESSION_SECONDS = 0.001
+
+
+def synthetic_thumbnails(count, size=64, seed=0):
+    """
+    Encode smooth, noisy thumbnails as PNG bytes.
+
+    Args:
+        count: Number of images
+        size: Width and height in pixels
+        seed: Random seed
+
+    Returns:
+        list: PNG-encoded images
+    """
+    rng = np.random.default_rng(seed)
+    gradient = np.add.outer(np.arange(size), np.arange(size)) * (255 / (2 * size))
+    images = []
+    for _ in range(count):
+        pixels = gradient[:, :, np.newaxis] + rng.normal(0, 8, (size, size, 3))
+        buffer = io.BytesIO()
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, "PNG")
+        images.append(buffer.getvalue())
+    return images
+
+
+def synthetic_image(megapixels, fmt="png", payload_rate=0.0, seed=0):
+    """
+    Encode a photo-like corpus cover carrying random LSB payload.
+
+    Args:
+        megapixels: Pixel count in millions; the image is 4:3
+        fmt: One of FORMATS
+        payload_rate: Fraction of the colour samples whose LSB is replaced
+            by a random bit (the alpha channel is left alone)
+        seed: Random seed
+
+    Returns:
+        bytes: The encoded image
+    """
+    extension, channels = FORMATS[fmt]
+    width, height = image_shape(megapixels)
+    rng = np.random.default_rng(seed)
+
+    pixels = cover_image("photo", width, height, rng)
+    if payload_rate > 0:
+        embed_lsb(pixels, payload_rate, rng, ordering="random")
+    if channels == 4:
+        pixels = np.dstack([pixels, np.full((height, width), 255, dtype=np.uint8)])
+    elif channels == 1:
+        pixels = pixels[:, :, 0]
+
+    params = [cv2.IMWRITE_JPEG_QUALITY, 90] if extension == ".jpg" else [cv2.IMWRITE_PNG_COMPRESSION, 1]
+    ok, encoded = cv2.imencode(extension, pixels, params)
+    if not ok:
+        raise ValueError(f"could not encode a {fmt} image")
+    return encoded.tobytes()
+
+
+def _timings(run, repeat, setup=None):
+    """Seconds taken by run(setup()) over repeat runs; setup is not timed."""
+    times = []
+    for _ in range(repeat):
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        run(argument)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _summary(times, megapixels=None):
+    median = float(np.median(times))
+    summary = {"median_s": median, "min_s": min(times)}
+    if megapixels:
+        summary["mp_per_s"] = megapixels / median
+    return summary
+
+
+def benchmark_batch(count=2000, size=64, methods=None, repeat=3):
+    """
+    Compare analyze_batch with calling analyze_image in a loop.
+
+    Args:
+        count: Number of thumbnails
+        size: Width and height of the thumbnails
+        methods: Methods to run (defaults to DEFAULT_METHODS)
+        repeat: Runs of each mode; the fastest is reported
+
+    Returns:
+        dict: Images per second of both modes and the speed-up
+    """
+    images = synthetic_thumbnails(count, size)
+    detector = SteganographyDetector()
+
+    def best(run):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    loop = best(lambda: [detector.analyze_image(image, methods=methods) for image in images])
+    batch = best(lambda: detector.analyze_batch(images, methods=methods))
+    return {
+        "images": count,
+        "size": size,
+        "analyze_image_per_s": count / loop,
+        "analyze_batch_per_s": count / batch,
+        "speedup": loop / batch,
+    }
+
+
+def benchmark_detectors(sizes=(0.1, 1), formats=tuple(FORMATS), rates=(0.0, 0.5), methods=None, repeat=3):
+    """
+    Time analyze_image end to end and every detection method on its own.
+
+    Each method runs on a freshly decoded image, so the time includes the
+    views it derives (YCrCb, DCT coefficients, ...) but not the decode.
+
+    Args:
+        sizes: Image sizes in megapixels
+        formats: Names from FORMATS
+        rates: LSB payload rates
+        methods: Methods to time (defaults to DEFAULT_METHODS)
+        repeat: Runs of each measurement
+
+    Returns:
+        dict: Timings keyed "analyze_image/<format>/<size>mp/rate<rate>"
+        and "method/<method>/<format>/<size>mp/rate<rate>"
+    """
+    methods = resolve_methods(methods)
+    detector = SteganographyDetector()
+    # Keep the lazy imports out of the first measurement
+    detector.warm_up()
+    results = {}
+    for megapixels in sizes:
+        for fmt in formats:
+            for rate in rates:
+                data = synthetic_image(megapixels, fmt, rate)
+                case = f"{fmt}/{megapixels:g}mp/rate{rate:g}"
+
+                def decoded():
+                    context = ImageContext(data)
+                    context.pixels
+                    return context
+
+                times = _timings(lambda _: detector.analyze_image(data, methods=methods), repeat)
+                results[f"analyze_image/{case}"] = _summary(times, megapixels)
+                for method in methods:
+                    run = getattr(detector, DETECTION_METHODS[method])
+                    results[f"method/{method}/{case}"] = _summary(_timings(run, repeat, setup=decoded), megapixels)
+    return results
+
+
+def _latency_summary(latencies, items_per_request=1):
+    return {
+        "requests": len(latencies),
+        "p50_s": float(np.percentile(latencies, 50)),
+        "p99_s": float(np.percentile(latencies, 99)),
+        "images_per_s": len(latencies) * items_per_request / sum(latencies),
+    }
+
+
+def benchmark_endpoints(requests=50, megapixels=0.25, zip_requests=5, zip_images=20, zip_megapixels=0.1):
+    """
+    Measure /analyze and /analyzezip latency and throughput through the Flask test client.
+
+    Every request sends different images and the result cache is turned
+    off, so nothing is served from memory. Requests are sent one at a time
+    after a warm-up request.
+
+    Args:
+        requests: Number of /analyze requests
+        megapixels: Size of their images
+        zip_requests: Number of /analyzezip requests
+        zip_images: Images per archive
+        zip_megapixels: Size of the archived images
+
+    Returns:
+        dict: p50 and p99 latency and images per second, keyed
+        "endpoint/analyze" and "endpoint/analyzezip"
+    """
+    import app as server
+
+    server.detector.cache = None
+    client = server.app.test_client()
+
+    def post(path, field, name, data):
+        start = time.perf_counter()
+        response = client.post(path, data={field: (io.BytesIO(data), name)})
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} answered {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return elapsed
+
+    def archive(seed):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zf:
+            for i in range(zip_images):
+                zf.writestr(f"{i}.png", synthetic_image(zip_megapixels, "png", 0.5 * (i % 2), seed=seed * zip_images + i))
+        return buffer.getvalue()
+
+    images = [synthetic_image(megapixels, "png", 0.5 * (i % 2), seed=i) for i in range(requests + 1)]
+    post("/analyze", "image", "warm-up.png", images[0])
+    analyze = [post("/analyze", "image", f"{i}.png", data) for i, data in enumerate(images[1:])]
+
+    archives = [archive(seed) for seed in range(zip_requests + 1)]
+    post("/analyzezip", "zip", "warm-up.zip", archives[0])
+    analyze_zip = [post("/analyzezip", "zip", f"{i}.zip", data) for i, data in enumerate(archives[1:])]
+    return {
+        "endpoint/analyze": _latency_summary(analyze),
+        "endpoint/analyzezip": _latency_summary(analyze_zip, zip_images),
+    }
+
+
+def environment():
+    """Versions and hardware the numbers were measured on."""
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def compare(results, baseline, threshold=0.25):
+    """
+    Find the measurements that got worse than the baseline by more than threshold.
+
+    Times (LOWER_IS_BETTER) regress when they grow, throughputs
+    (HIGHER_IS_BETTER) when they shrink. Measurements missing from either side are skipped, and
+    changes under MIN_REGRESSION_SECONDS are ignored as noise.
+
+    Args:
+        results: "results" of a benchmark report
+        baseline: "results" of the baseline report
+        threshold: Allowed relative change, e.g. 0.25 for 25%
+
+    Returns:
+        list: One dict per regression with the key, metric, both values
+        and the relative change
+    """
+    regressions = []
+    for key, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(key, {}).get(metric)
+            if base is None or not base:
+                continue
+            if metric in LOWER_IS_BETTER:
+                change = value / base - 1
+                worse = change > threshold and value - base > MIN_REGRESSION_SECONDS
+            elif metric in HIGHER_IS_BETTER:
+                change = value / base - 1
+                worse = change < -threshold and 1 / value - 1 / base > MIN_REGRESSION_SECONDS
+            else:
+                continue
+            if worse:
+                regressions.append({"key": key, "metric": metric, "baseline": base, "current": value, "change": change})
+    return regressions
+
+
+def _floats(value):
+    return [float(part) for part in value.split(",") if part]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the detectors and endpoints, optionally against a baseline report.")
+    parser.add_argument("--suite", default="batch",
+                        help="Comma-separated suites: batch, detectors, endpoints, or all (default batch)")
+    parser.add_argument("--count", type=int, default=2000, help="Thumbnails in the batch suite")
+    parser.add_argument("--size", type=int, default=64, help="Thumbnail side in the batch suite")
+    parser.add_argument("--methods", help="Comma-separated detection methods")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--sizes", type=_floats, default=[0.1, 1], help="Megapixels of the detector suite, e.g. 0.1,1,10,100")
+    parser.add_argument("--formats", default=",".join(FORMATS), help="Formats of the detector suite")
+    parser.add_argument("--rates", type=_floats, default=[0, 0.5], help="LSB payload rates of the detector suite")
+    parser.add_argument("--requests", type=int, default=50, help="/analyze requests in the endpoint suite")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--baseline", help="Report to compare with; exits with status 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative slow-down (default 0.25)")
+    args = parser.parse_args(argv)
+
+    suites = {"batch", "detectors", "endpoints"} if args.suite == "all" else set(args.suite.split(","))
+    unknown = suites - {"batch", "detectors", "endpoints"}
+    if unknown:
+        parser.error(f"unknown suite: {', '.join(sorted(unknown))}")
+    formats = args.formats.split(",")
+    if set(formats) - set(FORMATS):
+        parser.error(f"formats must be among {', '.join(FORMATS)}")
+
+    results = {}
+    if "batch" in suites:
+        batch = benchmark_batch(args.count, args.size, args.methods, args.repeat)
+        results[f"batch/{args.size}px"] = {name: batch[name] for name in ("analyze_image_per_s", "analyze_batch_per_s", "speedup")}
+    if "detectors" in suites:
+        results.update(benchmark_detectors(args.sizes, formats, args.rates, args.methods, args.repeat))
+    if "endpoints" in suites:
+        results.update(benchmark_endpoints(args.requests))
+
+    report = {"environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['key']} {regression['metric']}: {regression['baseline']:.4g} -> "
+                  f"{regression['current']:.4g} ({regression['change']:+.0%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import base64
+import io
+
+import numpy as np
+import cv2
+from PIL import Image
+
+from chi_square import pair_p_values
+
+# Bit b of every byte value: BIT_TABLE[v, b]
+BIT_TABLE = (np.arange(256)[:, np.newaxis] >> np.arange(8)) & 1
+
+
+def bitplane_statistics(value_hists, xor_hists, height, width):
+    """
+    Per-plane statistics for all eight bit planes of every channel.
+
+    Args:
+        value_hists: int64 array of shape (channels, 256) of pixel values
+        xor_hists: int64 array of shape (channels, 256) of neighbour XORs
+        height: Image height
+        width: Image width
+
+    Returns:
+        dict: Arrays of shape (channels, 8), indexed by bit (0 = LSB):
+        "randomness" (transitions over the maximum possible, 0.5 for
+        random bits), "ones_ratio" and "p_value", the chi-square attack
+        p-value of the pairs (v, v ^ 2**b); a p-value close to 1 means
+        the plane's pairs are equalised as by embedding in that plane
+    """
+    max_transitions = 2 * height * width - height - width
+    transitions = xor_hists @ BIT_TABLE
+    ones = value_hists @ BIT_TABLE
+
+    # For plane b, pair every value having bit b clear with its partner
+    values = np.arange(256)
+    p_values = np.empty(transitions.shape)
+    for bit in range(8):
+        low = values[BIT_TABLE[:, bit] == 0]
+        pairs = np.stack([value_hists[:, low], value_hists[:, low | (1 << bit)]], axis=-1)
+        p_values[:, bit] = pair_p_values(pairs)
+
+    return {
+        "randomness": transitions / max_transitions if max_transitions > 0 else np.zeros(transitions.shape),
+        "ones_ratio": ones / (height * width) if height * width else np.zeros(ones.shape),
+        "p_value": p_values,
+    }
+
+
+def bitplane_preview(channel, bit):
+    """
+    Encode one bit plane of a channel as a 1-bit PNG.
+
+    Args:
+        channel: uint8 array of shape (height, width)
+        bit: Bit plane to show (0 = LSB)
+
+    Returns:
+        str: Base64-encoded PNG with set bits in white
+    """
+    bits = cv2.compare(cv2.bitwise_and(channel, 1 << bit), 0, cv2.CMP_NE)
+    # Eight pixels per byte, which is the layout of a mode "1" image
+    packed = np.packbits(bits, axis=1)
+    image = Image.frombytes("1", (channel.shape[1], channel.shape[0]), packed.tobytes())
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
@@ -0,0 +1,143 @@
+import numpy as np
+import cv2
+
+
+# calcHist counts in float32, which is exact below 2**24
+EXACT_HISTOGRAM_PIXELS = 1 << 24
+
+
+def chi2_sf(statistic, dof):
+    """
+    Survival function of the chi-square distribution, as scipy.stats.chi2.sf.
+
+    scipy takes a third of a second to import, so it is loaded on the first
+    p-value rather than with the module.
+    """
+    from scipy.special import chdtrc
+    return chdtrc(dof, statistic)
+
+
+def channel_histograms(channels):
+    """
+    Compute 256-bin histograms for several uint8 channels in one pass.
+
+    Args:
+        channels: uint8 array of shape (height, width[, n_channels])
+
+    Returns:
+        np.ndarray: int64 array of shape (n_channels, 256)
+    """
+    if channels.ndim == 2:
+        channels = channels[:, :, np.newaxis]
+    # Large images are counted in row blocks small enough for exact counts
+    rows = max(1, (EXACT_HISTOGRAM_PIXELS - 1) // channels.shape[1])
+    total = np.zeros((channels.shape[-1], 256), dtype=np.int64)
+    for top in range(0, channels.shape[0], rows):
+        block = channels[top:top + rows]
+        # calcHist walks the interleaved buffer directly, without the int64
+        # index copy np.bincount would need
+        for i in range(channels.shape[-1]):
+            total[i] += cv2.calcHist([block], [i], None, [256], [0, 256]).ravel().astype(np.int64)
+    return total
+
+
+def pair_chi_square(hist):
+    """
+    Normalised pairs-of-values chi-square statistic for each histogram.
+
+    Args:
+        hist: Array of shape (..., 256) of value counts
+
+    Returns:
+        np.ndarray: Statistic of shape (...), averaged over the 256 bins
+    """
+    pairs = hist.reshape(hist.shape[:-1] + (128, 2)).astype(np.float64)
+    expected = pairs.sum(axis=-1, keepdims=True) / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(expected > 0, (pairs - expected) ** 2 / expected, 0.0)
+    return terms.sum(axis=(-2, -1)) / 256
+
+
+def westfeld_p_values(hist, min_expected=5):
+    """
+    Westfeld-Pfitzmann chi-square attack p-values for a stack of histograms.
+
+    A p-value close to 1 means the pairs of values (2i, 2i+1) are
+    equalised, which is what sequential LSB embedding does.
+
+    Args:
+        hist: Array of shape (..., 256) of value counts
+        min_expected: Minimum expected count for a pair to be included
+
+    Returns:
+        np.ndarray: p-values of shape (...); NaN where no pair qualifies
+    """
+    return pair_p_values(hist.reshape(hist.shape[:-1] + (128, 2)), min_expected)
+
+
+def pair_p_values(pairs, min_expected=5):
+    """
+    Westfeld-Pfitzmann p-values for explicitly paired counts.
+
+    Args:
+        pairs: Array of shape (..., n_pairs, 2) holding the counts of the
+            two values of each pair
+        min_expected: Minimum expected count for a pair to be included
+
+    Returns:
+        np.ndarray: p-values of shape (...); NaN where no pair qualifies
+    """
+    pairs = np.asarray(pairs, dtype=np.float64)
+    expected = pairs.sum(axis=-1) / 2
+    valid = expected >= min_expected
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(valid, (pairs[..., 0] - expected) ** 2 / expected, 0.0)
+    statistic = terms.sum(axis=-1)
+    dof = valid.sum(axis=-1) - 1
+    p_values = np.full(statistic.shape, np.nan)
+    usable = dof > 0
+    p_values[usable] = chi2_sf(statistic[usable], dof[usable])
+    return p_values
+
+
+def progressive_chi_square(samples, steps=100, p_threshold=0.5, min_expected=5):
+    """
+    Run the chi-square attack on increasing prefixes of the sample stream.
+
+    The prefix histograms are accumulated block by block, so the whole
+    curve costs a single pass over the samples.
+
+    Args:
+        samples: uint8 array of samples in embedding order
+        steps: Number of prefixes to evaluate
+        p_threshold: p-value above which a prefix is considered embedded
+        min_expected: Minimum expected count for a pair to be included
+
+    Returns:
+        dict: Prefix sizes, p-value curve and embedded length estimate
+    """
+    samples = samples.reshape(-1)
+    total = samples.size
+    steps = max(1, min(steps, total))
+    bounds = np.linspace(0, total, steps + 1).astype(np.int64)
+
+    prefix_hist = np.empty((steps, 256), dtype=np.int64)
+    running = np.zeros(256, dtype=np.int64)
+    for i in range(steps):
+        running += np.bincount(samples[bounds[i]:bounds[i + 1]], minlength=256)
+        prefix_hist[i] = running
+
+    p_values = westfeld_p_values(prefix_hist, min_expected)
+
+    # The embedded region is the leading run of prefixes with a high p-value
+    embedded = np.nan_to_num(p_values, nan=0.0) > p_threshold
+    run = int(np.argmin(embedded)) if not embedded.all() else steps
+    estimated_bits = int(bounds[run])
+
+    return {
+        "prefix_sizes": bounds[1:].tolist(),
+        "p_values": np.nan_to_num(p_values, nan=0.0).tolist(),
+        "estimated_length_bits": estimated_bits,
+        "estimated_length_bytes": estimated_bits // 8,
+        "embedding_rate": estimated_bits / total if total else 0.0,
+    }
@@ -0,0 +1,327 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import cv2
+import numpy as np
+
+# Kinds of synthetic cover images
+COVERS = ("gradient", "pattern", "photo", "texture")
+
+# Embedding orderings: a prefix of the samples, or samples scattered over the image
+ORDERINGS = ("sequential", "random")
+
+MANIFEST = "manifest.jsonl"
+
+
+def image_shape(megapixels):
+    """Width and height of a 4:3 image of the given size."""
+    width = max(1, round((megapixels * 1e6 * 4 / 3) ** 0.5))
+    height = max(1, round(megapixels * 1e6 / width))
+    return width, height
+
+
+def _upscale(grid, width, height, interpolation):
+    return cv2.resize(grid, (width, height), interpolation=interpolation).reshape(height, width, grid.shape[2])
+
+
+def add_noise(pixels, amplitude, rng):
+    """Add uniform noise in [-amplitude, amplitude] to uint8 pixels, saturating."""
+    if amplitude <= 0:
+        return pixels
+    noise = rng.integers(0, 2 * amplitude + 1, pixels.shape, dtype=np.uint8)
+    return cv2.subtract(cv2.add(pixels, noise), amplitude).reshape(pixels.shape)
+
+
+def cover_image(kind, width, height, rng, channels=3):
+    """
+    Build a synthetic cover image.
+
+    Everything is built in uint8 with whole-array operations, so even
+    100 MP covers take a second or two and a few times their own size
+    in memory.
+
+    Args:
+        kind: One of COVERS: a smooth "gradient", a two-colour "pattern"
+            of squares, a "photo" of smooth shapes with sensor noise, or a
+            noisy, detailed "texture"
+        width: Width in pixels
+        height: Height in pixels
+        rng: numpy Generator
+        channels: Number of colour channels
+
+    Returns:
+        np.ndarray: Pixels of shape (height, width, channels)
+    """
+    if kind == "gradient":
+        corners = rng.integers(0, 256, (2, 2, channels), dtype=np.uint8)
+        return _upscale(corners, width, height, cv2.INTER_LINEAR)
+    if kind == "pattern":
+        colours = rng.integers(0, 256, (2, channels), dtype=np.uint8)
+        cell = int(rng.integers(4, max(5, min(width, height) // 4)))
+        rows = (np.arange(height) // cell % 2).astype(np.uint8)
+        columns = (np.arange(width) // cell % 2).astype(np.uint8)
+        return colours[rows[:, np.newaxis] ^ columns]
+    if kind == "photo":
+        grid = rng.integers(0, 256, (6, 8, channels), dtype=np.uint8)
+        return add_noise(_upscale(grid, width, height, cv2.INTER_CUBIC), int(rng.integers(1, 6)), rng)
+    if kind == "texture":
+        grid = rng.integers(0, 256, (48, 64, channels), dtype=np.uint8)
+        return add_noise(_upscale(grid, width, height, cv2.INTER_CUBIC), int(rng.integers(6, 16)), rng)
+    raise ValueError(f"Unknown cover kind: {kind}")
+
+
+def jpeg_roundtrip(pixels, quality):
+    """Compress RGB pixels as JPEG at the given quality and decode them again."""
+    ok, encoded = cv2.imencode(".jpg", cv2.cvtColor(pixels, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("could not encode a JPEG image")
+    return cv2.cvtColor(cv2.imdecode(encoded, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+
+
+def embed_lsb(pixels, payload_rate, rng, bit_plane=0, channels="RGB", ordering="sequential"):
+    """
+    Replace one bit plane of some samples with random payload bits.
+
+    Args:
+        pixels: RGB uint8 pixels, modified in place
+        payload_rate: Fraction of the selected samples that carry payload
+        rng: numpy Generator
+        bit_plane: Bit replaced, 0 for the LSB
+        channels: Channels embedded into, as letters of "RGB"
+        ordering: "sequential" fills the samples in raster order, channel
+            by channel within a pixel, like most LSB tools; "random"
+            scatters the payload, each sample carrying with probability
+            payload_rate
+
+    Returns:
+        int: Number of samples that carry payload
+    """
+    indices = ["RGB".index(channel) for channel in channels]
+    whole = indices == list(range(pixels.shape[2])) and pixels.flags.c_contiguous
+    samples = pixels.reshape(-1) if whole else pixels[:, :, indices].reshape(-1)
+    if ordering == "sequential":
+        carried = round(payload_rate * samples.size)
+        target, carriers = samples[:carried], None
+    elif ordering == "random":
+        target = samples
+        # 16-bit draws keep the mask cheap for very large images
+        carriers = rng.integers(0, 1 << 16, samples.size, dtype=np.uint16) < round(payload_rate * (1 << 16))
+        carried = int(np.count_nonzero(carriers))
+    else:
+        raise ValueError(f"Unknown ordering: {ordering}")
+
+    # Flip the bit wherever it differs from the payload; masks instead of
+    # fancy indexing keep this a few linear passes over the samples
+    bits = np.unpackbits(np.frombuffer(rng.bytes((target.size + 7) // 8), dtype=np.uint8))[:target.size]
+    changes = np.bitwise_xor(target, bits << bit_plane)
+    changes &= np.uint8(1 << bit_plane)
+    if carriers is not None:
+        changes &= carriers.view(np.uint8) << bit_plane
+    target ^= changes
+    if not whole:
+        pixels[:, :, indices] = samples.reshape(pixels.shape[0], pixels.shape[1], len(indices))
+    return carried
+
+
+def write_png(path, pixels):
+    """Write RGB pixels as a PNG file."""
+    if not cv2.imwrite(path, cv2.cvtColor(pixels, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_PNG_COMPRESSION, 1]):
+        raise OSError(f"could not write {path}")
+
+
+def corpus_plan(count, sizes=(0.1,), covers=COVERS, rates=(0.1, 0.5, 1.0), planes=(0,), channel_sets=("RGB",),
+                orderings=ORDERINGS, jpeg_qualities=(None,), seed=0):
+    """
+    Describe the cover/stego pairs of a corpus.
+
+    The embedding variants (rate, plane, channels, ordering) are cycled
+    through so that each gets the same number of pairs; cover kind, size
+    and JPEG quality are drawn at random.
+
+    Args:
+        count: Number of pairs; the corpus has twice as many images
+        sizes: Image sizes in megapixels
+        covers: Kinds of cover from COVERS
+        rates: Payload rates
+        planes: Bit planes embedded into
+        channel_sets: Channel selections such as "RGB" or "B"
+        orderings: Names from ORDERINGS
+        jpeg_qualities: Qualities at which the cover is JPEG-compressed
+            before embedding, None for an uncompressed cover
+        seed: Random seed; the same seed gives the same corpus
+
+    Returns:
+        list: One dict per pair, as taken by generate_pair
+    """
+    variants = list(product(rates, planes, channel_sets, orderings))
+    rng = np.random.default_rng(seed)
+    plan = []
+    for index in range(count):
+        rate, plane, channels, ordering = variants[index % len(variants)]
+        width, height = image_shape(sizes[rng.integers(len(sizes))])
+        plan.append({
+            "index": index,
+            "seed": [seed, index],
+            "cover": covers[rng.integers(len(covers))],
+            "width": width,
+            "height": height,
+            "jpeg_quality": jpeg_qualities[rng.integers(len(jpeg_qualities))],
+            "payload_rate": rate,
+            "bit_plane": plane,
+            "channels": channels,
+            "ordering": ordering,
+        })
+    return plan
+
+
+def generate_pair(spec, output_dir):
+    """
+    Write the clean and stego image of one pair.
+
+    Args:
+        spec: Pair description from corpus_plan
+        output_dir: Corpus directory, with "clean" and "steg" subdirectories
+
+    Returns:
+        list: Manifest records of the clean and the stego image
+    """
+    rng = np.random.default_rng(spec["seed"])
+    pixels = cover_image(spec["cover"], spec["width"], spec["height"], rng)
+    if spec["jpeg_quality"] is not None:
+        pixels = jpeg_roundtrip(pixels, spec["jpeg_quality"])
+
+    name = f"{spec['index']:07d}.png"
+    clean_path = os.path.join("clean", name)
+    write_png(os.path.join(output_dir, clean_path), pixels)
+
+    carried = embed_lsb(pixels, spec["payload_rate"], rng, spec["bit_plane"], spec["channels"], spec["ordering"])
+    steg_path = os.path.join("steg", name)
+    write_png(os.path.join(output_dir, steg_path), pixels)
+
+    common = {key: spec[key] for key in ("index", "cover", "width", "height", "jpeg_quality")}
+    embedding = {key: spec[key] for key in ("payload_rate", "bit_plane", "channels", "ordering")}
+    return [
+        {"path": clean_path, "label": 0, **common},
+        {"path": steg_path, "label": 1, **common, **embedding,
+         "embedded_fraction": carried / (spec["width"] * spec["height"] * 3)},
+    ]
+
+
+def generate_corpus(output_dir, plan, workers=None):
+    """
+    Write the images of a plan in parallel, with a manifest.
+
+    Args:
+        output_dir: Directory to write to; manifest.jsonl lists every image
+            with its label (1 for stego) and how it was made
+        plan: Pair descriptions from corpus_plan
+        workers: Worker processes (defaults to the CPU count, 0 generates
+            in this process)
+
+    Returns:
+        int: Number of images written
+    """
+    for subdirectory in ("clean", "steg"):
+        os.makedirs(os.path.join(output_dir, subdirectory), exist_ok=True)
+    workers = os.cpu_count() if workers is None else workers
+
+    written = 0
+    with open(os.path.join(output_dir, MANIFEST), "w", encoding="utf-8") as manifest:
+        if workers == 0:
+            pairs = (generate_pair(spec, output_dir) for spec in plan)
+            for records in pairs:
+                written += _write_records(manifest, records)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                chunksize = max(1, len(plan) // (8 * workers))
+                outputs = [output_dir] * len(plan)
+                for records in executor.map(generate_pair, plan, outputs, chunksize=chunksize):
+                    written += _write_records(manifest, records)
+    return written
+
+
+def _write_records(manifest, records):
+    for record in records:
+        manifest.write(json.dumps(record) + "\n")
+    return len(records)
+
+
+def read_manifest(corpus_dir):
+    """
+    Load the records of a corpus, with paths made absolute.
+
+    Args:
+        corpus_dir: Directory written by generate_corpus
+
+    Returns:
+        list: Manifest records
+    """
+    records = []
+    with open(os.path.join(corpus_dir, MANIFEST), encoding="utf-8") as manifest:
+        for line in manifest:
+            if line.strip():
+                record = json.loads(line)
+                record["path"] = os.path.join(corpus_dir, record["path"])
+                records.append(record)
+    return records
+
+
+def _list(convert):
+    return lambda value: tuple(convert(item) for item in value.split(",") if item.strip())
+
+
+def _quality(value):
+    return None if value.strip().lower() == "none" else int(value)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a labelled corpus of clean and LSB-stego images.")
+    parser.add_argument("output", help="Directory to write the corpus to")
+    parser.add_argument("-n", "--count", type=int, default=500, help="Cover/stego pairs")
+    parser.add_argument("--sizes", type=_list(float), default=(0.1,), help="Image sizes in megapixels, e.g. 0.1,1,12")
+    parser.add_argument("--covers", type=_list(str), default=COVERS, help=f"Cover kinds from {','.join(COVERS)}")
+    parser.add_argument("--rates", type=_list(float), default=(0.05, 0.1, 0.25, 0.5, 1.0), help="Payload rates")
+    parser.add_argument("--planes", type=_list(int), default=(0,), help="Bit planes to embed into (0 is the LSB)")
+    parser.add_argument("--channels", type=_list(str), default=("RGB",),
+                        help="Channel selections to embed into, e.g. RGB,B,G")
+    parser.add_argument("--orderings", type=_list(str), default=ORDERINGS, help="sequential and/or random")
+    parser.add_argument("--jpeg-qualities", type=_list(_quality), default=(None,),
+                        help="Qualities at which covers are JPEG-compressed before embedding, e.g. none,90,75")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                        help="Worker processes (0 generates in this process)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    for cover in args.covers:
+        if cover not in COVERS:
+            parser.error(f"unknown cover kind: {cover}")
+    for ordering in args.orderings:
+        if ordering not in ORDERINGS:
+            parser.error(f"unknown ordering: {ordering}")
+    for channels in args.channels:
+        if not channels or set(channels) - set("RGB"):
+            parser.error(f"channels must be letters of RGB: {channels}")
+    for plane in args.planes:
+        if not 0 <= plane < 8:
+            parser.error(f"bit planes range from 0 to 7: {plane}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    plan = corpus_plan(args.count, args.sizes, args.covers, args.rates, args.planes, args.channels,
+                       args.orderings, args.jpeg_qualities, args.seed)
+    start = time.perf_counter()
+    written = generate_corpus(args.output, plan, args.workers)
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(f"wrote {written} images to {args.output} in {elapsed:.1f} s ({written / elapsed:.1f} images/s)",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
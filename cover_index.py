@@ -0,0 +1,474 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+import numpy as np
+import cv2
+
+from bitplanes import BIT_TABLE
+from chi_square import channel_histograms
+from image_context import ImageContext
+
+# Side of the grey image the perceptual hash is computed from, and of the
+# block of low DCT frequencies it keeps (64 bits)
+HASH_SOURCE_SIDE = 32
+HASH_SIDE = 8
+# A frequency only sets its hash bit when it exceeds the median by this
+# much; in smooth images most frequencies sit at the median, and without a
+# margin the noise of LSB embedding would flip their bits at random
+HASH_MARGIN = 2.0
+# Side of the grey thumbnail stored to confirm a hash match
+THUMBNAIL_SIDE = 16
+# Multi-index hashing: the 64-bit hash is split into this many 16-bit
+# chunks, each with its own sorted lookup table
+HASH_CHUNKS = 4
+CHUNK_BITS = 64 // HASH_CHUNKS
+
+# Files of an index directory
+DATABASE = "covers.sqlite"
+HASHES = "hashes.u64"
+THUMBNAILS = "thumbnails.u8"
+CHUNK_TABLES = "chunk_tables.npy"
+
+
+def cover_signature(context):
+    """
+    Compute the perceptual hash and thumbnail of an image.
+
+    The image is shrunk to 32x32 grey in one pass; its pHash keeps which
+    of the 8x8 lowest DCT frequencies clearly exceed their median, which
+    survives re-encoding, resizing and changes to the low bit planes.
+
+    Args:
+        context: ImageContext or anything ImageContext accepts
+
+    Returns:
+        tuple: (hash as a Python int, uint8 thumbnail of shape (16, 16))
+    """
+    context = ImageContext.coerce(context)
+    small = cv2.resize(context.rgb, (HASH_SOURCE_SIDE, HASH_SOURCE_SIDE), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+    low = cv2.dct(gray.astype(np.float32))[:HASH_SIDE, :HASH_SIDE]
+    bits = (low > np.median(low) + HASH_MARGIN).ravel()
+    phash = int(np.packbits(bits).view(">u8")[0])
+    thumbnail = cv2.resize(gray, (THUMBNAIL_SIDE, THUMBNAIL_SIDE), interpolation=cv2.INTER_AREA)
+    return phash, thumbnail
+
+
+def _signature_of_file(item):
+    """Signature of a file to index; runs inside a worker process."""
+    path, size, mtime = item
+    try:
+        context = ImageContext(path)
+        phash, thumbnail = cover_signature(context)
+        height, width = context.rgb.shape[:2]
+        return path, size, mtime, phash, thumbnail.tobytes(), width, height, None
+    except Exception as e:
+        return path, size, mtime, None, None, None, None, str(e)
+
+
+def _entries(hashes_file):
+    """Number of entries in an index, from the size of its hash file."""
+    return os.path.getsize(hashes_file) // 8 if os.path.exists(hashes_file) else 0
+
+
+def _file_state(filename):
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _write_at(filename, offset, data):
+    descriptor = os.open(filename, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        os.pwrite(descriptor, data, offset)
+    finally:
+        os.close(descriptor)
+
+
+def _chunk(hashes, chunk):
+    return ((hashes >> np.uint64(chunk * CHUNK_BITS)) & np.uint64((1 << CHUNK_BITS) - 1)).astype(np.uint16)
+
+
+def _flip_masks(radius):
+    """Every CHUNK_BITS-bit mask with at most radius bits set."""
+    masks = [0]
+    for bits in range(1, radius + 1):
+        masks += [sum(1 << bit for bit in chosen) for chosen in combinations(range(CHUNK_BITS), bits)]
+    return np.array(masks, dtype=np.uint16)
+
+
+class CoverIndex:
+    """Index of known clean cover images, searched by perceptual hash.
+
+    The hashes and thumbnails are flat files that every process memory-maps
+    read-only, so forked server and pool workers share one copy in the page
+    cache. Paths and file metadata live in SQLite. A near-duplicate lookup
+    uses multi-index hashing: by the pigeonhole principle, a hash within
+    max_distance bits of the query agrees with it to within
+    max_distance // 4 bits on at least one of its four 16-bit chunks, so a
+    few binary searches in sorted chunk tables find every candidate.
+    Entries added since the tables were last rebuilt are scanned directly,
+    so an index can be extended while it is being searched.
+    """
+
+    def __init__(self, path, max_distance=6, max_thumbnail_difference=6.0):
+        """
+        Open (or create) the index stored in a directory.
+
+        Args:
+            path: Index directory
+            max_distance: Largest Hamming distance between the 64-bit
+                perceptual hashes of an image and its cover
+            max_thumbnail_difference: Largest mean absolute difference of
+                their 16x16 grey thumbnails, which weeds out images that
+                merely share a hash
+        """
+        self.path = path
+        self.max_distance = max_distance
+        self.max_thumbnail_difference = max_thumbnail_difference
+        os.makedirs(path, exist_ok=True)
+        self._masks = _flip_masks(max_distance // HASH_CHUNKS)
+        self._reset_local_state()
+
+    def __getstate__(self):
+        # Pool workers reopen the index and map its files themselves
+        return {"path": self.path, "max_distance": self.max_distance,
+                "max_thumbnail_difference": self.max_thumbnail_difference}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _reset_local_state(self):
+        self._pid = os.getpid()
+        self._db = None
+        self._lock = threading.Lock()
+        self._mapped_at = ()
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._thumbnails = np.zeros((0, THUMBNAIL_SIDE, THUMBNAIL_SIDE), dtype=np.uint8)
+        self._tables = None
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _connection(self):
+        # A forked process starts over with its own connection
+        if self._pid != os.getpid():
+            self._reset_local_state()
+        if self._db is None:
+            self._db = sqlite3.connect(self._file(DATABASE), timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS covers ("
+                "id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, size INTEGER, mtime REAL, "
+                "width INTEGER, height INTEGER, phash TEXT, removed INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._db.commit()
+        return self._db
+
+    def _refresh(self):
+        """Remap the files if another process has added to the index since they were mapped."""
+        state = tuple(_file_state(self._file(name)) for name in (HASHES, CHUNK_TABLES))
+        if state == self._mapped_at:
+            return
+        self._mapped_at = state
+        count = _entries(self._file(HASHES))
+        if count:
+            self._hashes = np.memmap(self._file(HASHES), dtype="<u8", mode="r", shape=(count,))
+            self._thumbnails = np.memmap(self._file(THUMBNAILS), dtype=np.uint8, mode="r",
+                                         shape=(count, THUMBNAIL_SIDE, THUMBNAIL_SIDE))
+        if state[1] is not None:
+            self._tables = np.load(self._file(CHUNK_TABLES), mmap_mode="r")
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._connection().execute("SELECT COUNT(*) FROM covers WHERE removed = 0").fetchone()
+        return count
+
+    @property
+    def version(self):
+        """Changes whenever covers are added, so cached results are not reused across updates."""
+        with self._lock:
+            self._connection()
+            self._refresh()
+        return f"{len(self._hashes)}:{self._mapped_at}"
+
+    def add(self, path, size, mtime, phash, thumbnail, width, height):
+        """
+        Record a cover whose signature has been computed.
+
+        A file already in the index is updated in place when it changed.
+        A new cover is searchable at once, an updated one after commit,
+        and neither is saved before commit. One process at a time may add
+        covers.
+
+        Args:
+            path: Absolute path of the cover
+            size: File size in bytes
+            mtime: File modification time
+            phash: Perceptual hash from cover_signature
+            thumbnail: Thumbnail from cover_signature, as bytes
+            width: Image width
+            height: Image height
+        """
+        with self._lock:
+            db = self._connection()
+            row = db.execute("SELECT id FROM covers WHERE path = ?", (path,)).fetchone()
+            record = (size, mtime, width, height, f"{phash:016x}")
+            if row is not None:
+                entry = row[0]
+                db.execute("UPDATE covers SET size = ?, mtime = ?, width = ?, height = ?, phash = ?, removed = 0 "
+                           "WHERE id = ?", record + (entry,))
+            else:
+                # Entries are numbered by their place in the hash file, so
+                # any left there by an interrupted build are never reused
+                entry = _entries(self._file(HASHES))
+                db.execute("INSERT INTO covers (id, path, size, mtime, width, height, phash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           (entry, path) + record)
+            # The thumbnail goes first: readers size both maps by the hash file
+            _write_at(self._file(THUMBNAILS), THUMBNAIL_SIDE * THUMBNAIL_SIDE * entry, thumbnail)
+            _write_at(self._file(HASHES), 8 * entry, np.array([phash], dtype="<u8").tobytes())
+
+    def is_current(self, path, size, mtime):
+        """True if the file is indexed and has not changed since."""
+        with self._lock:
+            row = self._connection().execute("SELECT size, mtime, removed FROM covers WHERE path = ?", (path,)).fetchone()
+        return row is not None and row[0] == size and row[1] == mtime and not row[2]
+
+    def remove_missing(self):
+        """
+        Stop matching covers whose files no longer exist.
+
+        Returns:
+            int: Number of covers removed
+        """
+        with self._lock:
+            db = self._connection()
+            missing = [(entry,) for entry, path in db.execute("SELECT id, path FROM covers WHERE removed = 0")
+                       if not os.path.exists(path)]
+            db.executemany("UPDATE covers SET removed = 1 WHERE id = ?", missing)
+            db.commit()
+        return len(missing)
+
+    def commit(self):
+        """Save the added covers and rebuild the chunk tables over every entry, so lookups need no direct scan."""
+        with self._lock:
+            self._connection().commit()
+        count = _entries(self._file(HASHES))
+        hashes = np.fromfile(self._file(HASHES), dtype="<u8", count=count) if count else np.zeros(0, dtype=np.uint64)
+        chunks = np.stack([_chunk(hashes, chunk) for chunk in range(HASH_CHUNKS)])
+        ids = np.argsort(chunks, axis=1, kind="stable")
+        keys = np.take_along_axis(chunks, ids, axis=1)
+        # The sorted chunks and their entries, side by side in one file that
+        # is written aside and renamed, so readers never map a half-written table
+        tables = np.stack([keys, ids], axis=1).astype(np.uint32)
+        scratch = self._file(CHUNK_TABLES + ".tmp")
+        with open(scratch, "wb") as f:
+            np.save(f, tables)
+        os.replace(scratch, self._file(CHUNK_TABLES))
+
+    def add_directory(self, roots, workers=None, progress=None):
+        """
+        Index the images under some directories, skipping unchanged files.
+
+        Args:
+            roots: Files or directories to walk recursively
+            workers: Processes computing signatures (defaults to the CPU
+                count, 0 computes them in this process)
+            progress: Optional callable taking (path, error) for each file
+
+        Returns:
+            dict: Counts of files added or updated, skipped and failed
+        """
+        # scan.py imports the detector, which may hold an index; import it late
+        from scan import is_image, iter_paths
+
+        def pending():
+            for path in iter_paths(roots):
+                path = os.path.abspath(path)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if self.is_current(path, stat.st_size, stat.st_mtime):
+                    counts["skipped"] += 1
+                elif is_image(path):
+                    yield path, stat.st_size, stat.st_mtime
+
+        counts = {"indexed": 0, "skipped": 0, "errors": 0}
+        workers = os.cpu_count() if workers is None else workers
+        executor = ProcessPoolExecutor(max_workers=workers) if workers else None
+        try:
+            signatures = (map(_signature_of_file, pending()) if executor is None
+                          else executor.map(_signature_of_file, pending(), chunksize=16))
+            for path, size, mtime, phash, thumbnail, width, height, error in signatures:
+                if error is None:
+                    self.add(path, size, mtime, phash, thumbnail, width, height)
+                    counts["indexed"] += 1
+                else:
+                    counts["errors"] += 1
+                if progress is not None:
+                    progress(path, error)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        self.commit()
+        return counts
+
+    def _candidates(self, phash):
+        """Entries whose hash may be within max_distance of phash."""
+        found = []
+        tabled = 0
+        if self._tables is not None and self._tables.shape[2]:
+            tabled = self._tables.shape[2]
+            for chunk in range(HASH_CHUNKS):
+                probes = np.bitwise_xor(self._masks, np.uint16((phash >> (chunk * CHUNK_BITS)) & 0xFFFF))
+                keys, ids = self._tables[chunk]
+                starts = np.searchsorted(keys, probes, side="left")
+                ends = np.searchsorted(keys, probes, side="right")
+                for start, end in zip(starts, ends):
+                    if end > start:
+                        found.append(ids[start:end])
+        # Entries appended since the tables were built are checked directly
+        if len(self._hashes) > tabled:
+            found.append(np.arange(tabled, len(self._hashes), dtype=np.uint32))
+        if not found:
+            return np.zeros(0, dtype=np.intp)
+        return np.unique(np.concatenate(found)).astype(np.intp)
+
+    def lookup(self, context):
+        """
+        Find the known cover of an image.
+
+        Args:
+            context: ImageContext or anything ImageContext accepts
+
+        Returns:
+            dict: The cover's path, width and height, the Hamming distance
+            between the hashes and the thumbnail difference; None if no
+            indexed cover is close enough
+        """
+        phash, thumbnail = cover_signature(context)
+        with self._lock:
+            db = self._connection()
+            self._refresh()
+            candidates = self._candidates(phash)
+            candidates = candidates[candidates < len(self._hashes)]
+            if candidates.size == 0:
+                return None
+            distances = np.bitwise_count(np.bitwise_xor(self._hashes[candidates], np.uint64(phash)))
+            close = distances <= self.max_distance
+            candidates, distances = candidates[close], distances[close]
+            differences = np.abs(self._thumbnails[candidates].astype(np.int16) - thumbnail).mean(axis=(1, 2))
+            # The thumbnails tell similar covers apart better than the hashes
+            for i in np.lexsort((distances, differences)):
+                if differences[i] > self.max_thumbnail_difference:
+                    continue
+                row = db.execute("SELECT path, width, height FROM covers WHERE id = ? AND removed = 0",
+                                 (int(candidates[i]),)).fetchone()
+                if row is not None:
+                    return {"path": row[0], "width": row[1], "height": row[2],
+                            "hash_distance": int(distances[i]), "thumbnail_difference": float(differences[i])}
+        return None
+
+
+def compare_with_cover(context, cover_path, max_locations=1000):
+    """
+    Diff an image against its clean cover, bit plane by bit plane.
+
+    Args:
+        context: ImageContext of the suspect image
+        cover_path: Path of the cover
+        max_locations: Most changed pixel coordinates to list
+
+    Returns:
+        dict: Whether the images are comparable (same size); the number of
+        changed pixels and samples; the number of changed bits in each bit
+        plane (index 0 is the LSB) and each RGB channel; the bounding box
+        of the changes as [x0, y0, x1, y1]; and the first changed pixels
+        as [x, y] pairs in raster order
+    """
+    suspect = ImageContext.coerce(context).rgb
+    cover = ImageContext(cover_path).rgb
+    if suspect.shape != cover.shape:
+        return {"comparable": False,
+                "reason": f"The cover is {cover.shape[1]}x{cover.shape[0]}, the image {suspect.shape[1]}x{suspect.shape[0]}"}
+
+    diff = cv2.bitwise_xor(np.ascontiguousarray(suspect), np.ascontiguousarray(cover))
+    # One histogram of the XORed bytes gives the changed bits of every plane
+    bits = channel_histograms(diff) @ BIT_TABLE
+    changed = diff.any(axis=2)
+    locations = np.flatnonzero(changed)
+    report = {
+        "comparable": True,
+        "changed_pixels": int(locations.size),
+        "changed_samples": int(np.count_nonzero(diff)),
+        "changed_fraction": locations.size / changed.size,
+        "bits_changed": int(bits.sum()),
+        "bits_changed_by_plane": bits.sum(axis=0).tolist(),
+        "bits_changed_by_channel": dict(zip("RGB", bits.sum(axis=1).tolist())),
+        "bounding_box": None,
+        "changed_locations": [[int(i % changed.shape[1]), int(i // changed.shape[1])] for i in locations[:max_locations]],
+    }
+    if locations.size:
+        rows = np.flatnonzero(changed.any(axis=1))
+        columns = np.flatnonzero(changed.any(axis=0))
+        report["bounding_box"] = [int(columns[0]), int(rows[0]), int(columns[-1]), int(rows[-1])]
+    return report
+
+
+def _print_progress(path, error):
+    if error is not None:
+        print(f"skipping {path}: {error}", file=sys.stderr)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query an index of known clean cover images.")
+    parser.add_argument("index", help="Index directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("add", help="Index the images under some files or directories")
+    build.add_argument("paths", nargs="+")
+    build.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                       help="Worker processes (0 computes signatures in this process)")
+    build.add_argument("--remove-missing", action="store_true", help="Forget covers whose files were deleted")
+    find = commands.add_parser("lookup", help="Find the cover of images and diff them against it")
+    find.add_argument("paths", nargs="+")
+    find.add_argument("--max-distance", type=int, default=6, help="Largest perceptual hash distance")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "add":
+        index = CoverIndex(args.index)
+        start = time.perf_counter()
+        counts = index.add_directory(args.paths, workers=args.workers, progress=_print_progress)
+        if args.remove_missing:
+            counts["removed"] = index.remove_missing()
+        counts["covers"] = len(index)
+        counts["seconds"] = round(time.perf_counter() - start, 3)
+        print(json.dumps(counts))
+        return 0
+
+    index = CoverIndex(args.index, max_distance=args.max_distance)
+    for path in args.paths:
+        context = ImageContext(path)
+        start = time.perf_counter()
+        match = index.lookup(context)
+        record = {"path": path, "cover": match, "lookup_ms": (time.perf_counter() - start) * 1000}
+        if match is not None:
+            record["comparison"] = compare_with_cover(context, match["path"], max_locations=20)
+        print(json.dumps(record))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -25,18 +25,11 @@ def hide_in_lsb1(image, message):
         raise ValueError("Image not large enough to hide the message.")
 
     # Step 1: Normalize RGB values (set LSBs to 0)
-    flat_pixels[:, 0] &= 0b11111110  # R
-    flat_pixels[:, 1] &= 0b11111110  # G
-    flat_pixels[:, 2] &= 0b11111110  # B
-
-    # Step 2: Hide message bits in LSBs
-    bit_index = 0
-    for i in range(flat_pixels.shape[0]):
-        for channel in range(3):  # R, G, B
-            if bit_index < required_bits:
-                bit = int(binary_message[bit_index])
-                flat_pixels[i, channel] |= bit
-                bit_index += 1
+    flat_pixels &= 0b11111110
+
+    # Step 2: Hide message bits in the LSBs, pixel by pixel in R, G, B order
+    bits = np.frombuffer(binary_message.encode(), dtype=np.uint8) - ord('0')
+    flat_pixels.reshape(-1)[:required_bits] |= bits
 
     # Reconstruct image
     encoded_pixels = flat_pixels.reshape((height, width, 3))
@@ -46,31 +39,23 @@ def hide_in_lsb1(image, message):
 blank_img = Image.new('RGB', (300, 300), color=(255, 255, 255))
 blank_img.save('test_images/clean/blank.png')
 
+# Pixel coordinates: i is the column and j the row, as in putpixel((i, j))
+j, i = np.indices((300, 300))
+
 # Create a gradient image
-gradient_img = Image.new('RGB', (300, 300))
-for i in range(300):
-    for j in range(300):
-        gradient_img.putpixel((i, j), (i%256, j%256, (i+j)%256))
+gradient = np.dstack([i % 256, j % 256, (i + j) % 256]).astype(np.uint8)
+gradient_img = Image.fromarray(gradient)
 gradient_img.save('test_images/clean/gradient.png')
 
 # Create a simple pattern image
-pattern_img = Image.new('RGB', (300, 300))
-for i in range(300):
-    for j in range(300):
-        if (i//50 + j//50) % 2 == 0:
-            pattern_img.putpixel((i, j), (255, 0, 0))
-        else:
-            pattern_img.putpixel((i, j), (0, 0, 255))
+red_square = ((i // 50 + j // 50) % 2 == 0)[:, :, np.newaxis]
+pattern = np.where(red_square, np.array([255, 0, 0], dtype=np.uint8), np.array([0, 0, 255], dtype=np.uint8))
+pattern_img = Image.fromarray(pattern)
 pattern_img.save('test_images/clean/pattern.png')
 
 # Create a photo-like image
-photo_img = Image.new('RGB', (300, 300))
-for i in range(300):
-    for j in range(300):
-        r = int(128 + 127 * np.sin(i/30))
-        g = int(128 + 127 * np.sin(j/30))
-        b = int(128 + 127 * np.sin((i+j)/30))
-        photo_img.putpixel((i, j), (r, g, b))
+photo = np.dstack([128 + 127 * np.sin(i / 30), 128 + 127 * np.sin(j / 30), 128 + 127 * np.sin((i + j) / 30)])
+photo_img = Image.fromarray(photo.astype(np.uint8))
 photo_img.save('test_images/clean/photo_like.png')
 
 # Create a copy of each image with hidden data
@@ -0,0 +1,289 @@
+import numpy as np
+import cv2
+
+from chi_square import EXACT_HISTOGRAM_PIXELS, pair_p_values
+
+# Coefficient values are histogrammed over [-limit, limit]; larger
+# magnitudes are counted in the end bins
+DCT_HISTOGRAM_LIMIT = 64
+
+# Orthonormal 8-point DCT-II basis, rows indexed by frequency
+_DCT_BASIS = (np.sqrt(np.where(np.arange(8)[:, np.newaxis] == 0, 1 / 8, 2 / 8))
+              * np.cos((2 * np.arange(8) + 1) * np.arange(8)[:, np.newaxis] * np.pi / 16)).astype(np.float32)
+
+# Low-frequency modes (u, v < 3) recomputed for the calibrated image
+CALIBRATED_FREQUENCIES = 3
+# Modes whose magnitude histograms drive the F5 estimate: (0, 1), (1, 0), (1, 1)
+F5_MODES = ((0, 1), (1, 0), (1, 1))
+# Histogram roughness of the observed image relative to its calibrated
+# version above which the image is treated as double-compressed
+DOUBLE_COMPRESSION_ROUGHNESS = 3.0
+
+
+def coefficient_histograms(coef_arrays, limit=DCT_HISTOGRAM_LIMIT):
+    """
+    Per-frequency histograms of the quantised DCT coefficients of every component.
+
+    Each component's coefficients are read once: the block frequency and
+    the clipped value are folded into one 16-bit bin index and counted by
+    a single calcHist call per row block.
+
+    Args:
+        coef_arrays: Coefficient arrays of shape (8 * block_rows, 8 * block_cols),
+            one per component
+        limit: Largest coefficient magnitude with its own bin
+
+    Returns:
+        np.ndarray: int64 array of shape (components, 64, 2 * limit + 1)
+        where [c, 8 * u + v, limit + k] counts the coefficients of
+        frequency (u, v) in component c equal to k
+    """
+    span = 2 * limit + 1
+    bins = 64 * span
+    # Offset of each position in a block, e.g. (0, 0) -> DC bin of value 0
+    offsets = (np.arange(64).reshape(1, 8, 1, 8) * span + limit).astype(np.int16)
+    hists = np.zeros((len(coef_arrays), 64, span), dtype=np.int64)
+    for i, coeffs in enumerate(coef_arrays):
+        height, width = coeffs.shape[0] // 8 * 8, coeffs.shape[1] // 8 * 8
+        if height == 0 or width == 0:
+            continue
+        # Blocks of whole block rows small enough for calcHist's exact counts
+        rows = max(8, (EXACT_HISTOGRAM_PIXELS - 1) // width // 8 * 8)
+        for top in range(0, height, rows):
+            block = coeffs[top:min(top + rows, height), :width]
+            index = np.empty((block.shape[0] // 8, 8, width // 8, 8), dtype=np.int16)
+            np.clip(block.reshape(index.shape), -limit, limit, out=index, casting="unsafe")
+            index += offsets
+            counts = cv2.calcHist([index.view(np.uint16).reshape(block.shape)], [0], None, [bins], [0, bins])
+            hists[i] += counts.ravel().astype(np.int64).reshape(64, span)
+    return hists
+
+
+def _values(hists):
+    limit = hists.shape[-1] // 2
+    return np.arange(-limit, limit + 1)
+
+
+def jsteg_estimate(hists):
+    """
+    Estimate the JSteg embedding rate from the symmetry of AC histograms.
+
+    JSteg overwrites the LSB of every coefficient other than 0 and 1, so it
+    swaps counts within the pairs (2i, 2i + 1) and (-2i, -2i + 1). Cover
+    histograms are symmetric about zero, which makes the negative odd
+    count minus the positive odd count (from 3) equal h(1) in a cover; after
+    embedding a fraction p of the usable coefficients the difference is
+    (1 - p / 2) h(1), and h(1) itself never changes.
+
+    Args:
+        hists: Per-frequency histograms from coefficient_histograms
+
+    Returns:
+        dict: Pooled "rate", per-component "component_rates" (NaN where a
+        component has no coefficient equal to 1), the pairs-of-values
+        chi-square "p_value" of the pooled AC histogram and "ones_ratio",
+        the share of odd values among the usable coefficients
+    """
+    values = _values(hists)
+    limit = values[-1]
+    ac = hists[:, 1:].sum(axis=1).astype(np.float64)
+    negative_odd = ac[:, (values < 0) & (values % 2 == 1)].sum(axis=1)
+    positive_odd = ac[:, (values > 1) & (values % 2 == 1)].sum(axis=1)
+    ones = ac[:, values == 1].sum(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        component_rates = 2 * (1 - (negative_odd - positive_odd) / ones)
+    pooled_ones = ones.sum()
+    rate = 2 * (1 - (negative_odd.sum() - positive_odd.sum()) / pooled_ones) if pooled_ones else float("nan")
+
+    # Pairs (2i, 2i + 1) and (-2i, -2i + 1) away from the clipped end bins
+    evens = np.concatenate([np.arange(-limit + 2, 0, 2), np.arange(2, limit - 1, 2)])
+    pooled = ac.sum(axis=0)
+    pairs = np.stack([pooled[evens + limit], pooled[evens + 1 + limit]], axis=-1)
+    usable = pairs.sum()
+    return {
+        "rate": float(rate),
+        "component_rates": component_rates.tolist(),
+        "p_value": float(pair_p_values(pairs)),
+        "ones_ratio": float(pairs[:, 1].sum() / usable) if usable else float("nan"),
+    }
+
+
+def idct_plane(coeffs, quant):
+    """
+    Decompress one component to pixels, clipped and rounded like a decoder.
+
+    Args:
+        coeffs: Quantised coefficients of shape (8 * block_rows, 8 * block_cols)
+        quant: 8x8 quantisation table of the component
+
+    Returns:
+        np.ndarray: float32 pixel plane of the same shape
+    """
+    height, width = coeffs.shape
+    dequantised = coeffs.reshape(height // 8, 8, width).astype(np.float32)
+    dequantised *= np.tile(np.asarray(quant, dtype=np.float32), (1, width // 8))
+    # The separable transform runs along block columns, then along block rows
+    pixels = np.matmul(_DCT_BASIS.T, dequantised).reshape(height, width // 8, 8) @ _DCT_BASIS
+    pixels = pixels.reshape(height, width)
+    pixels += 128
+    np.rint(pixels, out=pixels)
+    return np.clip(pixels, 0, 255, out=pixels)
+
+
+def calibrated_histograms(coeffs, quant, limit=DCT_HISTOGRAM_LIMIT):
+    """
+    Low-frequency histograms of the calibrated image, an estimate of the cover's.
+
+    The component is decompressed, cropped by 4 pixels in both directions
+    and compressed again with the same quantisation table. The crop breaks
+    the block structure any embedding was tied to, while the image content
+    and its statistics barely change.
+
+    Args:
+        coeffs: Quantised coefficients of the component
+        quant: 8x8 quantisation table of the component
+        limit: Largest coefficient magnitude with its own bin
+
+    Returns:
+        np.ndarray: int64 array of shape (CALIBRATED_FREQUENCIES ** 2, 2 * limit + 1)
+        for frequencies (u, v) with u, v < CALIBRATED_FREQUENCIES in row-major order,
+        scaled to the block count of the observed image
+    """
+    n = CALIBRATED_FREQUENCIES
+    pixels = idct_plane(coeffs, quant)[4:, 4:]
+    height, width = pixels.shape[0] // 8 * 8, pixels.shape[1] // 8 * 8
+    if height == 0 or width == 0:
+        return np.zeros((n * n, 2 * limit + 1), dtype=np.int64)
+    pixels = pixels[:height, :width] - 128
+    # Only the low-frequency rows of the basis are needed for these modes
+    modes = np.matmul(_DCT_BASIS[:n], pixels.reshape(height // 8, 8, width))
+    modes = modes.reshape(height // 8, n, width // 8, 8) @ _DCT_BASIS[:n].T
+    modes /= np.asarray(quant, dtype=np.float32)[:n, :n][np.newaxis, :, np.newaxis, :]
+    values = np.clip(np.rint(modes), -limit, limit).astype(np.int64) + limit
+    frequency = np.arange(n * n).reshape(1, n, 1, n) * (2 * limit + 1)
+    hists = np.bincount((values + frequency).ravel(), minlength=n * n * (2 * limit + 1))
+    hists = hists.reshape(n * n, 2 * limit + 1)
+    # The crop drops a row and a column of blocks
+    blocks = coeffs.shape[0] // 8 * (coeffs.shape[1] // 8)
+    return np.rint(hists * (blocks / ((height // 8) * (width // 8)))).astype(np.int64)
+
+
+def _magnitudes(hist, count):
+    """Counts of |value| = 0 .. count - 1 of a signed histogram."""
+    limit = hist.shape[-1] // 2
+    positive = hist[..., limit:limit + count].astype(np.float64)
+    negative = hist[..., limit - count + 1:limit + 1][..., ::-1].astype(np.float64)
+    magnitudes = positive + negative
+    magnitudes[..., 0] = hist[..., limit]
+    return magnitudes
+
+
+def _roughness(magnitudes):
+    """Deviation of |value| = 2 .. 6 from the geometric mean of their neighbours."""
+    middle = magnitudes[..., 2:7]
+    smooth = np.sqrt(magnitudes[..., 1:6] * magnitudes[..., 3:8])
+    return np.abs(middle - smooth).sum() / max(magnitudes[..., 1:8].sum(), 1)
+
+
+def _calibrated_index(u, v):
+    return u * CALIBRATED_FREQUENCIES + v
+
+
+def double_compressed(hists, calibrated):
+    """
+    Check whether a component looks recompressed with a different quantisation table.
+
+    Double compression leaves periodic gaps in the coefficient histograms
+    that the calibrated image does not have; calibration-based estimates
+    are meaningless for such images.
+
+    Args:
+        hists: Observed per-frequency histograms of the component
+        calibrated: calibrated_histograms of the same component
+
+    Returns:
+        bool: True if the observed F5_MODES histograms are much rougher than
+        the calibrated ones
+    """
+    observed = _magnitudes(np.stack([hists[8 * u + v] for u, v in F5_MODES]), 8)
+    expected = _magnitudes(np.stack([calibrated[_calibrated_index(u, v)] for u, v in F5_MODES]), 8)
+    calibrated_roughness = _roughness(expected)
+    return bool(calibrated_roughness > 0 and _roughness(observed) > DOUBLE_COMPRESSION_ROUGHNESS * calibrated_roughness)
+
+
+def f5_estimate(hists, calibrated, min_count=50):
+    """
+    Estimate the share of non-zero AC coefficients changed by F5.
+
+    F5 decrements coefficient magnitudes, so zeros grow and ones shrink
+    relative to the calibrated estimate of the cover. Follows Fridrich,
+    Goljan and Hogea: for each mode the least-squares change rate beta
+    explaining the observed h(0) and h(1) from the calibrated histogram.
+
+    Args:
+        hists: Observed per-frequency histograms of the luminance component
+            (shape (64, 2 * limit + 1))
+        calibrated: calibrated_histograms of the same component
+        min_count: Minimum calibrated count of |value| = 1 for a mode to be used
+
+    Returns:
+        dict: Mean "beta" over the usable F5_MODES (NaN if none) and the
+        per-mode "mode_betas"
+    """
+    observed = _magnitudes(np.stack([hists[8 * u + v] for u, v in F5_MODES]), 8)
+    expected = _magnitudes(np.stack([calibrated[_calibrated_index(u, v)] for u, v in F5_MODES]), 8)
+
+    betas = []
+    for h, e in zip(observed, expected):
+        denominator = e[1] ** 2 + (e[2] - e[1]) ** 2
+        betas.append(float((e[1] * (h[0] - e[0]) + (h[1] - e[1]) * (e[2] - e[1])) / denominator)
+                     if e[1] >= min_count else float("nan"))
+    usable = [beta for beta in betas if np.isfinite(beta)]
+    return {
+        "beta": float(np.mean(usable)) if usable else float("nan"),
+        "mode_betas": betas,
+    }
+
+
+def outguess_estimate(hists, calibrated, min_count=20):
+    """
+    Measure how far the low-frequency LSB pairs have drifted from the cover's balance.
+
+    OutGuess flips LSBs of coefficients other than 0 and 1 and then
+    corrects the global histogram with further flips elsewhere. The global
+    histogram (and the JSteg estimate) therefore look clean, but the
+    corrections land in different frequencies than the embedding changes,
+    so the split of each pair (2i, 2i + 1) within a mode moves away from
+    the calibrated image's.
+
+    Args:
+        hists: Observed per-frequency histograms of the luminance component
+        calibrated: calibrated_histograms of the same component
+        min_count: Minimum pair count in both images for a pair to be used
+
+    Returns:
+        dict: "imbalance", the count-weighted mean amount by which the
+        observed pairs are more unbalanced than the calibrated ones, and
+        the number of "pairs" used
+    """
+    limit = hists.shape[-1] // 2
+    n = CALIBRATED_FREQUENCIES
+    modes = [(u, v) for u in range(n) for v in range(n) if (u, v) != (0, 0)]
+    observed = np.stack([hists[8 * u + v] for u, v in modes]).astype(np.float64)
+    expected = np.stack([calibrated[_calibrated_index(u, v)] for u, v in modes]).astype(np.float64)
+
+    evens = np.array([-6, -4, -2, 2, 4, 6]) + limit
+    first, second = observed[:, evens], observed[:, evens + 1]
+    first_cal, second_cal = expected[:, evens], expected[:, evens + 1]
+    total, total_cal = first + second, first_cal + second_cal
+    usable = (total >= min_count) & (total_cal >= min_count)
+    if not usable.any():
+        return {"imbalance": float("nan"), "pairs": 0}
+    split = np.abs(first[usable] / total[usable] - 0.5)
+    split_cal = np.abs(first_cal[usable] / total_cal[usable] - 0.5)
+    weights = total[usable]
+    return {
+        "imbalance": float(((split - split_cal) * weights).sum() / weights.sum()),
+        "pairs": int(usable.sum()),
+    }
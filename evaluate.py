@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from functools import partial
+
+import numpy as np
+
+from analysis_pool import AnalysisPool
+from corpus import read_manifest
+from steg_detector import SteganographyDetector, resolve_methods
+
+# Methods that compare a raw statistic with a detector threshold: the
+# threshold attribute and how the statistic is read from the result. Both
+# fire when the statistic is below half the threshold (confidence > 0.5).
+THRESHOLDED = {
+    "lsb_analysis": ("lsb_threshold", lambda result: (result["randomness_score"] + result["bit_distribution_score"]) / 2),
+    "chi_square": ("chi_square_threshold", lambda result: result["chi_square_value"]),
+}
+
+# Result fields that rank images better than the confidence, which is
+# clipped at 1; higher means more suspicious
+SCORE_FIELDS = {
+    "sample_pair_analysis": "embedding_rate",
+    "rs_analysis": "embedding_rate",
+    "jsteg_dct_analysis": "embedding_rate",
+    "f5_analysis": "beta",
+    "outguess_analysis": "pair_imbalance",
+}
+
+
+def analyze_record(detector, item, methods=None):
+    """Analyze one corpus image; runs inside a pool worker."""
+    path, _ = item
+    result = detector.analyze_image(path, methods=methods)
+    if "error" in result:
+        return {"error": result["error"]}
+    return {
+        "steganography_detected": result["steganography_detected"],
+        "detection_methods": result["detection_methods"],
+    }
+
+
+def method_score(name, result):
+    """
+    Score a method result so that higher means more suspicious.
+
+    Returns:
+        float: The score, or None if the method failed or abstained
+    """
+    if "error" in result:
+        return None
+    if name in THRESHOLDED:
+        # Lower statistics are more suspicious
+        score = -THRESHOLDED[name][1](result)
+    else:
+        score = result.get(SCORE_FIELDS.get(name, "confidence"))
+    if score is None or not np.isfinite(score):
+        return None
+    return float(score)
+
+
+def roc_curve(labels, scores):
+    """
+    Compute the ROC curve of scores against binary labels.
+
+    Args:
+        labels: 1 for positives, 0 for negatives
+        scores: Higher means more likely positive
+
+    Returns:
+        tuple: False positive rates, true positive rates and the score
+        cut-offs they are reached at (an image is flagged when its score
+        is at least the cut-off); the first point is (0, 0) at +inf
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    scores = np.asarray(scores, dtype=np.float64)
+    order = np.argsort(-scores, kind="mergesort")
+    scores, labels = scores[order], labels[order]
+    # One point per distinct score, after all the images tied at it
+    ends = np.r_[np.nonzero(np.diff(scores))[0], scores.size - 1]
+    true_positives = np.cumsum(labels)[ends]
+    false_positives = ends + 1 - true_positives
+    positives, negatives = max(labels.sum(), 1), max(labels.size - labels.sum(), 1)
+    return (np.r_[0.0, false_positives / negatives],
+            np.r_[0.0, true_positives / positives],
+            np.r_[np.inf, scores[ends]])
+
+
+def auc(fpr, tpr):
+    """Area under an ROC curve."""
+    return float(np.trapezoid(tpr, fpr))
+
+
+def confusion(labels, flags):
+    """
+    Count true and false positives and negatives.
+
+    Returns:
+        dict: tp, fp, tn and fn counts, with the true and false positive
+        rates and the accuracy
+    """
+    labels = np.asarray(labels, dtype=bool)
+    flags = np.asarray(flags, dtype=bool)
+    tp, fp = int(np.sum(flags & labels)), int(np.sum(flags & ~labels))
+    fn, tn = int(np.sum(~flags & labels)), int(np.sum(~flags & ~labels))
+    return {
+        "tp": tp, "fp": fp, "tn": tn, "fn": fn,
+        "tpr": tp / max(tp + fn, 1),
+        "fpr": fp / max(fp + tn, 1),
+        "accuracy": (tp + tn) / max(labels.size, 1),
+    }
+
+
+def suggest_threshold(labels, statistics):
+    """
+    Pick the detector threshold that best separates the corpus.
+
+    The cut-off maximizes Youden's J (true positive rate minus false
+    positive rate). Since the thresholded methods fire when the statistic
+    is below half the threshold, the suggested threshold is twice the
+    cut-off.
+
+    Args:
+        labels: 1 for stego images
+        statistics: Raw statistic of each image, lower is more suspicious
+
+    Returns:
+        dict: Suggested threshold with the rates it gives on the corpus
+    """
+    fpr, tpr, cutoffs = roc_curve(labels, -np.asarray(statistics, dtype=np.float64))
+    best = int(np.argmax(tpr - fpr))
+    values = -cutoffs
+    # Flag statistics up to values[best] but not values[best + 1]
+    if best == values.size - 1:
+        cutoff = float(np.nextafter(values[best], np.inf))
+    elif best == 0:
+        cutoff = float(values[1])
+    else:
+        cutoff = float((values[best] + values[best + 1]) / 2)
+    return {"suggested": 2 * cutoff, "tpr": float(tpr[best]), "fpr": float(fpr[best])}
+
+
+def evaluate(records, results, detector):
+    """
+    Score the detector's results on a labelled corpus.
+
+    Args:
+        records: Manifest records, with "label" and "payload_rate"
+        results: Analysis result of each record, from analyze_record
+        detector: Detector the results came from, for its current thresholds
+
+    Returns:
+        dict: Overall confusion matrix, and for each method the AUC, its
+        confusion matrix, its detection rate at each payload rate and, for
+        thresholded methods, a suggested threshold
+    """
+    labels, verdicts = [], []
+    per_method = defaultdict(lambda: {"labels": [], "scores": [], "flags": [], "statistics": [], "rates": []})
+    errors = 0
+    for record, result in zip(records, results):
+        if "error" in result:
+            errors += 1
+            continue
+        labels.append(record["label"])
+        verdicts.append(result["steganography_detected"])
+        for name, method_result in result["detection_methods"].items():
+            score = method_score(name, method_result)
+            if score is None:
+                continue
+            entry = per_method[name]
+            entry["labels"].append(record["label"])
+            entry["scores"].append(score)
+            entry["flags"].append(bool(method_result.get("detected")))
+            entry["rates"].append(record.get("payload_rate"))
+            if name in THRESHOLDED:
+                entry["statistics"].append(-score)
+
+    report = {
+        "images": len(records),
+        "positives": int(sum(labels)),
+        "negatives": len(labels) - int(sum(labels)),
+        "errors": errors,
+        "overall": confusion(labels, verdicts),
+        "methods": {},
+        "thresholds": {},
+    }
+    for name, entry in per_method.items():
+        fpr, tpr, _ = roc_curve(entry["labels"], entry["scores"])
+        recall_by_rate = defaultdict(list)
+        for label, flag, rate in zip(entry["labels"], entry["flags"], entry["rates"]):
+            if label:
+                recall_by_rate[rate].append(flag)
+        report["methods"][name] = {
+            "scored": len(entry["labels"]),
+            "auc": auc(fpr, tpr) if 0 < sum(entry["labels"]) < len(entry["labels"]) else None,
+            "confusion": confusion(entry["labels"], entry["flags"]),
+            "detection_rate_by_payload_rate": {
+                f"{rate:g}": float(np.mean(flags)) for rate, flags in sorted(recall_by_rate.items())
+            },
+        }
+        if name in THRESHOLDED and 0 < sum(entry["labels"]) < len(entry["labels"]):
+            attribute = THRESHOLDED[name][0]
+            report["thresholds"][attribute] = {
+                "current": getattr(detector, attribute),
+                **suggest_threshold(entry["labels"], entry["statistics"]),
+            }
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Evaluate the detectors on a corpus written by corpus.py: ROC/AUC, confusion matrices "
+                    "and suggested thresholds.")
+    parser.add_argument("corpus", help="Corpus directory containing manifest.jsonl")
+    parser.add_argument("--methods", type=resolve_methods, help="Comma-separated detection methods")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                        help="Worker processes (0 analyzes in this process)")
+    parser.add_argument("--lsb-threshold", type=float, default=SteganographyDetector().lsb_threshold)
+    parser.add_argument("--chi-square-threshold", type=float, default=SteganographyDetector().chi_square_threshold)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    records = read_manifest(args.corpus)
+    detector = SteganographyDetector(cache=None)
+    detector.lsb_threshold = args.lsb_threshold
+    detector.chi_square_threshold = args.chi_square_threshold
+    pool = AnalysisPool(processes=args.workers, detector=detector)
+
+    start = time.perf_counter()
+    task = partial(analyze_record, methods=args.methods)
+    try:
+        results = [result for _, result in pool.map(task, ((record["path"], record["label"]) for record in records))]
+    finally:
+        pool.close()
+    report = evaluate(records, results, detector)
+    report["seconds"] = time.perf_counter() - start
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+    for name, method in report["methods"].items():
+        matrix = method["confusion"]
+        score = "n/a" if method["auc"] is None else f"{method['auc']:.3f}"
+        print(f"{name:24} AUC {score}  TPR {matrix['tpr']:.3f}  FPR {matrix['fpr']:.3f}", file=sys.stderr)
+    for attribute, suggestion in report["thresholds"].items():
+        print(f"{attribute}: {suggestion['current']:g} -> {suggestion['suggested']:.6g} "
+              f"(TPR {suggestion['tpr']:.3f}, FPR {suggestion['fpr']:.3f})", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
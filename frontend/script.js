@@ -169,6 +169,9 @@ document.addEventListener('DOMContentLoaded', () => {
     const scanlineContainer = document.querySelector('.scanline-container');
     const lsbPicContainer = document.getElementById('lsb-pic-container'); // New reference
     const lsbPicImg = document.getElementById('lsb-pic'); // New reference
+    const heatmapContainer = document.getElementById('heatmap-container');
+    const heatmapBaseImg = document.getElementById('heatmap-base');
+    const heatmapPicImg = document.getElementById('heatmap-pic');
     const magnifierLens = lsbPicContainer?.querySelector('.magnifier-lens'); // Magnifier lens
     const magnifierResult = lsbPicContainer?.querySelector('.magnifier-result'); // Magnifier result display
 
@@ -179,6 +182,23 @@ document.addEventListener('DOMContentLoaded', () => {
     // API Endpoints
     const API_ANALYZE_IMAGE = 'http://127.0.0.1:5000/analyze';
     const API_ANALYZE_ZIP = 'http://127.0.0.1:5000/analyzezip';
+    const API_BASE = 'http://127.0.0.1:5000';
+    // Longest side requested for the zip image previews and LSB visualizations
+    const IMAGE_PREVIEW_SIZE = 800;
+    const LSB_PREVIEW_SIZE = 2048;
+
+    // Results carry preview URLs; ?inline=1 results embed the images instead
+    function imagePreviewSrc(fileData) {
+        if (fileData.image_data && fileData.mime_type) {
+            return `data:${fileData.mime_type};base64,${fileData.image_data}`;
+        }
+        return fileData.image_url ? `${API_BASE}${fileData.image_url}?size=${IMAGE_PREVIEW_SIZE}` : null;
+    }
+
+    function lsbPreviewSrc(resultData) {
+        if (resultData?.lsbpic) return `data:image/png;base64,${resultData.lsbpic}`;
+        return resultData?.lsbpic_url ? `${API_BASE}${resultData.lsbpic_url}?size=${LSB_PREVIEW_SIZE}` : null;
+    }
 
     // Global state for zip results
     let currentZipResults = null;
@@ -375,7 +395,8 @@ document.addEventListener('DOMContentLoaded', () => {
 
     async function startAnalysis(file) {
         const isZip = analysisSection.dataset.isZip === 'true';
-        const endpoint = isZip ? API_ANALYZE_ZIP : API_ANALYZE_IMAGE;
+        // Zip results are streamed back one image at a time
+        const endpoint = isZip ? `${API_ANALYZE_ZIP}?stream=1` : API_ANALYZE_IMAGE;
         const formDataKey = isZip ? 'zip' : 'image';
 
         // Show scan line only for single images
@@ -420,6 +441,12 @@ document.addEventListener('DOMContentLoaded', () => {
                  throw new Error(errorMsg);
             }
 
+            const contentType = response.headers.get('Content-Type') || '';
+            if (isZip && contentType.includes('application/x-ndjson')) {
+                await readZipStream(response);
+                return;
+            }
+
             const results = await response.json();
             console.log(results);
             progressBar.style.width = '100%';
@@ -449,6 +476,63 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Render streamed zip results as each NDJSON record arrives
+    async function readZipStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        const files = [];
+        let buffer = '';
+        let total = 0;
+        let summary = null;
+
+        const handleRecord = (record) => {
+            if (record.members !== undefined) {
+                // Upper bound: the archive may also hold non-image files
+                total = record.members;
+            } else if (record.file) {
+                files.push(record.file);
+                if (files.length === 1) {
+                    // The first result sets up the selector and the result tabs
+                    processAndDisplayResults({ files }, true);
+                } else {
+                    const fname = Object.keys(record.file)[0];
+                    const option = document.createElement('option');
+                    option.value = fname;
+                    option.textContent = fname;
+                    zipResultSelector.appendChild(option);
+                }
+                progressBar.style.width = total ? `${Math.round(70 + 30 * files.length / total)}%` : '70%';
+                statusText.textContent = `//: Analyzed ${files.length}${total ? ` of ${total}` : ''} files in ZIP...`;
+            } else if (record.summary) {
+                summary = record.summary;
+            } else if (record.error) {
+                throw new Error(escapeHtml(record.error));
+            }
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let newline;
+            while ((newline = buffer.indexOf('\n')) >= 0) {
+                const line = buffer.slice(0, newline).trim();
+                buffer = buffer.slice(newline + 1);
+                if (line) handleRecord(JSON.parse(line));
+            }
+        }
+        if (buffer.trim()) handleRecord(JSON.parse(buffer));
+
+        if (!files.length) {
+            processAndDisplayResults({ files }, true);
+            return;
+        }
+        progressBar.style.width = '100%';
+        statusText.textContent = summary
+            ? `//: Analysis Complete. ${summary.analyzed} files analyzed, ${summary.high_probability + summary.possible} flagged.`
+            : '//: Analysis Complete.';
+    }
+
     function processAndDisplayResults(results, isZip) {
         currentZipResults = null;
         zipResultSelector.innerHTML = '';
@@ -499,8 +583,9 @@ document.addEventListener('DOMContentLoaded', () => {
                 const firstFileData = firstFileObject[currentSelectedFileInZip];
 
                 // --- added: display the first image preview --- 
-                if (firstFileData.image_data && firstFileData.mime_type) {
-                    imagePreview.src = `data:${firstFileData.mime_type};base64,${firstFileData.image_data}`;
+                const firstPreviewSrc = imagePreviewSrc(firstFileData);
+                if (firstPreviewSrc) {
+                    imagePreview.src = firstPreviewSrc;
                     imagePreview.style.display = 'block';
                     if (scanlineContainer) {
                         scanlineContainer.innerHTML = ''; // Clear first
@@ -574,8 +659,9 @@ document.addEventListener('DOMContentLoaded', () => {
             const fileData = fileObject[selectedFilename];
 
             // update image preview if data exists
-            if (fileData.image_data && fileData.mime_type) {
-                imagePreview.src = `data:${fileData.mime_type};base64,${fileData.image_data}`; // correct template literal
+            const previewSrc = imagePreviewSrc(fileData);
+            if (previewSrc) {
+                imagePreview.src = previewSrc;
                 imagePreview.style.display = 'block';
                 // ensure the container is set up correctly if it was previously showing the zip icon
                 if(scanlineContainer) {
@@ -643,17 +729,17 @@ document.addEventListener('DOMContentLoaded', () => {
         overallResultDiv.innerHTML = 
             `<i class="fas ${resultData.steganography_detected ? 'fa-exclamation-triangle' : 'fa-shield-alt'}"></i>
             ${filename ? `[${escapeHtml(filename)}] ` : ''} <!-- Show escaped filename -->
-            ${escapeHtml(resultData.conclusion || (resultData.steganography_detected ? "Steganography Detected" : "No Steganography Detected"))}
+            ${escapeHtml(resultData.error ? `Analysis Failed: ${resultData.error}` : (resultData.conclusion || (resultData.steganography_detected ? "Steganography Detected" : "No Steganography Detected")))}
         `; // Correct template literal and escape content
         overallResultDiv.className = 'overall-result';
         overallResultDiv.classList.add(resultData.steganography_detected ? 'positive' : 'negative');
 
         // Update LSB Visualization display & Setup Magnifier
         if (lsbPicContainer && lsbPicImg && magnifierLens && magnifierResult) {
-            const lsbBase64 = resultData?.lsbpic;
+            const lsbSrc = lsbPreviewSrc(resultData);
             
-            if (lsbBase64) {
-                lsbPicImg.src = `data:image/png;base64,${lsbBase64}`;
+            if (lsbSrc) {
+                lsbPicImg.src = lsbSrc;
                 
                 // Wait for image to load before setting up magnifier
                 lsbPicImg.onload = () => {
@@ -680,14 +766,29 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         }
 
+        // Overlay the block heatmap on the uploaded image
+        if (heatmapContainer && heatmapBaseImg && heatmapPicImg) {
+            const heatmapBase64 = resultData?.heatmappic;
+            if (heatmapBase64 && imagePreview.src && imagePreview.style.display !== 'none') {
+                heatmapBaseImg.src = imagePreview.src;
+                heatmapPicImg.src = `data:image/png;base64,${heatmapBase64}`;
+                heatmapContainer.style.display = 'flex';
+            } else {
+                heatmapPicImg.src = '#';
+                heatmapContainer.style.display = 'none';
+            }
+        }
+
         // Clear existing tab content before populating
         tabContents.forEach(content => content.innerHTML = '');
 
         if (resultData.detection_methods) {
-            populateLSBTab(resultData.detection_methods.lsb_analysis || {});
-            populateChiTab(resultData.detection_methods.chi_square || {});
-            populateExtractTab(resultData.detection_methods.sample_extraction || {});
-            populateHistTab(resultData.detection_methods.histogram_analysis || {});
+            const methods = resultData.detection_methods;
+            const ran = (key) => methods[key] !== undefined;
+            ran('lsb_analysis') ? populateLSBTab(methods.lsb_analysis) : showSkippedTab('tab-lsb', resultData, 'lsb_analysis');
+            ran('chi_square') ? populateChiTab(methods.chi_square) : showSkippedTab('tab-chi', resultData, 'chi_square');
+            ran('sample_extraction') ? populateExtractTab(methods.sample_extraction) : showSkippedTab('tab-extract', resultData, 'sample_extraction');
+            ran('histogram_analysis') ? populateHistTab(methods.histogram_analysis) : showSkippedTab('tab-hist', resultData, 'histogram_analysis');
         } else {
             console.warn(`Analysis data missing 'detection_methods' field ${filename ? 'for ' + escapeHtml(filename) : ''}.`); // Escape filename
              tabContents.forEach(content => content.innerHTML = '<p>//: Detailed analysis data not available.</p>');
@@ -730,6 +831,21 @@ document.addEventListener('DOMContentLoaded', () => {
         return methodData.confidence !== undefined ? methodData.confidence : 0;
     }
 
+    // Methods can be skipped once the verdict is decided, or not requested at all
+    function showSkippedTab(tabId, resultData, methodKey) {
+        const tab = document.getElementById(tabId);
+        if (!tab) return;
+        const skipped = (resultData.methods_skipped || []).includes(methodKey);
+        tab.innerHTML =
+            `<div class="method-card">
+                <h4 class="not-detected">
+                    <i class="fas fa-forward"></i> ${skipped ? 'Skipped' : 'Not Run'}
+                </h4>
+                <p><strong>Log:</strong> ${skipped ? 'Skipped because the verdict was already decided.' : 'This method was not requested.'}</p>
+            </div>
+        `;
+    }
+
     function populateLSBTab(lsb) {
         const confidence = getConfidence(lsb);
         const tab = document.getElementById('tab-lsb');
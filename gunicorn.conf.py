@@ -0,0 +1,65 @@
+"""
+Production serving with gunicorn:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is imported and its detectors warmed once in the master process;
+the workers are then forked from it and share those pages instead of each
+paying for the imports and the first-request warm-up.
+
+Only scipy and jpegio are deferred until first use. cv2 is still imported
+eagerly by steg_detector (and image_context), since every detector needs
+it, so preloading cannot defer it; it is loaded once in the master and
+shared by the workers.
+"""
+import gc
+import os
+import tempfile
+import time
+
+_loaded = time.perf_counter()
+
+bind = os.environ.get("STEG_BIND", "127.0.0.1:5000")
+workers = int(os.environ.get("STEG_WORKERS", os.cpu_count() or 1))
+# Threads let a worker answer job polls and event streams while it analyzes
+worker_class = "gthread"
+threads = int(os.environ.get("STEG_THREADS", 4))
+# Import the app once in the master so that the workers are forked warm
+preload_app = True
+# Seconds a worker may go without checking in before it is restarted
+timeout = int(os.environ.get("STEG_WORKER_TIMEOUT", 120))
+
+if workers > 1:
+    # Jobs and previews must be visible to whichever worker a client reaches next
+    _shared = tempfile.mkdtemp(prefix="steg-")
+    os.environ.setdefault("STEG_JOB_DB", os.path.join(_shared, "jobs.sqlite"))
+    os.environ.setdefault("STEG_PREVIEW_DIR", os.path.join(_shared, "previews"))
+    # Every worker has its own zip analysis pool; together they fill the CPUs
+    os.environ.setdefault("STEG_POOL_SIZE", str(max(1, (os.cpu_count() or 1) // workers)))
+
+
+def on_starting(server):
+    server.log.info("Imported the app in %.0f ms", (time.perf_counter() - _loaded) * 1000)
+
+
+def when_ready(server):
+    import app
+    server.log.info("Warmed the detectors in %.0f ms", app.detector.warm_up() * 1000)
+    # Nothing created so far is ever collected, so the collector does not
+    # write to (and copy) the pages the workers share
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    worker.first_request_logged = False
+
+
+def pre_request(worker, req):
+    req.started = time.perf_counter()
+
+
+def post_request(worker, req, environ, resp):
+    if not worker.first_request_logged:
+        worker.first_request_logged = True
+        worker.log.info("Worker %s served its first request in %.0f ms",
+                        worker.pid, (time.perf_counter() - req.started) * 1000)
@@ -0,0 +1,392 @@
+import hashlib
+import io
+import os
+import tempfile
+import time
+from functools import cached_property
+
+import numpy as np
+from PIL import Image, ImageSequence
+import cv2
+
+from mapped_image import map_uncompressed
+from dct_stats import calibrated_histograms, coefficient_histograms
+from pixel_stats import PIXEL_STATS_BLOCK_BYTES, pixel_statistics
+
+
+class ImageContext:
+    """Decoded image shared by every detector during a single analysis.
+
+    The file is decoded once, on first use, into a uint8 array; the
+    colour-space views, bit planes and DCT coefficients that the detectors
+    need are derived from it on first access and cached for the rest of
+    the analysis.
+    """
+
+    def __init__(self, image_path, filename=None):
+        """
+        Prepare a context for an image held on disk or in memory.
+
+        Args:
+            image_path: Path to the image file, the encoded image as bytes,
+                bytearray or memoryview, a binary file-like object, a
+                decoded uint8 NumPy array (RGB or RGBA channel order), or
+                a decoded PIL image such as one frame of an animation
+            filename: Name to report for the image (defaults to the path's
+                basename or the file object's name)
+        """
+        self.path = None
+        self.data = None
+        self.array = None
+        self.decoded = None
+
+        if isinstance(image_path, Image.Image):
+            self.decoded = image_path
+            self.file_size = image_path.width * image_path.height * len(image_path.getbands())
+        elif isinstance(image_path, np.ndarray):
+            self.array = np.ascontiguousarray(image_path)
+            self.file_size = self.array.nbytes
+        elif isinstance(image_path, (bytes, bytearray, memoryview)):
+            self.data = bytes(image_path)
+            self.file_size = len(self.data)
+        elif hasattr(image_path, "read"):
+            if hasattr(image_path, "seek"):
+                image_path.seek(0)
+            self.data = image_path.read()
+            self.file_size = len(self.data)
+            filename = filename or os.path.basename(getattr(image_path, "filename", None) or getattr(image_path, "name", "") or "")
+        else:
+            self.path = image_path
+            self.file_size = os.path.getsize(image_path)
+            filename = filename or os.path.basename(image_path)
+
+        self.filename = filename or "image"
+        # Seconds spent decoding, by stage ("decode", "dct_decode", "pixel_statistics")
+        self.timings = {}
+        self._pixel_statistics = None
+
+    @classmethod
+    def coerce(cls, image):
+        """
+        Return an ImageContext for any supported input or an existing context.
+
+        Args:
+            image: Path, bytes, file-like object, NumPy array or ImageContext
+
+        Returns:
+            ImageContext: The shared image context
+        """
+        if isinstance(image, cls):
+            return image
+        return cls(image)
+
+    @cached_property
+    def content_hash(self):
+        """SHA-256 hex digest of the encoded image (or of the raw array or frame)."""
+        if self.data is not None:
+            return hashlib.sha256(self.data).hexdigest()
+        if self.decoded is not None:
+            digest = hashlib.sha256(f"{self.decoded.mode}{self.decoded.size}".encode())
+            if self.decoded.mode == "P":
+                digest.update(bytes(self.decoded.getpalette() or []))
+            digest.update(self.decoded.tobytes())
+            return digest.hexdigest()
+        if self.array is not None:
+            digest = hashlib.sha256(f"{self.array.shape}{self.array.dtype}".encode())
+            digest.update(self.array.data)
+            return digest.hexdigest()
+        digest = hashlib.sha256()
+        with open(self.path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @cached_property
+    def image(self):
+        """The decoded PIL image."""
+        if self.decoded is not None:
+            return self.decoded
+        if self.array is not None:
+            return Image.fromarray(self.array)
+        start = time.perf_counter()
+        with Image.open(self.path if self.data is None else io.BytesIO(self.data)) as img:
+            img.load()
+        self.timings["decode"] = time.perf_counter() - start
+        return img
+
+    @cached_property
+    def format(self):
+        """Format of the encoded image, read from its header without decoding it."""
+        if "image" in self.__dict__ or (self.path is None and self.data is None):
+            return self.image.format
+        with Image.open(self.path if self.data is None else io.BytesIO(self.data)) as img:
+            return img.format
+
+    @cached_property
+    def mime_type(self):
+        """MIME type of the encoded image as Pillow identifies it, or None if Pillow cannot read it."""
+        if self.path is None and self.data is None:
+            return None
+        try:
+            with Image.open(self.path if self.data is None else io.BytesIO(self.data)) as img:
+                return Image.MIME.get(img.format)
+        except Exception:
+            return None
+
+    @property
+    def mode(self):
+        return self.image.mode
+
+    @property
+    def is_jpeg(self):
+        return self.format == "JPEG"
+
+    @cached_property
+    def pixels(self):
+        """Canonical uint8 array of the image in its native mode."""
+        if self.array is not None and self.array.dtype == np.uint8:
+            return self.array
+        pixels = np.asarray(self.image)
+        if pixels.dtype != np.uint8:
+            # 16-bit, float and bilevel images are reduced to 8 bits per channel
+            pixels = np.asarray(self.image.convert("RGB" if pixels.ndim == 3 else "L"))
+        return pixels
+
+    @cached_property
+    def mapped(self):
+        """(array, channel_order) memory map of an uncompressed image, or None."""
+        if self.array is not None or self.decoded is not None:
+            return None
+        return map_uncompressed(self.path, self.data)
+
+    @property
+    def ndim(self):
+        """Dimensions of the pixel array, without decoding mappable images."""
+        if "pixels" not in self.__dict__ and self.mapped is not None:
+            return self.mapped[0].ndim
+        return self.pixels.ndim
+
+    @property
+    def shape(self):
+        """(height, width) of the image, without decoding mappable images."""
+        if "pixels" not in self.__dict__ and self.mapped is not None:
+            return self.mapped[0].shape[:2]
+        return self.pixels.shape[:2]
+
+    def strips(self, max_bytes):
+        """
+        Yield the RGB view of the image as horizontal strips.
+
+        Uncompressed images are read strip by strip from their memory map;
+        other images are decoded once and only the strips are converted,
+        so no full-size temporary besides the decoded pixels is created.
+
+        Args:
+            max_bytes: Maximum size of a strip (a strip holds at least one row)
+
+        Yields:
+            np.ndarray: Contiguous uint8 array of shape (rows, width, 3)
+        """
+        rows_view = self.rgb_rows()
+        height, width = rows_view.shape[:2]
+        rows = max(1, max_bytes // (3 * width))
+        for top in range(0, height, rows):
+            yield rows_view[top:top + rows]
+
+    def rgb_rows(self):
+        """
+        Row-sliceable RGB view that converts only the rows asked for.
+
+        Uncompressed images are read from their memory map, so slicing a
+        few rows never decodes the whole file.
+
+        Returns:
+            RGBRows: View whose row slices are contiguous uint8 arrays of
+            shape (rows, width, 3)
+        """
+        if "rgb" in self.__dict__:
+            return RGBRows(self.rgb, "RGB")
+        if "pixels" not in self.__dict__ and self.mapped is not None:
+            return RGBRows(*self.mapped)
+        if self.pixels.ndim == 3 and self.mode in ("RGB", "RGBA"):
+            return RGBRows(self.pixels, "RGB")
+        return RGBRows(self.rgb, "RGB")
+
+    def rgb_region(self, rows=None, columns=None):
+        """
+        RGB view of the top-left corner of the image.
+
+        Only that corner is read from memory-mapped images and converted
+        from other modes, so its cost depends on its size rather than on
+        the image size.
+
+        Args:
+            rows: Number of leading rows (defaults to all of them)
+            columns: Number of leading columns (defaults to all of them)
+
+        Returns:
+            np.ndarray: uint8 array of shape (rows, columns, 3)
+        """
+        decoded = "rgb" not in self.__dict__ and ("pixels" in self.__dict__ or self.mapped is None)
+        if decoded and not (self.pixels.ndim == 3 and self.mode in ("RGB", "RGBA")):
+            # Other modes are converted by Pillow, as for the rgb view
+            height, width = self.pixels.shape[:2]
+            box = (0, 0, width if columns is None else min(columns, width),
+                   height if rows is None else min(rows, height))
+            return np.asarray(self.image.crop(box).convert("RGB"))
+        return self.rgb_rows().source_region(rows, columns)
+
+    def pixel_statistics(self, max_bytes=PIXEL_STATS_BLOCK_BYTES):
+        """
+        Histograms and LSB counts of the RGB view, gathered in one pass on first use.
+
+        Args:
+            max_bytes: Largest strip read at once; the statistics are exact
+                whatever the strip size
+
+        Returns:
+            PixelStatistics: The shared statistics
+        """
+        if self._pixel_statistics is None:
+            start = time.perf_counter()
+            self._pixel_statistics = pixel_statistics(self.strips(min(max_bytes, PIXEL_STATS_BLOCK_BYTES)))
+            self.timings["pixel_statistics"] = time.perf_counter() - start
+        return self._pixel_statistics
+
+    def frames(self, start=0):
+        """
+        Yield a context for each frame of an animation or page of a TIFF.
+
+        The file is read frame by frame and only the frame being yielded is
+        held decoded, so memory stays bounded however long the animation
+        is. A still image yields a single frame.
+
+        Args:
+            start: Index of the first frame to yield
+
+        Yields:
+            ImageContext: Context of each frame, named "<filename>[<index>]"
+        """
+        if self.array is not None or self.decoded is not None:
+            if start == 0:
+                yield self
+            return
+        with Image.open(self.path if self.data is None else io.BytesIO(self.data)) as img:
+            for index, frame in enumerate(ImageSequence.Iterator(img)):
+                if index >= start:
+                    yield ImageContext(frame.copy(), filename=f"{self.filename}[{index}]")
+
+    @cached_property
+    def rgb(self):
+        """Three-channel RGB view of the image."""
+        if self.mode == "RGB" and self.pixels.ndim == 3:
+            return self.pixels
+        return np.asarray(self.image.convert("RGB"))
+
+    @cached_property
+    def bgr(self):
+        """Three-channel BGR view, as OpenCV would have read it."""
+        return np.ascontiguousarray(self.rgb[:, :, ::-1])
+
+    @cached_property
+    def ycrcb(self):
+        """YCrCb conversion of the BGR view."""
+        return cv2.cvtColor(self.bgr, cv2.COLOR_BGR2YCrCb)
+
+    @cached_property
+    def gray(self):
+        """Single-channel luminance view."""
+        if self.pixels.ndim == 2:
+            return self.pixels
+        return cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+
+    @cached_property
+    def lsb(self):
+        """Least significant bit plane of the RGB view."""
+        return self.rgb & 1
+
+    @cached_property
+    def jpeg(self):
+        """jpegio structure holding the quantised DCT coefficients, or None."""
+        if not self.is_jpeg:
+            return None
+        # jpegio is only needed for JPEGs, so it is imported here
+        import jpegio as jio
+        start = time.perf_counter()
+        jpeg = jio.read(self.path) if self.data is None else _read_jpeg_bytes(self.data)
+        self.timings["dct_decode"] = time.perf_counter() - start
+        return jpeg
+
+    @cached_property
+    def dct_histograms(self):
+        """Per-frequency coefficient histograms of every JPEG component, or None."""
+        if self.jpeg is None:
+            return None
+        return coefficient_histograms(self.jpeg.coef_arrays)
+
+    @cached_property
+    def calibrated_dct_histograms(self):
+        """Low-frequency histograms of the calibrated luminance component, or None."""
+        if self.jpeg is None:
+            return None
+        quant = self.jpeg.quant_tables[self.jpeg.comp_info[0].quant_tbl_no]
+        return calibrated_histograms(self.jpeg.coef_arrays[0], quant)
+
+
+class RGBRows:
+    """Lazy RGB view of an array held in another channel order, converted slice by slice."""
+
+    def __init__(self, source, channel_order):
+        """
+        Args:
+            source: uint8 array of shape (height, width[, channels]), such as
+                a memory map
+            channel_order: "RGB" (extra channels are dropped), "BGR" or "L"
+        """
+        self.source = source
+        self.channel_order = channel_order
+        self.shape = source.shape[:2] + (3,)
+
+    def __getitem__(self, rows):
+        """Contiguous RGB copy of a slice of rows."""
+        return self._convert(self.source[rows])
+
+    def source_region(self, rows=None, columns=None):
+        """Contiguous RGB copy of the top-left rows x columns corner."""
+        return self._convert(self.source[:rows, :columns])
+
+    def _convert(self, region):
+        if self.channel_order == "L":
+            return np.repeat(region[:, :, np.newaxis], 3, axis=2)
+        if self.channel_order == "BGR":
+            return np.ascontiguousarray(region[:, :, 2::-1])
+        return np.ascontiguousarray(region[:, :, :3])
+
+
+def _read_jpeg_bytes(data):
+    """
+    Parse an in-memory JPEG with jpegio, which can only open files by name.
+
+    On Linux the bytes go into an anonymous memory-backed file, so nothing
+    touches the disk; elsewhere a temporary file is used.
+
+    Args:
+        data: Encoded JPEG bytes
+
+    Returns:
+        jpegio structure holding the quantised DCT coefficients
+    """
+    import jpegio as jio
+    if hasattr(os, "memfd_create"):
+        fd = os.memfd_create("steg-jpeg")
+        try:
+            with open(fd, "wb", closefd=False) as scratch:
+                scratch.write(data)
+            return jio.read(f"/proc/self/fd/{fd}")
+        finally:
+            os.close(fd)
+
+    with tempfile.NamedTemporaryFile(suffix=".jpg") as scratch:
+        scratch.write(data)
+        scratch.flush()
+        return jio.read(scratch.name)
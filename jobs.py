@@ -0,0 +1,308 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+# Job states; the last three are final
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINAL_STATES = (DONE, FAILED, CANCELLED)
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue is at its maximum depth."""
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Job:
+    """Handle through which a running job reports its results and learns of cancellation."""
+
+    def __init__(self, jobs, job_id):
+        self.id = job_id
+        self.summary = None
+        self._jobs = jobs
+        self._completed = 0
+
+    @property
+    def cancel_requested(self):
+        return self._jobs._cancel_requested(self.id)
+
+    def add_result(self, name, result):
+        """Store the result of one item, with the job's summary so far."""
+        self._completed += 1
+        self._jobs._add_result(self.id, self._completed, {name: result}, self.summary)
+
+
+class JobQueue:
+    """Queue of analysis jobs run by background threads.
+
+    Job states and results live in SQLite: in memory by default, or in a
+    file shared by every server process that opens it, so any process can
+    report on or cancel a job while the one that accepted it runs it.
+    Jobs wait in a bounded queue, so a burst of submissions is turned away
+    with JobQueueFull instead of piling up. Finished jobs keep their results
+    for result_ttl seconds and are then forgotten.
+    """
+
+    def __init__(self, workers=1, max_queued=16, result_ttl=3600, path=None, poll_interval=0.25):
+        """
+        Configure the queue; worker threads are started on first submission.
+
+        Args:
+            workers: Number of jobs this process runs at the same time
+            max_queued: Maximum number of jobs waiting to start
+            result_ttl: Seconds a finished job stays available
+            path: SQLite file shared between processes, or None to keep
+                the jobs in this process's memory
+            poll_interval: Seconds between checks for results written by
+                other processes while waiting
+        """
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.path = path
+        self.poll_interval = poll_interval
+        self._stats = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0, "cancelled": 0, "expired": 0}
+        self._reset_local_state()
+
+    def _reset_local_state(self):
+        self._pid = os.getpid()
+        self._db = None
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._queue = queue.Queue()
+        self._threads = []
+
+    def _connection(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path or ":memory:", timeout=30, check_same_thread=False)
+            if self.path:
+                self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, members INTEGER, "
+                "completed INTEGER NOT NULL DEFAULT 0, summary TEXT, error TEXT, "
+                "created REAL NOT NULL, started REAL, finished REAL, "
+                "cancel INTEGER NOT NULL DEFAULT 0, owner INTEGER NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "job_id TEXT NOT NULL, seq INTEGER NOT NULL, record TEXT NOT NULL, "
+                "PRIMARY KEY (job_id, seq))"
+            )
+            self._db.commit()
+        return self._db
+
+    def _locked(self):
+        # A forked server process starts over with its own lock, connection and threads
+        if self._pid != os.getpid():
+            self._reset_local_state()
+        return self._changed
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._run_worker, name=f"job-worker-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _expire(self, db):
+        cutoff = time.time() - self.result_ttl
+        db.execute("DELETE FROM results WHERE job_id IN (SELECT id FROM jobs WHERE finished < ?)", (cutoff,))
+        expired = db.execute("DELETE FROM jobs WHERE finished < ?", (cutoff,)).rowcount
+        db.commit()
+        self._stats["expired"] += expired
+
+    def _row(self, db, job_id):
+        """Fetch a job, failing it first if the process running it has exited."""
+        row = db.execute("SELECT status, members, completed, summary, error, created, started, finished, owner "
+                         "FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is not None and row[0] not in FINAL_STATES and row[8] != self._pid and not _process_alive(row[8]):
+            self._set_final(db, job_id, FAILED, error="The server process running this job exited")
+            return self._row(db, job_id)
+        return row
+
+    def _results(self, db, job_id, since):
+        return [json.loads(record) for (record,) in db.execute(
+            "SELECT record FROM results WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, since))]
+
+    def submit(self, work, members=None):
+        """
+        Queue a job.
+
+        Args:
+            work: Callable taking a Job, run in a worker thread of this
+                process; it adds results with job.add_result and should
+                return early once job.cancel_requested is set
+            members: Number of items the job will go through, when known
+
+        Returns:
+            str: The job ID
+
+        Raises:
+            JobQueueFull: If max_queued jobs are already waiting
+        """
+        job_id = uuid.uuid4().hex
+        with self._locked():
+            db = self._connection()
+            self._expire(db)
+            (queued,) = db.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()
+            if queued >= self.max_queued:
+                self._stats["rejected"] += 1
+                raise JobQueueFull(f"{self.max_queued} jobs are already waiting")
+            db.execute("INSERT INTO jobs (id, status, members, created, owner) VALUES (?, ?, ?, ?, ?)",
+                       (job_id, QUEUED, members, time.time(), self._pid))
+            db.commit()
+            self._stats["submitted"] += 1
+            self._start_workers()
+        self._queue.put((job_id, work))
+        return job_id
+
+    def describe(self, job_id, since=0):
+        """
+        Report a job's status, progress and results.
+
+        Args:
+            job_id: ID returned by submit
+            since: Number of leading results to leave out, or None for no results
+
+        Returns:
+            dict: Job ID, status, member count, completed count, summary,
+            error, timestamps and the results after `since`; None if the
+            job is unknown or has expired
+        """
+        with self._locked():
+            db = self._connection()
+            self._expire(db)
+            row = self._row(db, job_id)
+            if row is None:
+                return None
+            status, members, completed, summary, error, created, started, finished, _ = row
+            description = {
+                "job_id": job_id,
+                "status": status,
+                "members": members,
+                "completed": completed,
+                "summary": json.loads(summary) if summary else None,
+                "error": error,
+                "created": created,
+                "started": started,
+                "finished": finished,
+            }
+            if since is not None:
+                description["results"] = self._results(db, job_id, since)
+        return description
+
+    def wait(self, job_id, seen, timeout=None):
+        """
+        Block until a job has more than `seen` results or is finished.
+
+        Args:
+            job_id: ID returned by submit
+            seen: Number of results the caller already has
+            timeout: Seconds to wait at most
+
+        Returns:
+            tuple: (new results, True when the job is finished or gone)
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._locked():
+            while True:
+                db = self._connection()
+                row = self._row(db, job_id)
+                if row is None:
+                    return [], True
+                records = self._results(db, job_id, seen)
+                finished = row[0] in FINAL_STATES
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if records or finished or (remaining is not None and remaining <= 0):
+                    return records, finished
+                # Results written by other processes are only seen by polling
+                self._changed.wait(self.poll_interval if remaining is None else min(remaining, self.poll_interval))
+
+    def cancel(self, job_id):
+        """
+        Cancel a job. A queued job never starts; a running one stops after
+        the item in progress and keeps the results it already has.
+
+        Returns:
+            bool: False if the job is unknown or has expired
+        """
+        with self._locked():
+            db = self._connection()
+            found = db.execute("UPDATE jobs SET cancel = 1 WHERE id = ?", (job_id,)).rowcount
+            db.commit()
+            if found:
+                row = self._row(db, job_id)
+                if row[0] == QUEUED:
+                    self._set_final(db, job_id, CANCELLED)
+        return bool(found)
+
+    def _set_final(self, db, job_id, status, error=None):
+        """Finish a job that is not finished yet; the caller holds the lock."""
+        changed = db.execute("UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ? AND status IN (?, ?)",
+                             (status, error, time.time(), job_id, QUEUED, RUNNING)).rowcount
+        db.commit()
+        if changed:
+            self._stats[{DONE: "completed", FAILED: "failed", CANCELLED: "cancelled"}[status]] += 1
+            self._changed.notify_all()
+
+    def _cancel_requested(self, job_id):
+        with self._locked():
+            row = self._connection().execute("SELECT cancel FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is None or bool(row[0])
+
+    def _add_result(self, job_id, seq, record, summary):
+        with self._locked():
+            db = self._connection()
+            db.execute("INSERT INTO results (job_id, seq, record) VALUES (?, ?, ?)", (job_id, seq, json.dumps(record)))
+            db.execute("UPDATE jobs SET completed = ?, summary = ? WHERE id = ?",
+                       (seq, json.dumps(summary) if summary is not None else None, job_id))
+            db.commit()
+            self._changed.notify_all()
+
+    def _run_worker(self):
+        while True:
+            job_id, work = self._queue.get()
+            with self._locked():
+                db = self._connection()
+                started = db.execute("UPDATE jobs SET status = ?, started = ? WHERE id = ? AND status = ?",
+                                     (RUNNING, time.time(), job_id, QUEUED)).rowcount
+                db.commit()
+            if not started:
+                continue
+            job = Job(self, job_id)
+            try:
+                work(job)
+                status, error = (CANCELLED if job.cancel_requested else DONE), None
+            except Exception as e:
+                status, error = FAILED, str(e)
+            with self._locked():
+                self._set_final(self._connection(), job_id, status, error=error)
+
+    def stats(self):
+        """
+        Report the queue depth and the job counters.
+
+        Returns:
+            dict: This process's counters of submitted, rejected, completed,
+            failed, cancelled and expired jobs, and the number of queued and
+            running jobs
+        """
+        with self._locked():
+            counts = dict(self._connection().execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE status IN (?, ?) GROUP BY status", (QUEUED, RUNNING)))
+            stats = dict(self._stats)
+        stats["queued"] = counts.get(QUEUED, 0)
+        stats["running"] = counts.get(RUNNING, 0)
+        return stats
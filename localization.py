@@ -0,0 +1,214 @@
+import base64
+
+import numpy as np
+import cv2
+
+from chi_square import westfeld_p_values
+from pixel_stats import PIXEL_STATS_BLOCK_BYTES
+
+# Default side of the square blocks of the heatmap grid, in pixels; the
+# per-block estimates get noisy below a few thousand pixel pairs
+HEATMAP_BLOCK_SIZE = 64
+
+# calcHist bins at most 256 block columns per call, one per uint8 index
+_MAX_BLOCK_COLUMNS = 256
+
+
+def block_edges(length, block_size):
+    """Start of every block along an axis, followed by the length; the last block may be short."""
+    return np.append(np.arange(0, length, block_size), length)
+
+
+def _plane(values):
+    """View of a contiguous (rows, width, channels) array as one channel, so cv2 applies scalars to every sample."""
+    return values.reshape(values.shape[0], -1)
+
+
+def _column_block_sums(values, col_edges, scale=1):
+    """
+    Sum some rows of a (rows, width, channels) uint8 array over every block column.
+
+    cv2.reduce turns the rows into a single row of column sums, in which
+    the channels are interleaved with the columns and are added up with
+    them; only that row is split into blocks.
+
+    Args:
+        values: uint8 array to sum
+        col_edges: Block edges along the columns, clipped to the array width
+        scale: Every value is a multiple of it, e.g. 255 for cv2 masks, and
+            the sums are divided by it
+
+    Returns:
+        np.ndarray: int64 array of shape (block_cols,)
+    """
+    channels = values.shape[2]
+    sums = np.zeros(values.shape[1] * channels + 1, dtype=np.int64)
+    if values.shape[0]:
+        np.cumsum(cv2.reduce(_plane(values), 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S)[0], out=sums[1:])
+    # Clipped edges may repeat, which leaves an empty block
+    return np.diff(sums[np.asarray(col_edges) * channels]) // scale
+
+
+def _band_pair_p_values(band, col_edges, column_map):
+    """
+    Chi-square attack p-value of every block of a band of block rows, summed over the channels.
+
+    The band is counted by one 2-D calcHist per channel over (block column,
+    value), with the block column supplied as a second uint8 image, so all
+    its block histograms cost a single pass over the pixels.
+
+    Args:
+        band: uint8 array of shape (rows, width, channels)
+        col_edges: Block edges along the columns
+        column_map: uint8 array holding the block column of every pixel,
+            with at least as many rows as the band
+
+    Returns:
+        np.ndarray: float64 array of shape (block_cols,); blocks with no
+        pair of enough samples add nothing
+    """
+    channels = band.shape[2]
+    p_values = np.zeros(len(col_edges) - 1)
+    for first in range(0, len(col_edges) - 1, _MAX_BLOCK_COLUMNS):
+        last = min(first + _MAX_BLOCK_COLUMNS, len(col_edges) - 1)
+        left, right = col_edges[first], col_edges[last]
+        images = [band[:, left:right], column_map[:band.shape[0], left:right]]
+        for channel in range(channels):
+            hist = cv2.calcHist(images, [channel, channels], None, [256, last - first],
+                                [0, 256, 0, last - first])
+            p_values[first:last] += np.nan_to_num(westfeld_p_values(hist.T))
+    return p_values
+
+
+def _spa_rates(x, z, w, total):
+    """
+    Sample Pair Analysis embedding rate of every block from the sizes of its trace sets.
+
+    Args:
+        x: Pairs in X: the right sample is even and larger, or odd and smaller
+        z: Pairs of equal samples
+        w: Pairs differing only in the LSB
+        total: Pairs in the block
+
+    Returns:
+        np.ndarray: float64 array of the rates; NaN where a block has no pairs
+    """
+    y = total - x - z
+    # Smaller root of (W + Z) / 2 p**2 + (2X - P) p + Y - X = 0 for every block
+    a, b, c = (w + z) / 2, 2.0 * x - total, (y - x).astype(np.float64)
+    root = np.sqrt(np.maximum(b * b - 4 * a * c, 0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        first, second = (-b + root) / (2 * a), (-b - root) / (2 * a)
+        rates = np.where(np.abs(first) < np.abs(second), first, second)
+        rates = np.where(a > 0, rates, -c / b)
+    return np.where(total > 0, rates, np.nan)
+
+
+def block_statistics(pixels, block_size=HEATMAP_BLOCK_SIZE):
+    """
+    LSB statistics of every block of a square grid over the image.
+
+    The image is read one band of block rows at a time, in chunks of rows
+    small enough to stay in the CPU cache while the LSB plane, the XOR of
+    horizontal neighbours and the masks derived from them are built and
+    reduced to per-block sums, so nothing image-sized is allocated and the
+    cost is linear in the number of pixels whatever the block size. A
+    transition or pair of two pixels is counted in the block of the left
+    or upper one.
+
+    Args:
+        pixels: uint8 array of shape (height, width, channels), or a view
+            with that shape whose row slices are such arrays, like
+            ImageContext.rgb_rows()
+        block_size: Side of the blocks in pixels
+
+    Returns:
+        dict: The "block_size" and float64 arrays of shape (block_rows,
+        block_cols): "transition_rate", "ones_ratio", "pair_p_value"
+        (chi-square attack) and "embedding_rate" (Sample Pair Analysis,
+        the most sensitive of them on blocks this small)
+    """
+    height, width, channels = pixels.shape
+    row_edges = block_edges(height, block_size)
+    col_edges = block_edges(width, block_size)
+    right = np.minimum(col_edges, width - 1)
+    block_heights = np.diff(row_edges)[:, np.newaxis]
+    block_widths = np.diff(col_edges)[np.newaxis, :]
+
+    shape = (len(row_edges) - 1, len(col_edges) - 1)
+    ones, transitions, unequal, lsb_partners, x = (np.zeros(shape, dtype=np.int64) for _ in range(5))
+    pair_p_value = np.zeros(shape)
+    columns = np.minimum(np.arange(width) // block_size % _MAX_BLOCK_COLUMNS, 255).astype(np.uint8)
+    column_map = np.ascontiguousarray(np.broadcast_to(columns, (block_size, width)))
+    step = max(1, PIXEL_STATS_BLOCK_BYTES // (width * channels))
+
+    for i, (top, bottom) in enumerate(zip(row_edges[:-1], row_edges[1:])):
+        pair_p_value[i] = _band_pair_p_values(pixels[top:bottom], col_edges, column_map)
+        for start in range(top, bottom, step):
+            stop = min(start + step, bottom)
+            # One row more for the vertical neighbours of the last one
+            lsb = pixels[start:min(stop + 1, height)] & 1
+            ones[i] += _column_block_sums(lsb[:stop - start], col_edges)
+            if lsb.shape[0] > 1:
+                transitions[i] += _column_block_sums(cv2.bitwise_xor(lsb[1:], lsb[:-1]), col_edges)
+            if width == 1:
+                continue
+
+            # Sample Pair Analysis trace sets of horizontal pairs; the LSB
+            # of their XOR also marks an LSB transition
+            rows = pixels[start:stop]
+            difference = cv2.bitwise_xor(rows[:, :-1], rows[:, 1:])
+            transitions[i] += _column_block_sums(cv2.bitwise_and(_plane(difference), 1).reshape(difference.shape), right)
+            different = cv2.compare(difference, 0, cv2.CMP_NE)
+            unequal[i] += _column_block_sums(different, right, scale=255)
+            lsb_partners[i] += _column_block_sums(cv2.compare(_plane(difference), 1, cv2.CMP_EQ).reshape(difference.shape),
+                                                  right, scale=255)
+            # X: the right sample is even and larger, or odd and smaller, that
+            # is "smaller" differs from "odd" for a pair of unequal samples
+            smaller = cv2.compare(rows[:, :-1], rows[:, 1:], cv2.CMP_LT)
+            odd = cv2.compare(lsb[:stop - start, 1:], 0, cv2.CMP_NE)
+            x[i] += _column_block_sums(cv2.bitwise_and(cv2.bitwise_xor(smaller, odd), different), right, scale=255)
+
+    pairs = np.zeros(shape, dtype=np.int64)
+    embedding_rate = np.full(shape, np.nan)
+    if width > 1:
+        horizontal_pairs = block_heights * np.diff(right)[np.newaxis, :]
+        pairs += horizontal_pairs
+        total = horizontal_pairs * channels
+        embedding_rate = _spa_rates(x, total - unequal, lsb_partners, total)
+    if height > 1:
+        below = np.minimum(row_edges, height - 1)
+        pairs += np.diff(below)[:, np.newaxis] * block_widths
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        transition_rate = np.where(pairs > 0, transitions / (pairs * channels), 0.0)
+    return {
+        "block_size": block_size,
+        "transition_rate": transition_rate,
+        "ones_ratio": ones / (block_heights * block_widths * channels),
+        "pair_p_value": pair_p_value / channels,
+        "embedding_rate": embedding_rate,
+    }
+
+
+def heatmap_png(suspicion):
+    """
+    Encode a block grid of suspicion scores as a translucent PNG overlay.
+
+    One pixel per block: the colour runs from blue to red with the score
+    and the alpha channel grows with it, so clean regions stay see-through
+    when the overlay is stretched over the image.
+
+    Args:
+        suspicion: float array of shape (block_rows, block_cols) in [0, 1]
+
+    Returns:
+        str: Base64-encoded RGBA PNG
+    """
+    levels = np.clip(np.nan_to_num(suspicion) * 255, 0, 255).astype(np.uint8)
+    colours = cv2.applyColorMap(levels, cv2.COLORMAP_JET)
+    overlay = np.dstack([colours, np.maximum(levels, 32)])
+    ok, encoded = cv2.imencode(".png", overlay)
+    if not ok:
+        raise ValueError("could not encode heatmap")
+    return base64.b64encode(encoded.tobytes()).decode("utf-8")
@@ -0,0 +1,146 @@
+import binascii
+
+import numpy as np
+
+# Channel layouts: RGB interleaved per pixel, or each channel plane in turn
+LAYOUTS = ("rgb", "planar")
+# Bit orders: first extracted bit is the most or the least significant bit
+BIT_ORDERS = ("msb", "lsb")
+# Pixel scan orders
+SCANS = ("row", "column")
+
+DEFAULT_ORDER = "rgb-msb-row"
+ALL_ORDERS = tuple(f"{layout}-{bits}-{scan}"
+                   for layout in LAYOUTS for bits in BIT_ORDERS for scan in SCANS)
+
+
+def parse_order(order):
+    """
+    Split an order name such as "rgb-msb-row" into its three parts.
+
+    Args:
+        order: Order name "<layout>-<bit order>-<scan>"
+
+    Returns:
+        tuple: (layout, bit_order, scan)
+    """
+    parts = tuple(order.split("-"))
+    if len(parts) != 3 or parts[0] not in LAYOUTS or parts[1] not in BIT_ORDERS or parts[2] not in SCANS:
+        raise ValueError(f"Unknown extraction order: {order}")
+    return parts
+
+
+def sample_stream(pixels, count, layout="rgb", scan="row"):
+    """
+    Return the first `count` samples of the image in the given order.
+
+    Only the rows (or columns) that hold those samples are touched, so the
+    cost depends on `count` rather than on the image size.
+
+    Args:
+        pixels: uint8 array of shape (height, width[, channels])
+        count: Number of samples wanted
+        layout: "rgb" for interleaved channels, "planar" for one plane after another
+        scan: "row" for row-major, "column" for column-major
+
+    Returns:
+        np.ndarray: 1-D uint8 array of at most `count` samples
+    """
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, np.newaxis]
+    if scan == "column":
+        pixels = pixels.transpose(1, 0, 2)
+
+    if layout == "rgb":
+        per_line = pixels.shape[1] * pixels.shape[2]
+        lines = -(-count // per_line)
+        return pixels[:lines].reshape(-1)[:count]
+
+    chunks = []
+    remaining = count
+    for channel in range(pixels.shape[2]):
+        plane = pixels[:, :, channel]
+        lines = -(-remaining // plane.shape[1])
+        chunk = plane[:lines].reshape(-1)[:remaining]
+        chunks.append(chunk)
+        remaining -= chunk.size
+        if remaining <= 0:
+            break
+    return np.concatenate(chunks)
+
+
+def _sample_count(max_bytes):
+    """Samples read to extract up to max_bytes, with one extra byte so a terminator right after them is still seen."""
+    return (max_bytes + 1) * 8
+
+
+def payload_region(shape, max_bytes, order=DEFAULT_ORDER):
+    """
+    Leading rows or columns of an RGB image that extract_payload reads.
+
+    Passing only that corner of the image to extract_payload gives the
+    same payload as passing the whole image.
+
+    Args:
+        shape: (height, width) of the image
+        max_bytes: Maximum payload size to extract
+        order: Order name, see ALL_ORDERS
+
+    Returns:
+        tuple: (rows, columns), one of them None for all of them
+    """
+    layout, _, scan = parse_order(order)
+    height, width = shape[:2]
+    line, lines = (width, height) if scan == "row" else (height, width)
+    per_line = line * 3 if layout == "rgb" else line
+    needed = min(lines, -(-_sample_count(max_bytes) // per_line))
+    return (needed, None) if scan == "row" else (None, needed)
+
+
+def extract_payload(pixels, max_bytes, order=DEFAULT_ORDER):
+    """
+    Extract a NUL-terminated LSB payload in one order.
+
+    Args:
+        pixels: uint8 array of shape (height, width[, channels])
+        max_bytes: Maximum payload size to extract
+        order: Order name, see ALL_ORDERS
+
+    Returns:
+        dict: Payload bytes and whether a terminator was found
+    """
+    layout, bit_order, scan = parse_order(order)
+
+    samples = sample_stream(pixels, _sample_count(max_bytes), layout, scan)
+    bits = samples & 1
+    data = np.packbits(bits[:bits.size - bits.size % 8],
+                       bitorder="big" if bit_order == "msb" else "little")
+
+    zeros = np.flatnonzero(data == 0)
+    terminated = zeros.size > 0 and zeros[0] <= max_bytes
+    payload = data[:zeros[0]] if terminated else data[:max_bytes]
+
+    return {"order": order, "terminated": bool(terminated), "payload": payload.tobytes()}
+
+
+def describe_payload(extraction):
+    """
+    Build the JSON-friendly summary of an extracted payload.
+
+    Args:
+        extraction: Result of extract_payload
+
+    Returns:
+        dict: Order, length, printable ratio and text/hex samples
+    """
+    payload = extraction["payload"]
+    data = np.frombuffer(payload, dtype=np.uint8)
+    printable = np.count_nonzero(((data >= 32) & (data < 127)) | np.isin(data, (9, 10, 13)))
+    return {
+        "order": extraction["order"],
+        "terminated": extraction["terminated"],
+        "length": len(payload),
+        "printable_ratio": printable / len(payload) if payload else 0.0,
+        "sample_text": payload.decode("ascii", errors="replace"),
+        "sample_hex": binascii.hexlify(payload).decode("ascii"),
+    }
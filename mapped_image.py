@@ -0,0 +1,133 @@
+import struct
+
+import numpy as np
+
+
+def map_uncompressed(path=None, data=None):
+    """
+    Map the pixels of an uncompressed image without decoding it.
+
+    Supports 24 and 32-bit BI_RGB BMP, binary PPM/PGM with a maximum value of 255 and 8-bit
+    chunky TIFF without compression or predictor whose strips are stored
+    back to back. Files are memory-mapped, so pixels are only read from
+    disk when a slice of the array is used.
+
+    Args:
+        path: Path to the image file
+        data: Encoded image bytes, used instead of path
+
+    Returns:
+        tuple: (array, channel_order) where array is a uint8 view of shape
+        (height, width[, channels]) and channel_order is "RGB", "BGR" or
+        "L"; None if the image is not in one of the supported layouts
+    """
+    try:
+        buffer = np.frombuffer(data, dtype=np.uint8) if data is not None else np.memmap(path, dtype=np.uint8, mode="r")
+    except (OSError, ValueError):
+        return None
+    header = bytes(buffer[:16])
+    try:
+        if header.startswith(b"BM"):
+            return _map_bmp(buffer)
+        if header[:2] in (b"P5", b"P6"):
+            return _map_pnm(buffer)
+        if header[:4] in (b"II*\x00", b"MM\x00*"):
+            return _map_tiff(buffer)
+    except (struct.error, ValueError, IndexError):
+        pass
+    return None
+
+
+def _pixel_view(buffer, offset, height, width, channels, row_stride):
+    """View height rows of width pixels starting at offset, or None if truncated."""
+    if height <= 0 or width <= 0 or offset + row_stride * (height - 1) + width * channels > buffer.size:
+        return None
+    # Rows may be padded, so they are viewed with the file's row stride and
+    # only their pixel bytes are exposed
+    rows = np.lib.stride_tricks.as_strided(buffer[offset:], shape=(height, width * channels),
+                                           strides=(row_stride, 1), writeable=False)
+    return rows.reshape(height, width, channels) if channels > 1 else rows
+
+
+def _map_bmp(buffer):
+    header = bytes(buffer[:54])
+    offset, dib_size = struct.unpack_from("<II", header, 10)
+    if dib_size < 40:
+        return None
+    width, height, planes, bits, compression = struct.unpack_from("<iiHHI", header, 18)
+    if bits not in (24, 32) or compression != 0:
+        return None
+    channels = bits // 8
+    stride = (bits * width + 31) // 32 * 4
+    rows = _pixel_view(buffer, offset, abs(height), width, channels, stride)
+    if rows is None:
+        return None
+    # Positive heights are stored bottom-up
+    return (rows[::-1] if height > 0 else rows), "BGR"
+
+
+def _map_pnm(buffer):
+    header = bytes(buffer[:256])
+    tokens = []
+    position = 2
+    while len(tokens) < 3:
+        while header[position:position + 1].isspace():
+            position += 1
+        if header[position:position + 1] == b"#":
+            position = header.index(b"\n", position)
+            continue
+        end = position
+        while not header[end:end + 1].isspace():
+            end += 1
+        tokens.append(int(header[position:end]))
+        position = end
+    width, height, maxval = tokens
+    if maxval != 255:
+        # Other ranges are rescaled when decoded
+        return None
+    # Exactly one whitespace byte separates the header from the pixels
+    channels = 3 if header[:2] == b"P6" else 1
+    rows = _pixel_view(buffer, position + 1, height, width, channels, width * channels)
+    if rows is None:
+        return None
+    return rows, "RGB" if channels == 3 else "L"
+
+
+# TIFF field types and their sizes in bytes
+_TIFF_TYPES = {1: ("B", 1), 3: ("H", 2), 4: ("I", 4)}
+
+
+def _map_tiff(buffer):
+    order = "<" if bytes(buffer[:2]) == b"II" else ">"
+    (ifd,) = struct.unpack_from(order + "I", bytes(buffer[4:8]))
+    (count,) = struct.unpack_from(order + "H", bytes(buffer[ifd:ifd + 2]))
+    entries = bytes(buffer[ifd + 2:ifd + 2 + 12 * count])
+    tags = {}
+    for i in range(count):
+        tag, kind, n, value = struct.unpack_from(order + "HHI4s", entries, 12 * i)
+        if kind not in _TIFF_TYPES:
+            continue
+        code, size = _TIFF_TYPES[kind]
+        raw = value if n * size <= 4 else bytes(buffer[struct.unpack(order + "I", value)[0]:][:n * size])
+        tags[tag] = struct.unpack_from(order + code * n, raw)
+
+    width, height = tags[256][0], tags[257][0]
+    samples = tags.get(277, (1,))[0]
+    photometric = tags.get(262, (None,))[0]
+    if (tags.get(259, (1,))[0] != 1 or tags.get(317, (1,))[0] != 1 or tags.get(284, (1,))[0] != 1
+            or any(bits != 8 for bits in tags.get(258, (1,)))):
+        return None
+    if photometric == 2 and samples in (3, 4):
+        channel_order = "RGB"
+    elif photometric == 1 and samples == 1:
+        channel_order = "L"
+    else:
+        return None
+
+    offsets, counts = tags[273], tags[279]
+    if any(offsets[i] + counts[i] != offsets[i + 1] for i in range(len(offsets) - 1)):
+        return None
+    rows = _pixel_view(buffer, offsets[0], height, width, samples, width * samples)
+    if rows is None:
+        return None
+    return rows, channel_order
@@ -0,0 +1,132 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Cumulative latency histogram in the Prometheus bucket layout."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class MetricsRegistry:
+    """Thread-safe counters and latency histograms rendered as Prometheus text."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(Histogram)
+        self._counters = defaultdict(float)
+
+    def observe(self, stage, seconds):
+        """
+        Record how long a stage of the analysis took.
+
+        Args:
+            stage: Detection method, "decode", "lsb_preview", "total", ...
+            seconds: Duration in seconds
+        """
+        with self._lock:
+            self._histograms[stage].observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        """
+        Increase a counter.
+
+        Args:
+            name: Metric name
+            amount: Increment
+            labels: Label names and values
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += amount
+
+    def record_result(self, result):
+        """
+        Fold one analysis result into the metrics.
+
+        Uses the result's timings_ms block, its file size and the errors
+        reported by the image as a whole and by each detection method.
+
+        Args:
+            result: Dict returned by analyze_image (possibly an error record)
+        """
+        if "error" in result:
+            self.inc("steg_analysis_errors_total")
+            return
+
+        self.inc("steg_images_analyzed_total")
+        self.inc("steg_bytes_processed_total", result.get("file_size", 0))
+        for stage, milliseconds in result.get("timings_ms", {}).items():
+            self.observe(stage, milliseconds / 1000)
+        for method, method_result in result.get("detection_methods", {}).items():
+            if isinstance(method_result, dict) and "error" in method_result:
+                self.inc("steg_detector_errors_total", method=method)
+        if "cache_lookup" in result.get("timings_ms", {}):
+            self.inc("steg_cache_served_total")
+
+    def render(self, gauges=None, counters=None):
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Args:
+            gauges: Extra gauge values, by metric name, sampled at render time
+            counters: Extra counter values kept elsewhere, such as the cache
+                and pool statistics, by metric name ending in "_total"
+
+        Returns:
+            str: Metrics text
+        """
+        lines = []
+        with self._lock:
+            histograms = {stage: (list(h.counts), h.sum, h.count, h.buckets)
+                          for stage, h in self._histograms.items()}
+            registered = dict(self._counters)
+
+        lines.append("# HELP steg_stage_duration_seconds Time spent per analysis stage and detection method")
+        lines.append("# TYPE steg_stage_duration_seconds histogram")
+        for stage in sorted(histograms):
+            counts, total, count, buckets = histograms[stage]
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'steg_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'steg_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'steg_stage_duration_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'steg_stage_duration_seconds_count{{stage="{stage}"}} {count}')
+
+        seen = set()
+        sampled = {(name, ()): value for name, value in (counters or {}).items()}
+        for (name, labels), value in sorted({**registered, **sampled}.items()):
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,105 @@
+import numpy as np
+import cv2
+
+from chi_square import channel_histograms
+
+# Rows are processed in blocks of about this many bytes, small enough that
+# a block and the temporaries derived from it stay in the CPU cache while
+# every statistic is gathered from it, so the image is read from memory once
+PIXEL_STATS_BLOCK_BYTES = 1 << 20
+
+
+class PixelStatistics:
+    """Histograms and LSB counts of an RGB image, gathered in one pass.
+
+    Everything the histogram, chi-square, LSB and bit-plane detectors need
+    derives from four sets of 256-bin histograms per channel: the pixel
+    values, the values in YCrCb, and the XOR of every pixel with its right
+    and with its lower neighbour (bit b of the XOR is set where plane b
+    changes). Counts are exact integers whatever the block size.
+    """
+
+    def __init__(self, value_hists, ycrcb_hists, horizontal_xor_hists, vertical_xor_hists,
+                 height, width):
+        """
+        Args:
+            value_hists: int64 array (3, 256) of R, G and B values
+            ycrcb_hists: int64 array (3, 256) of Y, Cr and Cb values
+            horizontal_xor_hists: int64 array (3, 256) of pixel XOR right neighbour
+            vertical_xor_hists: int64 array (3, 256) of pixel XOR lower neighbour
+            height: Image height
+            width: Image width
+        """
+        self.value_hists = value_hists
+        self.ycrcb_hists = ycrcb_hists
+        self.horizontal_xor_hists = horizontal_xor_hists
+        self.vertical_xor_hists = vertical_xor_hists
+        self.height = height
+        self.width = width
+
+    @property
+    def xor_hists(self):
+        """Neighbour-XOR histograms of both directions together."""
+        return self.horizontal_xor_hists + self.vertical_xor_hists
+
+    @property
+    def pair_counts(self):
+        """Counts of the value pairs (2i, 2i + 1), shape (3, 128, 2)."""
+        return self.value_hists.reshape(3, 128, 2)
+
+    @property
+    def lsb_ones(self):
+        """Number of set LSBs in each channel."""
+        return self.value_hists[:, 1::2].sum(axis=1)
+
+    @property
+    def horizontal_lsb_transitions(self):
+        """LSB changes between horizontal neighbours in each channel."""
+        return self.horizontal_xor_hists[:, 1::2].sum(axis=1)
+
+    @property
+    def vertical_lsb_transitions(self):
+        """LSB changes between vertical neighbours in each channel."""
+        return self.vertical_xor_hists[:, 1::2].sum(axis=1)
+
+    @property
+    def lsb_transitions(self):
+        """LSB changes between horizontal and vertical neighbours in each channel."""
+        return (self.horizontal_lsb_transitions + self.vertical_lsb_transitions).astype(np.uint64)
+
+
+def pixel_statistics(strips):
+    """
+    Gather PixelStatistics from horizontal strips of an RGB image.
+
+    Each strip is read once: its value and YCrCb histograms and the XOR
+    histograms of horizontal and vertical neighbours (including the rows
+    where two strips meet) are all taken while it is in cache.
+
+    Args:
+        strips: Iterable of contiguous uint8 arrays of shape (rows, width, 3),
+            top to bottom
+
+    Returns:
+        PixelStatistics: The statistics of the whole image
+    """
+    values = np.zeros((3, 256), dtype=np.int64)
+    ycrcb = np.zeros((3, 256), dtype=np.int64)
+    horizontal = np.zeros((3, 256), dtype=np.int64)
+    vertical = np.zeros((3, 256), dtype=np.int64)
+    previous = None
+    height = width = 0
+    for strip in strips:
+        values += channel_histograms(strip)
+        ycrcb += channel_histograms(cv2.cvtColor(strip, cv2.COLOR_RGB2YCrCb))
+        if strip.shape[1] > 1:
+            horizontal += channel_histograms(cv2.bitwise_xor(strip[:, 1:], strip[:, :-1]))
+        if strip.shape[0] > 1:
+            vertical += channel_histograms(cv2.bitwise_xor(strip[1:], strip[:-1]))
+        if previous is not None:
+            vertical += channel_histograms(np.bitwise_xor(previous, strip[:1]))
+        previous = strip[-1:].copy()
+        height += strip.shape[0]
+        width = strip.shape[1]
+
+    return PixelStatistics(values, ycrcb, horizontal, vertical, height, width)
@@ -0,0 +1,243 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import cv2
+from PIL import Image
+
+from image_context import ImageContext
+from zip_ingest import sniff_image_type
+
+_HEX_DIGITS = frozenset("0123456789abcdef")
+
+
+def _fit(width, height, max_side):
+    """Size of a width x height image scaled down to fit max_side, never up."""
+    if not max_side or max(width, height) <= max_side:
+        return width, height
+    scale = max_side / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def lsb_png(image, max_side=None):
+    """
+    Encode the LSB plane of an image as a PNG.
+
+    Downscaling keeps every shown pixel's own bits (nearest neighbour),
+    since averaging would turn the noise of the plane into flat grey.
+
+    Args:
+        image: ImageContext or anything ImageContext accepts
+        max_side: Longest side of the preview in pixels, or None for full size
+
+    Returns:
+        bytes: The PNG with set bits at 255
+    """
+    context = ImageContext.coerce(image)
+    lsb = context.lsb
+    size = _fit(lsb.shape[1], lsb.shape[0], max_side)
+    if size != (lsb.shape[1], lsb.shape[0]):
+        lsb = cv2.resize(lsb, size, interpolation=cv2.INTER_NEAREST)
+    buffer = io.BytesIO()
+    Image.fromarray((lsb * 255).astype(np.uint8)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def thumbnail(data, max_side):
+    """
+    Downscale an encoded image for display.
+
+    JPEGs are decoded at a reduced DCT scale when that is enough for the
+    requested size, so large photos are never decoded in full.
+
+    Args:
+        data: The encoded image
+        max_side: Longest side of the thumbnail in pixels
+
+    Returns:
+        tuple: (encoded bytes, MIME type); JPEG for JPEG sources, PNG otherwise
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        is_jpeg = img.format == "JPEG"
+        img.draft("RGB", _fit(img.width, img.height, max_side))
+        img = img.convert("RGB" if is_jpeg else "RGBA")
+        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        if is_jpeg:
+            img.save(buffer, format="JPEG", quality=85)
+            return buffer.getvalue(), "image/jpeg"
+        img.save(buffer, format="PNG")
+        return buffer.getvalue(), "image/png"
+
+
+class PreviewStore:
+    """Uploaded images and their rendered previews, keyed on an analysis ID.
+
+    The analysis ID is the SHA-256 of the uploaded bytes, the same digest
+    the result cache uses, so uploading an image again reuses its entry.
+    Originals and previews share one least recently used memory budget;
+    previews are rendered on first request and kept until evicted. When a
+    directory is given, originals are also written there, so that every
+    server process sharing it can serve previews of any upload.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, path=None, max_disk_bytes=1024 * 1024 * 1024):
+        """
+        Create the store.
+
+        Args:
+            max_bytes: Total size of the originals and previews kept in memory
+            path: Directory shared by the server processes, or None
+            max_disk_bytes: Size above which the least recently stored
+                originals are removed from the directory
+        """
+        self.max_bytes = max_bytes
+        self.path = path
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._written = 0
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def _remember(self, key, value):
+        size = len(value[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[0])
+            self._entries[key] = value
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted[0])
+
+    def _lookup(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, data, mime_type, analysis_id=None):
+        """
+        Keep an uploaded image for later previews.
+
+        Args:
+            data: The encoded image, already identified as an image
+            mime_type: MIME type served for the original, from the decoded
+                format rather than what the client declared
+            analysis_id: SHA-256 hex digest of data, when already known
+
+        Returns:
+            str: The analysis ID
+        """
+        analysis_id = analysis_id or hashlib.sha256(data).hexdigest()
+        self._remember((analysis_id, "original", None), (bytes(data), mime_type))
+        if self.path is not None:
+            self._write(analysis_id, data)
+        return analysis_id
+
+    def _write(self, analysis_id, data):
+        target = os.path.join(self.path, analysis_id)
+        if os.path.exists(target):
+            os.utime(target)
+            return
+        # Written under a temporary name so other processes never see half a file
+        fd, scratch = tempfile.mkstemp(dir=self.path, prefix=".upload-")
+        with open(fd, "wb") as f:
+            f.write(data)
+        os.replace(scratch, target)
+        with self._lock:
+            self._written += len(data)
+            prune = self._written > self.max_disk_bytes // 8
+            if prune:
+                self._written = 0
+        if prune:
+            self._prune()
+
+    def _prune(self):
+        """Remove the oldest originals until the directory fits max_disk_bytes."""
+        files = []
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.startswith("."):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _load(self, analysis_id):
+        """Read an original stored by another process, or None."""
+        if self.path is None or len(analysis_id) != 64 or not _HEX_DIGITS.issuperset(analysis_id):
+            return None
+        try:
+            with open(os.path.join(self.path, analysis_id), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        original = (data, sniff_image_type(data[:16]) or "application/octet-stream")
+        self._remember((analysis_id, "original", None), original)
+        return original
+
+    def has(self, analysis_id):
+        """True when the original of an analysis ID is still held, in memory or in the directory."""
+        if self._lookup((analysis_id, "original", None)) is not None:
+            return True
+        return (self.path is not None and len(analysis_id) == 64 and _HEX_DIGITS.issuperset(analysis_id)
+                and os.path.exists(os.path.join(self.path, analysis_id)))
+
+    def get(self, analysis_id, kind, max_side=None):
+        """
+        Return a preview, rendering and caching it on first request.
+
+        Args:
+            analysis_id: ID returned by put
+            kind: "original" for the uploaded image or "lsb" for its LSB plane
+            max_side: Longest side in pixels, or None for full size
+
+        Returns:
+            tuple: (encoded bytes, MIME type), or None when the image is
+            unknown or has been evicted
+
+        Raises:
+            ValueError: If kind is not a known preview
+        """
+        if kind not in ("original", "lsb"):
+            raise ValueError(f"Unknown preview: {kind}")
+        key = (analysis_id, kind, max_side)
+        cached = self._lookup(key)
+        if cached is None and key[1:] == ("original", None):
+            cached = self._load(analysis_id)
+        if cached is not None:
+            return cached
+        original = self._lookup((analysis_id, "original", None)) or self._load(analysis_id)
+        if original is None:
+            return None
+
+        data = original[0]
+        if kind == "lsb":
+            preview = (lsb_png(data, max_side), "image/png")
+        else:
+            preview = thumbnail(data, max_side)
+        self._remember(key, preview)
+        return preview
+
+    def stats(self):
+        """Number of entries and bytes held."""
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size}
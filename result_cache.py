@@ -0,0 +1,181 @@
+import copy
+import json
+import multiprocessing
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """Content-addressed cache of analysis results.
+
+    Results live in a bounded in-memory LRU tier and, when a path is given,
+    in a SQLite tier shared by every process that opens the same file. The
+    hit and miss counters are shared with worker processes that receive the
+    cache at start-up.
+    """
+
+    def __init__(self, max_entries=1024, path=None, max_disk_bytes=256 * 1024 * 1024):
+        """
+        Create the cache.
+
+        Args:
+            max_entries: Number of results kept in the in-memory tier
+            path: SQLite file for the persistent tier, or None to disable it
+            max_disk_bytes: Size above which the least recently used results
+                are evicted from the persistent tier
+        """
+        self.max_entries = max_entries
+        self.path = path
+        self.max_disk_bytes = max_disk_bytes
+        self._counters = {name: multiprocessing.Value("q", 0)
+                          for name in ("memory_hits", "disk_hits", "misses")}
+        self._reset_local_state()
+
+    def _reset_local_state(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+
+    def __getstate__(self):
+        # Only the configuration and the shared counters travel to workers
+        state = self.__dict__.copy()
+        for name in ("_entries", "_lock", "_db"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset_local_state()
+
+    def worker_copy(self):
+        """
+        Return a cache for another process that shares the persistent tier
+        and the counters but starts with an empty in-memory tier.
+
+        Returns:
+            ResultCache: The worker's cache
+        """
+        return copy.copy(self)
+
+    def _connection(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            self._db.commit()
+        return self._db
+
+    def _count(self, name):
+        counter = self._counters[name]
+        with counter.get_lock():
+            counter.value += 1
+
+    @staticmethod
+    def make_key(content_hash, settings):
+        """
+        Build a cache key from the image content and the detector settings.
+
+        Args:
+            content_hash: Hex digest of the encoded image
+            settings: JSON-serialisable dict of everything that affects the result
+
+        Returns:
+            str: Cache key
+        """
+        return content_hash + ":" + json.dumps(settings, sort_keys=True, separators=(",", ":"))
+
+    def get(self, key):
+        """
+        Look up a result.
+
+        Args:
+            key: Cache key from make_key
+
+        Returns:
+            dict: A copy of the cached result, or None on a miss
+        """
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+        if result is not None:
+            self._count("memory_hits")
+            return copy.deepcopy(result)
+
+        if self.path is not None:
+            with self._lock:
+                db = self._connection()
+                row = db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+                    db.commit()
+            if row is not None:
+                result = json.loads(row[0])
+                self._remember(key, result)
+                self._count("disk_hits")
+                return copy.deepcopy(result)
+
+        self._count("misses")
+        return None
+
+    def put(self, key, result):
+        """
+        Store a result in every tier.
+
+        Args:
+            key: Cache key from make_key
+            result: JSON-serialisable analysis result
+        """
+        result = copy.deepcopy(result)
+        self._remember(key, result)
+
+        if self.path is not None:
+            value = json.dumps(result)
+            with self._lock:
+                db = self._connection()
+                db.execute("INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                           (key, value, len(value), time.time()))
+                self._evict_disk(db)
+                db.commit()
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _evict_disk(self, db):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        # Drop the least recently used rows until the tier fits again
+        excess = total - self.max_disk_bytes
+        freed = 0
+        stale = []
+        for key, size in db.execute("SELECT key, size FROM results ORDER BY accessed"):
+            stale.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        db.executemany("DELETE FROM results WHERE key = ?", stale)
+
+    def stats(self):
+        """
+        Report the cache counters.
+
+        Returns:
+            dict: Hit and miss counts and the size of the in-memory tier
+        """
+        stats = {name: counter.value for name, counter in self._counters.items()}
+        stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        stats["memory_entries"] = len(self._entries)
+        return stats
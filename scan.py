@@ -0,0 +1,346 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from functools import partial
+
+from analysis_pool import AnalysisPool
+from cover_index import CoverIndex
+from result_cache import ResultCache
+from steg_detector import SteganographyDetector, resolve_methods
+from zip_ingest import sniff_image_type
+
+
+def iter_paths(roots, files_from=None):
+    """
+    Yield the files under the given roots, and those listed in files_from.
+
+    Args:
+        roots: Files or directories to scan recursively
+        files_from: Path of a file with one path per line ("-" for stdin)
+
+    Yields:
+        str: File path
+    """
+    if files_from:
+        stream = sys.stdin if files_from == "-" else open(files_from, encoding="utf-8")
+        with stream:
+            for line in stream:
+                if line.strip():
+                    yield line.strip()
+
+    for root in roots:
+        if not os.path.isdir(root):
+            yield root
+            continue
+        stack = [root]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                # Sorted so that runs over the same tree visit files in the same order
+                for entry in sorted(entries, key=lambda e: e.name):
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        yield entry.path
+
+
+def is_image(path):
+    """Check a file's magic bytes."""
+    try:
+        with open(path, "rb") as f:
+            return sniff_image_type(f.read(16)) is not None
+    except OSError:
+        return False
+
+
+class Checkpoint:
+    """SQLite record of the files already scanned, with their size and mtime.
+
+    The size of each JSONL output at the last commit is recorded with
+    them, so a resumed scan can drop the results written after it, whose
+    files are scanned again.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS scanned (path TEXT PRIMARY KEY, size INTEGER, mtime REAL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS outputs (path TEXT PRIMARY KEY, offset INTEGER)")
+        self.db.commit()
+        self._pending = []
+
+    def is_current(self, path, size, mtime):
+        """True if the file was scanned before and has not changed since."""
+        row = self.db.execute("SELECT size, mtime FROM scanned WHERE path = ?", (path,)).fetchone()
+        return row is not None and row[0] == size and row[1] == mtime
+
+    def add(self, path, size, mtime):
+        self._pending.append((path, size, mtime))
+
+    def output_offset(self, output):
+        """Size of an output file at the last commit, or None if it was never recorded."""
+        row = self.db.execute("SELECT offset FROM outputs WHERE path = ?", (output,)).fetchone()
+        return None if row is None else row[0]
+
+    def commit(self, output=None, offset=None):
+        """
+        Persist the files added since the last commit.
+
+        Args:
+            output: Path of the output their results were written to
+            offset: Size of that output once they are written; recorded in
+                the same transaction as the files
+        """
+        self.db.executemany("INSERT OR REPLACE INTO scanned (path, size, mtime) VALUES (?, ?, ?)", self._pending)
+        if output is not None and offset is not None:
+            self.db.execute("INSERT OR REPLACE INTO outputs (path, offset) VALUES (?, ?)", (output, offset))
+        self.db.commit()
+        self._pending = []
+
+    def close(self):
+        """Close the database; files added since the last commit are not recorded."""
+        self.db.close()
+
+
+class JsonlWriter:
+    """Appends one JSON object per line."""
+
+    def __init__(self, path, resume_offset=None):
+        """
+        Args:
+            path: File to append to, or "-" for stdout
+            resume_offset: Size of the file at the last checkpoint; the
+                lines written after it are dropped
+        """
+        self.file = sys.stdout if path == "-" else open(path, "a", encoding="utf-8")
+        if resume_offset is not None and self.file is not sys.stdout and os.fstat(self.file.fileno()).st_size > resume_offset:
+            self.file.truncate(resume_offset)
+            self.file.seek(resume_offset)
+
+    def tell(self):
+        """Size of the file once flushed, or None for stdout."""
+        return None if self.file is sys.stdout else self.file.tell()
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+
+    def flush(self):
+        self.file.flush()
+        if self.file is not sys.stdout:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.flush()
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class ParquetWriter:
+    """Writes results as Parquet part files in the output directory.
+
+    Every flush writes a complete part file of its own, under a temporary
+    name that is renamed once the file is closed. An interrupted scan
+    therefore leaves only readable parts, and resumed runs never rewrite
+    the output of earlier ones.
+    """
+
+    def __init__(self, directory):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise SystemExit(f"Parquet output needs pyarrow: {e}")
+        self.pa = pa
+        self.schema = pa.schema([
+            ("path", pa.string()),
+            ("filename", pa.string()),
+            ("file_size", pa.int64()),
+            ("mtime", pa.float64()),
+            ("steganography_detected", pa.int8()),
+            ("conclusion", pa.string()),
+            ("methods_run", pa.list_(pa.string())),
+            ("detection_methods", pa.string()),
+            ("error", pa.string()),
+        ])
+        self.pq = pq
+        os.makedirs(directory, exist_ok=True)
+        self.prefix = os.path.join(directory, f"part-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+        self.parts = 0
+        self.rows = []
+
+    def write(self, record):
+        self.rows.append({
+            "path": record["path"],
+            "filename": record.get("filename"),
+            "file_size": record.get("file_size"),
+            "mtime": record.get("mtime"),
+            "steganography_detected": record.get("steganography_detected"),
+            "conclusion": record.get("conclusion"),
+            "methods_run": record.get("methods_run"),
+            "detection_methods": json.dumps(record["detection_methods"]) if "detection_methods" in record else None,
+            "error": record.get("error"),
+        })
+
+    def flush(self):
+        if not self.rows:
+            return
+        path = f"{self.prefix}-{self.parts:05d}.parquet"
+        # Dot-prefixed files are ignored by Parquet dataset readers
+        partial_path = os.path.join(os.path.dirname(path), "." + os.path.basename(path))
+        self.pq.write_table(self.pa.Table.from_pylist(self.rows, schema=self.schema), partial_path)
+        os.replace(partial_path, path)
+        self.parts += 1
+        self.rows = []
+
+    def tell(self):
+        """Parquet parts are never appended to, so there is no offset to resume from."""
+        return None
+
+    def close(self):
+        self.flush()
+
+
+def analyze_file(detector, item, methods=None, early_exit=False, frames=None):
+    """Analyze one file, and with frames every frame of it; runs inside a pool worker."""
+    path, size, mtime = item
+    result = detector.analyze_image(path, methods=methods, early_exit=early_exit)
+    if frames:
+        frame_analysis = detector.analyze_frames(path, methods=methods, early_exit=early_exit,
+                                                 stop_on_detection=(frames == "until_detected"),
+                                                 first_result=result)
+        result["frame_analysis"] = frame_analysis
+        if frame_analysis.get("steganography_detected", 0) > result.get("steganography_detected", 0):
+            result["steganography_detected"] = frame_analysis["steganography_detected"]
+            result["conclusion"] = frame_analysis["conclusion"]
+    result.update({"path": path, "mtime": mtime})
+    return result
+
+
+class Progress:
+    """Prints images/s and MB/s to stderr at a fixed interval."""
+
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self.start = self.last = time.perf_counter()
+        self.images = 0
+        self.bytes = 0
+        self.errors = 0
+        self.skipped = 0
+
+    def update(self, size, error=False):
+        self.images += 1
+        self.bytes += size
+        self.errors += error
+        now = time.perf_counter()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.report()
+
+    def report(self, final=False):
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        print(f"{'done' if final else 'progress'}: {self.images} images, {self.skipped} unchanged, "
+              f"{self.errors} errors, {self.images / elapsed:.1f} images/s, "
+              f"{self.bytes / elapsed / 1e6:.1f} MB/s", file=sys.stderr, flush=True)
+
+
+def scan(args):
+    """Run a scan described by parsed command-line arguments."""
+    detector = SteganographyDetector(cache=ResultCache(max_entries=args.cache_size) if args.cache_size else None)
+    detector.lsb_threshold = args.lsb_threshold
+    detector.chi_square_threshold = args.chi_square_threshold
+    detector.memory_budget = args.memory_budget
+    detector.cover_index = CoverIndex(args.cover_index) if args.cover_index else None
+
+    checkpoint = Checkpoint(args.checkpoint) if args.checkpoint else None
+    output = os.path.abspath(args.output)
+    if args.format == "parquet":
+        writer = ParquetWriter(args.output)
+    else:
+        writer = JsonlWriter(args.output, checkpoint.output_offset(output) if checkpoint is not None else None)
+    pool = AnalysisPool(processes=args.workers, timeout=args.timeout, detector=detector)
+    progress = Progress(args.progress_interval)
+
+    def work_items():
+        for path in iter_paths(args.paths, args.files_from):
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                print(f"skipping {path}: {e}", file=sys.stderr)
+                continue
+            if checkpoint is not None and checkpoint.is_current(path, stat.st_size, stat.st_mtime):
+                progress.skipped += 1
+                continue
+            if is_image(path):
+                yield path, stat.st_size, stat.st_mtime
+
+    def commit():
+        # Only checkpoint files whose results are safely written
+        writer.flush()
+        if checkpoint is not None:
+            checkpoint.commit(output, writer.tell())
+
+    task = partial(analyze_file, methods=args.methods, early_exit=args.early_exit, frames=args.frames)
+    written = 0
+    try:
+        # Records where this run starts appending, in case it stops before its first checkpoint
+        commit()
+        for (path, size, mtime), result in pool.map(task, work_items()):
+            result.setdefault("path", path)
+            result.setdefault("mtime", mtime)
+            writer.write(result)
+            if checkpoint is not None:
+                checkpoint.add(path, size, mtime)
+            progress.update(size, "error" in result)
+            written += 1
+            if written % args.flush_every == 0:
+                commit()
+    finally:
+        try:
+            commit()
+        finally:
+            writer.close()
+            if checkpoint is not None:
+                checkpoint.close()
+            pool.close()
+            progress.report(final=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scan image files for steganography in parallel.")
+    parser.add_argument("paths", nargs="*", help="Files or directories to scan recursively")
+    parser.add_argument("--files-from", help="File listing one path per line ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-",
+                        help="JSONL file to append to ('-' for stdout), or directory for Parquet parts")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), default="jsonl")
+    parser.add_argument("--checkpoint", help="SQLite file recording scanned files; unchanged files are skipped")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                        help="Worker processes (0 analyzes in this process)")
+    parser.add_argument("--timeout", type=float, help="Seconds allowed per image")
+    parser.add_argument("--methods", type=resolve_methods, help="Comma-separated detection methods")
+    parser.add_argument("--early-exit", action="store_true", help="Stop analyzing an image once its verdict is decided")
+    parser.add_argument("--frames", choices=("all", "until_detected"),
+                        help="Also analyze every frame of animations and multi-page TIFFs, or until one is flagged")
+    parser.add_argument("--lsb-threshold", type=float, default=SteganographyDetector().lsb_threshold)
+    parser.add_argument("--chi-square-threshold", type=float, default=SteganographyDetector().chi_square_threshold)
+    parser.add_argument("--memory-budget", type=int,
+                        help="Bytes of working memory per image; statistics are accumulated over strips to stay within it")
+    parser.add_argument("--cover-index", help="Cover index directory built by cover_index.py; images are diffed "
+                                              "against their known clean original")
+    parser.add_argument("--cache-size", type=int, default=1024, help="Results cached per worker for duplicate files (0 disables)")
+    parser.add_argument("--flush-every", type=int, default=100, help="Results written between checkpoints, and per Parquet part file")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="Seconds between throughput reports")
+    args = parser.parse_args(argv)
+    if not args.paths and not args.files_from:
+        parser.error("give at least one path or --files-from")
+    if args.format == "parquet" and args.output == "-":
+        parser.error("Parquet output needs an output directory (-o)")
+    return args
+
+
+def main(argv=None):
+    scan(parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,317 @@
 import os
+import time
+from collections import defaultdict
+from functools import partial
+from itertools import chain
 
 import numpy as np
-from PIL import Image
 import cv2
-from stegano import lsb
-import jpegio as jio
-from scipy.stats import chisquare
-import binascii
+
+from image_context import ImageContext
+from chi_square import pair_chi_square, progressive_chi_square
+from lsb_extraction import ALL_ORDERS, DEFAULT_ORDER, describe_payload, extract_payload, payload_region
+from localization import HEATMAP_BLOCK_SIZE, block_statistics
+from bitplanes import bitplane_statistics
+from tiling import strip_bytes
+from structural import rs_estimate, spa_estimate
+from dct_stats import double_compressed, f5_estimate, jsteg_estimate, outguess_estimate
+from batch_stats import histogram_features, stack_histograms, stack_lsb_counts, stack_ycrcb
+from cover_index import compare_with_cover
+
+# Detection methods by result key and method name, cheapest first; this is
+# the order analyze_image runs them in
+DETECTION_METHODS = {
+    "known_cover": "known_cover_analysis",
+    "sample_extraction": "extract_sample",
+    "lsb_analysis": "detect_lsb",
+    "histogram_analysis": "histogram_analysis",
+    "bitplane_analysis": "bitplane_analysis",
+    "chi_square": "chi_square_test",
+    "sample_pair_analysis": "sample_pair_analysis",
+    "rs_analysis": "rs_analysis",
+    "jsteg_dct_analysis": "detect_jsteg",
+    "f5_analysis": "detect_f5",
+    "outguess_analysis": "detect_outguess",
+    "chi_square_attack": "progressive_chi_square_test",
+}
+
+# Methods run when none are requested explicitly; known_cover is added
+# when the detector has a cover index. The RS and sample pair analyses,
+# like outguess and the chi-square attack, cost too much on large images
+# to run on every upload and must be asked for
+DEFAULT_METHODS = ("lsb_analysis", "chi_square", "sample_extraction", "histogram_analysis", "bitplane_analysis",
+                   "jsteg_dct_analysis", "f5_analysis")
+
+# Short names accepted for the methods, e.g. in the ?methods= query parameter
+METHOD_ALIASES = {
+    "lsb": "lsb_analysis",
+    "chi": "chi_square",
+    "sample": "sample_extraction",
+    "extract": "sample_extraction",
+    "histogram": "histogram_analysis",
+    "hist": "histogram_analysis",
+    "jsteg": "jsteg_dct_analysis",
+    "dct": "jsteg_dct_analysis",
+    "progressive_chi_square": "chi_square_attack",
+    "spa": "sample_pair_analysis",
+    "rs": "rs_analysis",
+    "bitplane": "bitplane_analysis",
+    "bitplanes": "bitplane_analysis",
+    "f5": "f5_analysis",
+    "outguess": "outguess_analysis",
+    "cover": "known_cover",
+}
+
+# Number of positive detections for a "High probability" verdict
+HIGH_PROBABILITY_VOTES = 2
+
+# Methods analyze_batch computes for a whole stack of same-size images at once
+BATCHED_METHODS = {
+    "lsb_analysis": "_batch_lsb",
+    "histogram_analysis": "_batch_histogram",
+    "chi_square": "_batch_chi_square",
+}
+
+def resolve_methods(names=None):
+    """
+    Turn requested method names into result keys in execution order.
+    
+    Args:
+        names: Iterable of method names or aliases, or a comma-separated
+            string; None selects DEFAULT_METHODS
+        
+    Returns:
+        tuple: Result keys of the selected methods, cheapest first
+        
+    Raises:
+        ValueError: If a name is not a known method
+    """
+    if names is None:
+        names = DEFAULT_METHODS
+    elif isinstance(names, str):
+        names = [name for name in names.split(",") if name.strip()]
+    
+    selected = set()
+    for name in names:
+        key = METHOD_ALIASES.get(name.strip(), name.strip())
+        if key not in DETECTION_METHODS:
+            raise ValueError(f"Unknown detection method: {name}")
+        selected.add(key)
+    return tuple(key for key in DETECTION_METHODS if key in selected)
+
+def finite_or_none(value):
+    """A statistic as a float for JSON output, with NaN and infinities as None."""
+    return float(value) if np.isfinite(value) else None
+
+def analyze_frame(detector, frame, methods=None, early_exit=False):
+    """Analyze one frame of an animation; runs inside a pool worker."""
+    return detector.analyze_image(frame, methods=methods, early_exit=early_exit)
 
 class SteganographyDetector:
     """Class for detecting steganography in images using various techniques."""
     
-    def __init__(self):
-        """Initialize the detector with default thresholds."""
-        self.lsb_threshold = 0.3
+    def __init__(self, cache=None):
+        """
+        Initialize the detector with default thresholds.
+        
+        Args:
+            cache: Optional ResultCache used by analyze_image
+        """
+        # LSB analysis fires only on nearly constant LSB planes, which have
+        # few neighbour transitions; random LSBs score about 0.25
+        self.lsb_threshold = 0.02
         self.chi_square_threshold = 0.1
+        self.max_sample_bytes = 1024
+        # Estimated fraction of samples carrying payload above which the RS
+        # and sample pair analyses report hidden data
+        self.embedding_rate_threshold = 0.05
+        # Thresholds of the JPEG detectors: JSteg embedding rate, share of
+        # coefficients changed by F5 and OutGuess pair imbalance
+        self.dct_embedding_rate_threshold = 0.1
+        self.f5_threshold = 0.1
+        self.outguess_threshold = 0.03
+        # Pairs-of-values p-value above which a bit plane counts as embedded
+        self.bitplane_p_threshold = 0.5
+        # Side in pixels of the blocks that localize reports statistics for
+        self.heatmap_block_size = HEATMAP_BLOCK_SIZE
+        # Bytes of working memory for the LSB, histogram and chi-square
+        # statistics; when set they are accumulated over horizontal strips
+        # (with identical results) instead of over the whole image at once
+        self.memory_budget = None
+        # CoverIndex of known clean originals that known_cover diffs images
+        # against, and the highest bit plane (0 is the LSB) that changes to
+        # a cover may be confined to for them to count as embedding
+        self.cover_index = None
+        self.cover_max_bit_plane = 1
+        self.cache = cache
+    
+    def settings(self, methods=DEFAULT_METHODS, early_exit=False):
+        """
+        Everything besides the image content that affects analyze_image.
+        
+        Args:
+            methods: Result keys of the methods that will run
+            early_exit: Whether analysis stops once the verdict is decided
+        
+        Returns:
+            dict: Detector settings
+        """
+        return {
+            "lsb_threshold": self.lsb_threshold,
+            "chi_square_threshold": self.chi_square_threshold,
+            "max_sample_bytes": self.max_sample_bytes,
+            "embedding_rate_threshold": self.embedding_rate_threshold,
+            "dct_embedding_rate_threshold": self.dct_embedding_rate_threshold,
+            "f5_threshold": self.f5_threshold,
+            "outguess_threshold": self.outguess_threshold,
+            "bitplane_p_threshold": self.bitplane_p_threshold,
+            "cover_index": None if self.cover_index is None else self.cover_index.version,
+            "cover_max_bit_plane": self.cover_max_bit_plane,
+            "methods": sorted(methods),
+            "early_exit": early_exit,
+        }
+    
+    def warm_up(self):
+        """
+        Run every detection method once on small synthetic PNG and JPEG images.
+        
+        This loads the libraries the detectors import on first use and
+        builds their lookup tables, so the first real image is not slowed
+        down. A server calls it before forking its workers, which then
+        share the result.
         
-    def analyze_image(self, image_path):
+        Returns:
+            float: Seconds taken
+        """
+        start = time.perf_counter()
+        pixels = np.random.default_rng(0).integers(0, 256, (64, 64, 3), dtype=np.uint8)
+        cache, self.cache = self.cache, None
+        try:
+            for extension in (".png", ".jpg"):
+                context = ImageContext(cv2.imencode(extension, pixels)[1].tobytes())
+                self.analyze_image(context, methods=tuple(DETECTION_METHODS))
+                self.localize(context)
+        finally:
+            self.cache = cache
+        return time.perf_counter() - start
+    
+    def _resolve_methods(self, methods):
+        """resolve_methods, with known_cover among the defaults when there is a cover index."""
+        if methods is None and self.cover_index is not None:
+            methods = DEFAULT_METHODS + ("known_cover",)
+        return resolve_methods(methods)
+    
+    def _pixel_statistics(self, context):
+        """Single-pass statistics of the image, read in strips within the memory budget if one is set."""
+        if self.memory_budget is None:
+            return context.pixel_statistics()
+        return context.pixel_statistics(strip_bytes(self.memory_budget))
+    
+    def analyze_image(self, image_path, methods=None, early_exit=False, timings=False):
         """
         Analyze an image using multiple detection techniques.
         
+        The image is decoded once and the decoded views are shared by all
+        detection methods. Methods run cheapest first; with early_exit the
+        remaining ones are skipped as soon as enough of them have fired for
+        the verdict to be final. When the detector has a cache, images whose
+        content has been analyzed before with the same settings are answered
+        from it without being decoded.
+        
         Args:
-            image_path: Path to the image file
+            image_path: Path to the image file or an ImageContext
+            methods: Method names or aliases to run (defaults to DEFAULT_METHODS)
+            early_exit: Skip the remaining methods once the verdict cannot change
+            timings: Add a timings_ms block with the time spent decoding and
+                in each method (method times exclude the decoding they trigger)
             
         Returns:
             dict: Results of various detection methods
         """
-        results = {
-            "filename": os.path.basename(image_path),
-            "file_size": os.path.getsize(image_path),
-            "detection_methods": {}
-        }
+        start = time.perf_counter()
+        methods = self._resolve_methods(methods)
+        context = ImageContext.coerce(image_path)
+        elapsed = {}
         
-        # Run different detection methods
-        results["detection_methods"]["lsb_analysis"] = self.detect_lsb(image_path)
-        results["detection_methods"]["chi_square"] = self.chi_square_test(image_path)
-        results["detection_methods"]["sample_extraction"] = self.extract_sample(image_path)
-        results["detection_methods"]["histogram_analysis"] = self.histogram_analysis(image_path)
-        results["detection_methods"]["jsteg_dct_analysis"] = self.detect_jsteg(image_path)
-
+        cache_key, cached = self._cache_lookup(context, methods, early_exit)
+        if cached is not None:
+            if timings:
+                elapsed["cache_lookup"] = time.perf_counter() - start
+                elapsed["total"] = elapsed["cache_lookup"]
+                cached["timings_ms"] = {stage: seconds * 1000 for stage, seconds in elapsed.items()}
+            return cached
+        
+        results = self._new_result(context)
+        
+        # Run the selected detection methods, cheapest first
+        positive_detections = 0
+        for name in methods:
+            if early_exit and (positive_detections >= HIGH_PROBABILITY_VOTES or self._cover_verdict(results) is not None):
+                results["methods_skipped"].append(name)
+                continue
+            decoding = sum(context.timings.values())
+            method_start = time.perf_counter()
+            result = getattr(self, DETECTION_METHODS[name])(context)
+            elapsed[name] = time.perf_counter() - method_start - (sum(context.timings.values()) - decoding)
+            results["detection_methods"][name] = result
+            results["methods_run"].append(name)
+            if isinstance(result, dict) and result.get("detected", False):
+                positive_detections += 1
+        
+        self._conclude(results, positive_detections)
+        
+        if cache_key is not None:
+            self.cache.put(cache_key, results)
         
-        # Determine overall likelihood of steganography
-        positive_detections = sum(1 for method, result in results["detection_methods"].items() 
-                                if isinstance(result, dict) and result.get("detected", False))
+        if timings:
+            elapsed.update(context.timings)
+            elapsed["total"] = time.perf_counter() - start
+            results["timings_ms"] = {stage: seconds * 1000 for stage, seconds in elapsed.items()}
+            
+        return results
+    
+    def _cache_lookup(self, context, methods, early_exit):
+        """
+        Look an image up in the cache.
         
-        if positive_detections >= 2:
+        Returns:
+            tuple: (cache_key, cached_result); the key is None without a
+            cache and the result is None on a miss
+        """
+        if self.cache is None:
+            return None, None
+        cache_key = self.cache.make_key(context.content_hash, self.settings(methods, early_exit))
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            cached["filename"] = context.filename
+        return cache_key, cached
+    
+    @staticmethod
+    def _new_result(context):
+        return {
+            "filename": context.filename,
+            "file_size": context.file_size,
+            "detection_methods": {},
+            "methods_run": [],
+            "methods_skipped": []
+        }
+    
+    @staticmethod
+    def _cover_verdict(results):
+        """True or False once a known cover has settled the verdict, otherwise None."""
+        cover = results["detection_methods"].get("known_cover")
+        if isinstance(cover, dict) and cover.get("decisive"):
+            return bool(cover["detected"])
+        return None
+    
+    @classmethod
+    def _conclude(cls, results, positive_detections):
+        """Determine overall likelihood of steganography from the positive detections."""
+        cover_verdict = cls._cover_verdict(results)
+        if cover_verdict is not None:
+            # A diff against the clean original outweighs the statistics
+            positive_detections = HIGH_PROBABILITY_VOTES if cover_verdict else 0
+        if positive_detections >= HIGH_PROBABILITY_VOTES:
             results["conclusion"] = "High probability of hidden data"
             results["steganography_detected"] = 2
         elif positive_detections == 1:
@@ -53,229 +320,690 @@ class SteganographyDetector:
         else:
             results["conclusion"] = "No hidden data detected"
             results["steganography_detected"] = 0
+    
+    def analyze_frames(self, image_path, methods=None, early_exit=False, stop_on_detection=False, pool=None,
+                       first_result=None):
+        """
+        Analyze every frame of an animated GIF, APNG or WebP, or every page of a TIFF.
+        
+        Frames are decoded one at a time as the analysis reaches them. With
+        a pool they are fanned out to its worker processes, which keeps at
+        most its max_pending frames in flight.
+        
+        Args:
+            image_path: Path to the image file or an ImageContext
+            methods: Method names or aliases to run (defaults to DEFAULT_METHODS)
+            early_exit: Skip the remaining methods of a frame once its verdict cannot change
+            stop_on_detection: Stop at the first frame with hidden data
+            pool: AnalysisPool to analyze the frames in, or None to analyze
+                them in this process
+            first_result: Result of analyze_image for the image itself, which
+                is taken as the verdict of frame 0 instead of analyzing that
+                frame again
             
+        Returns:
+            dict: The verdict of each frame and the overall verdict, the
+            worst over the frames, with the indices of flagged frames
+        """
+        context = ImageContext.coerce(image_path)
+        frames = context.frames(start=0 if first_result is None else 1)
+        if pool is None:
+            frame_results = (analyze_frame(self, frame, methods, early_exit) for frame in frames)
+        else:
+            task = partial(analyze_frame, methods=methods, early_exit=early_exit)
+            frame_results = (result for _, result in pool.map(task, frames))
+        results = frame_results if first_result is None else chain((first_result,), frame_results)
+        
+        verdicts = []
+        stopped_early = False
+        try:
+            for index, result in enumerate(results):
+                if "error" in result:
+                    verdicts.append({"frame": index, "error": result["error"]})
+                    continue
+                verdicts.append({
+                    "frame": index,
+                    "steganography_detected": result["steganography_detected"],
+                    "conclusion": result["conclusion"],
+                    "detected_by": [name for name, method in result["detection_methods"].items()
+                                    if isinstance(method, dict) and method.get("detected", False)],
+                })
+                if stop_on_detection and result["steganography_detected"]:
+                    stopped_early = True
+                    break
+        except Exception as e:
+            if not verdicts:
+                return {"filename": context.filename, "error": str(e)}
+            verdicts.append({"frame": len(verdicts), "error": f"Could not decode frame: {e}"})
+        finally:
+            frame_results.close()
+            frames.close()
+        
+        flagged = [verdict["frame"] for verdict in verdicts if verdict.get("steganography_detected")]
+        worst = max(verdicts, key=lambda verdict: verdict.get("steganography_detected", -1), default=None)
+        analyzed = [verdict for verdict in verdicts if "error" not in verdict]
+        return {
+            "filename": context.filename,
+            "frames_analyzed": len(verdicts),
+            "stopped_early": stopped_early,
+            "flagged_frames": flagged,
+            "steganography_detected": max((verdict["steganography_detected"] for verdict in analyzed), default=0),
+            "conclusion": (f"{worst['conclusion']} in {len(flagged)} of {len(verdicts)} frames" if flagged
+                           else f"No hidden data detected in {len(analyzed)} frames"),
+            "frames": verdicts,
+        }
+    
+    def analyze_batch(self, images, methods=None, early_exit=False, max_batch_bytes=64 * 1024 * 1024):
+        """
+        Analyze many images, stacking same-size images into one array.
+        
+        The LSB, histogram and chi-square statistics of each group of
+        same-size images are computed by single vectorized calls on the
+        stacked pixels and then split back into per-image results; the
+        other methods run image by image. Results match analyze_image field
+        for field. Images that cannot be decoded, and all images in tiled
+        mode, take the per-image path.
+        
+        Args:
+            images: Iterable of anything analyze_image accepts
+            methods: Method names or aliases to run (defaults to DEFAULT_METHODS)
+            early_exit: Skip the remaining methods of an image once its verdict cannot change
+            max_batch_bytes: Maximum size of one stacked array
+            
+        Returns:
+            list: Result dicts, in the order of the images
+        """
+        methods = self._resolve_methods(methods)
+        contexts = [ImageContext.coerce(image) for image in images]
+        results = [None] * len(contexts)
+        cache_keys = [None] * len(contexts)
+        
+        # Group the images that need analysis by size and channel count
+        groups = defaultdict(list)
+        for i, context in enumerate(contexts):
+            cache_keys[i], results[i] = self._cache_lookup(context, methods, early_exit)
+            if results[i] is not None:
+                cache_keys[i] = None
+                continue
+            try:
+                key = (context.rgb.shape, context.ndim) if self.memory_budget is None else None
+            except Exception:
+                key = None
+            if key is None:
+                results[i] = self._analyze_group([context], None, methods, early_exit)[0]
+            else:
+                groups[key].append(i)
+        
+        for (shape, _), indices in groups.items():
+            per_batch = max(1, max_batch_bytes // int(np.prod(shape)))
+            for first in range(0, len(indices), per_batch):
+                batch = indices[first:first + per_batch]
+                stack = np.stack([contexts[i].rgb for i in batch])
+                batch_results = self._analyze_group([contexts[i] for i in batch], stack, methods, early_exit)
+                for i, result in zip(batch, batch_results):
+                    results[i] = result
+        
+        for cache_key, result in zip(cache_keys, results):
+            if cache_key is not None:
+                self.cache.put(cache_key, result)
         return results
     
+    def _analyze_group(self, contexts, stack, methods, early_exit):
+        """
+        Run the selected methods on images of the same size.
+        
+        Args:
+            contexts: ImageContexts of the images
+            stack: Their stacked RGB pixels, or None to run every method per image
+            methods: Result keys of the methods to run, cheapest first
+            early_exit: Skip the remaining methods of an image once its verdict cannot change
+            
+        Returns:
+            list: Result dicts, in the order of the contexts
+        """
+        results = [self._new_result(context) for context in contexts]
+        positive_detections = [0] * len(contexts)
+        
+        for name in methods:
+            active = []
+            for i, result in enumerate(results):
+                if early_exit and (positive_detections[i] >= HIGH_PROBABILITY_VOTES
+                                   or self._cover_verdict(result) is not None):
+                    result["methods_skipped"].append(name)
+                else:
+                    active.append(i)
+            if not active:
+                continue
+            
+            method_results = None
+            if stack is not None and name in BATCHED_METHODS:
+                active_stack = stack if len(active) == len(contexts) else stack[active]
+                try:
+                    method_results = getattr(self, BATCHED_METHODS[name])([contexts[i] for i in active], active_stack)
+                except Exception:
+                    # The per-image path reports the error for each image
+                    method_results = None
+            if method_results is None:
+                method_results = [getattr(self, DETECTION_METHODS[name])(contexts[i]) for i in active]
+            
+            for i, result in zip(active, method_results):
+                results[i]["detection_methods"][name] = result
+                results[i]["methods_run"].append(name)
+                if isinstance(result, dict) and result.get("detected", False):
+                    positive_detections[i] += 1
+        
+        for result, positives in zip(results, positive_detections):
+            self._conclude(result, positives)
+        return results
+    
+    def _batch_lsb(self, contexts, stack):
+        if contexts[0].ndim < 3:
+            # Grayscale images are reported as such by detect_lsb
+            return None
+        transitions, ones = stack_lsb_counts(stack)
+        height, width = stack.shape[1:3]
+        return [self._lsb_result(t, o, height, width) for t, o in zip(transitions, ones)]
+    
+    def _batch_histogram(self, contexts, stack):
+        # BGR channel order, as histogram_analysis reads it
+        features = histogram_features(stack_histograms(stack)[:, ::-1])
+        return [self._histogram_result(*image_features) for image_features in zip(*features)]
+    
+    def _batch_chi_square(self, contexts, stack):
+        chi_square_results = pair_chi_square(stack_histograms(stack_ycrcb(stack)))
+        return [self._chi_square_result(image_results) for image_results in chi_square_results]
+    
+    def known_cover_analysis(self, image_path):
+        """
+        Diff an image against its clean original from the cover index.
+        
+        Changes confined to the lowest bit planes of a known cover are what
+        LSB embedding leaves behind, and the diff shows exactly which pixels
+        and bits were altered; an image identical to its cover is clean.
+        Either way the result is decisive and settles the verdict. Other
+        differences, such as re-encoding or resizing the cover, are reported
+        but left to the statistical methods.
+        
+        Args:
+            image_path: Path to the image file or an ImageContext
+        
+        Returns:
+            dict: Detection results, with the matched cover and the diff
+        """
+        try:
+            if self.cover_index is None:
+                return {"detected": False, "decisive": False, "reason": "No cover index configured"}
+            
+            context = ImageContext.coerce(image_path)
+            match = self.cover_index.lookup(context)
+            if match is None:
+                return {"detected": False, "decisive": False, "cover_found": False}
+            
+            comparison = compare_with_cover(context, match["path"])
+            result = {"cover_found": True, "cover": match, **comparison}
+            if not comparison["comparable"]:
+                result.update(detected=False, decisive=False)
+                return result
+            
+            high_planes = sum(comparison["bits_changed_by_plane"][self.cover_max_bit_plane + 1:])
+            detected = comparison["bits_changed"] > 0 and high_planes == 0
+            result.update(
+                detected=detected,
+                decisive=detected or comparison["bits_changed"] == 0,
+                confidence=1.0 if detected else 0.0,
+            )
+            return result
+        
+        except Exception as e:
+            return {"detected": False, "error": str(e)}
+    
     def detect_lsb(self, image_path):
         """
         Detect LSB (Least Significant Bit) steganography.
         
         Args:
-            image_path: Path to the image file
+            image_path: Path to the image file or an ImageContext
             
         Returns:
             dict: Detection results
         """
         try:
-            # Open image and convert to numpy array
-            img = Image.open(image_path)
-            img_array = np.array(img)
+            context = ImageContext.coerce(image_path)
             
             # Check if image has enough channels for analysis
-            if len(img_array.shape) < 3:
+            if context.ndim < 3:
                 return {"detected": False, "reason": "Grayscale image, insufficient channels for LSB analysis"}
             
-            # Extract LSB from each channel
-            lsb_patterns = []
-            for channel in range(min(3, img_array.shape[2])):  # Analyze up to 3 channels
-                channel_data = img_array[:, :, channel]
-                lsb_data = channel_data % 2  # Get LSB
-                lsb_patterns.append(lsb_data)
-            
-            # Calculate randomness score (0 = perfectly random, 1 = perfectly uniform)
-            randomness_scores = []
-            for lsb_pattern in lsb_patterns:
-                # Count transitions (0->1 or 1->0)
-                transitions = np.sum(np.abs(np.diff(lsb_pattern, axis=1))) + np.sum(np.abs(np.diff(lsb_pattern, axis=0)))
-                max_transitions = 2 * lsb_pattern.size - lsb_pattern.shape[0] - lsb_pattern.shape[1]
-                randomness = transitions / max_transitions if max_transitions > 0 else 0
-                randomness_scores.append(randomness)
-            
-            avg_randomness = sum(randomness_scores) / len(randomness_scores)
-            
-            # Calculate bit distribution (should be close to 50% for each bit value in random data)
-            bit_distributions = []
-            for lsb_pattern in lsb_patterns:
-                ones_ratio = np.sum(lsb_pattern) / lsb_pattern.size
-                bit_distributions.append(abs(ones_ratio - 0.5))
-            
-            avg_bit_distribution = sum(bit_distributions) / len(bit_distributions)
-            
-            # Combine metrics for final score
-            lsb_score = (avg_randomness + avg_bit_distribution) / 2
+            # LSB transitions and set bits of each channel, from the shared statistics
+            stats = self._pixel_statistics(context)
+            return self._lsb_result(stats.lsb_transitions, stats.lsb_ones.astype(np.uint64), stats.height, stats.width)
+            
+        except Exception as e:
+            return {"detected": False, "error": str(e)}
+    
+    def _lsb_result(self, transitions, ones, height, width):
+        """
+        Score LSB statistics gathered by detect_lsb or analyze_batch.
+        
+        Args:
+            transitions: LSB transition count of each channel
+            ones: Number of set LSBs in each channel
+            height: Image height
+            width: Image width
+            
+        Returns:
+            dict: Detection results
+        """
+        # Calculate randomness score (0 = perfectly random, 1 = perfectly uniform)
+        # from the transitions (0->1 or 1->0) of each channel
+        max_transitions = 2 * height * width - height - width
+        randomness_scores = [channel_transitions / max_transitions if max_transitions > 0 else 0
+                             for channel_transitions in transitions]
+        
+        avg_randomness = sum(randomness_scores) / len(randomness_scores)
+        
+        # Calculate bit distribution (should be close to 50% for each bit value in random data)
+        bit_distributions = [abs(channel_ones / (height * width) - 0.5) for channel_ones in ones]
+        
+        avg_bit_distribution = sum(bit_distributions) / len(bit_distributions)
+        
+        # Combine metrics for final score
+        lsb_score = (avg_randomness + avg_bit_distribution) / 2
 
-            # compute the confidence score
-            confidence_score = max(1 - (lsb_score / self.lsb_threshold), 0)
+        # compute the confidence score
+        confidence_score = max(1 - (lsb_score / self.lsb_threshold), 0)
 
+        
+        return {
+            "detected": bool(confidence_score > 0.5),
+            "confidence": confidence_score,
+            "randomness_score": avg_randomness.item(),
+            "bit_distribution_score": avg_bit_distribution.item(),
+            "details": "LSB patterns show signs of non-random data" if lsb_score < self.lsb_threshold else "LSB patterns appear random"
+        }
+        
+    def bitplane_analysis(self, image_path):
+        """
+        Sweep all eight bit planes of every colour channel for embedded data.
+        
+        Args:
+            image_path: Path to the image file or an ImageContext
+            
+        Returns:
+            dict: Detection results with a per-plane score table
+        """
+        try:
+            context = ImageContext.coerce(image_path)
+            
+            pixel_stats = self._pixel_statistics(context)
+            stats = bitplane_statistics(pixel_stats.value_hists, pixel_stats.xor_hists,
+                                        pixel_stats.height, pixel_stats.width)
+            p_values = stats["p_value"]
+            
+            # Smooth or flat histograms equalise the pairs of several adjacent
+            # planes at once; embedding in one plane leaves its neighbours alone
+            equalised = np.nan_to_num(p_values) > self.bitplane_p_threshold
+            neighbours = np.zeros_like(equalised)
+            neighbours[:, 1:] |= equalised[:, :-1]
+            neighbours[:, :-1] |= equalised[:, 1:]
+            scores = np.where(neighbours, 0.0, np.nan_to_num(p_values))
+            suspicious = [f"{'RGB'[channel]}{bit}" for channel, bit in zip(*np.nonzero(scores > self.bitplane_p_threshold))]
+            confidence_score = float(scores.max())
             
             return {
-                "detected": bool(confidence_score > 0.5),
+                "detected": bool(suspicious),
                 "confidence": confidence_score,
-                "randomness_score": avg_randomness.item(),
-                "bit_distribution_score": avg_bit_distribution.item(),
-                "details": "LSB patterns show signs of non-random data" if lsb_score < self.lsb_threshold else "LSB patterns appear random"
+                "suspicious_planes": suspicious,
+                "planes": {
+                    "channels": ["R", "G", "B"],
+                    "randomness": np.round(stats["randomness"], 4).tolist(),
+                    "ones_ratio": np.round(stats["ones_ratio"], 4).tolist(),
+                    "p_value": [[finite_or_none(p) for p in row] for row in np.round(p_values, 4)],
+                },
+                "details": f"Bit planes {', '.join(suspicious)} show equalised value pairs" if suspicious else "No bit plane shows signs of embedding"
             }
             
         except Exception as e:
             return {"detected": False, "error": str(e)}
+    
+    def rs_analysis(self, image_path):
+        """
+        Estimate the LSB embedding rate with RS (Regular/Singular groups) analysis.
         
+        Args:
+            image_path: Path to the image file or an ImageContext
+            
+        Returns:
+            dict: Detection results with the estimated embedding rate
+        """
+        try:
+            context = ImageContext.coerce(image_path)
+            estimate = rs_estimate(self._structural_samples(context))
+            result = self._embedding_rate_result(estimate["rates"], "RS analysis")
+            result["regular_groups"] = [finite_or_none(fraction) for fraction in estimate["regular"]]
+            result["singular_groups"] = [finite_or_none(fraction) for fraction in estimate["singular"]]
+            return result
+            
+        except Exception as e:
+            return {"detected": False, "error": str(e)}
+    
+    def sample_pair_analysis(self, image_path):
+        """
+        Estimate the LSB embedding rate with Sample Pair Analysis.
+        
+        Args:
+            image_path: Path to the image file or an ImageContext
+            
+        Returns:
+            dict: Detection results with the estimated embedding rate
+        """
+        try:
+            context = ImageContext.coerce(image_path)
+            estimate = spa_estimate(self._structural_samples(context))
+            return self._embedding_rate_result(estimate["rates"], "Sample pair analysis")
+            
+        except Exception as e:
+            return {"detected": False, "error": str(e)}
+    
+    @staticmethod
+    def _structural_samples(context):
+        # Greyscale images are analyzed as they are; palette and other
+        # single-channel modes through their RGB view
+        return context.pixels if context.mode == "L" else context.rgb
+    
+    def _embedding_rate_result(self, rates, method_name):
+        """
+        Turn per-channel embedding rate estimates into a detection result.
+        
+        Args:
+            rates: Estimated rate of each channel (NaN where undetermined)
+            method_name: Name used in the details message
+            
+        Returns:
+            dict: Detection results
+        """
+        channel_rates = [finite_or_none(rate) for rate in rates]
+        usable = [rate for rate in channel_rates if rate is not None]
+        if not usable:
+            return {
+                "detected": False,
+                "confidence": 0,
+                "embedding_rate": None,
+                "channel_rates": channel_rates,
+                "details": f"{method_name} cannot estimate a payload for this image"
+            }
+        
+        embedding_rate = min(max(sum(usable) / len(usable), 0.0), 1.0)
+        confidence_score = min(embedding_rate / (2 * self.embedding_rate_threshold), 1.0)
+        
+        return {
+            "detected": bool(confidence_score > 0.5),
+            "confidence": confidence_score,
+            "embedding_rate": embedding_rate,
+            "channel_rates": channel_rates,
+            "details": f"{method_name} estimates that {embedding_rate:.1%} of samples carry hidden data" if embedding_rate > self.embedding_rate_threshold else f"{method_name} finds no significant LSB embedding"
+        }
+    
     def detect_jsteg(self, image_path):
         """
-        Detect potential JSteg steganography by analyzing DCT coefficients in JPEG images.
+        Estimate the JSteg embedding rate from the DCT coefficients of all JPEG components.
 
         Args:
-            image_path: Path to JPEG image file
+            image_path: Path to JPEG image file or an ImageContext
             
         Returns:
             dict: Detection results
         """
         try:
-            if not image_path.lower().endswith(".jpg") and not image_path.lower().endswith(".jpeg"):
+            context = ImageContext.coerce(image_path)
+            if not context.is_jpeg:
                 return {"detected": False, "reason": "Not a JPEG image"}
             
-            jpeg = jio.read(image_path)
-            coeffs = jpeg.coef_arrays[0]  # Y channel DCT coefficients
-            quant = jpeg.quant_tables[0]  # Quantization table
-
-            # Flatten the 2D blocks to 1D array of non-zero AC coefficients
-            non_zero_ac_coeffs = coeffs[(coeffs != 0) & (coeffs != coeffs[0, 0])].flatten()
-            
-            if len(non_zero_ac_coeffs) == 0:
+            estimate = jsteg_estimate(context.dct_histograms)
+            if not np.isfinite(estimate["rate"]):
                 return {"detected": False, "reason": "No valid AC coefficients to analyze"}
-
-            lsb_values = np.abs(non_zero_ac_coeffs) % 2
-            ones = np.sum(lsb_values)
-            zeros = len(lsb_values) - ones
-
-            # Expected uniform distribution
-            expected = [len(lsb_values) / 2] * 2
-            chi_stat, p_value = chisquare([zeros, ones], f_exp=expected)
-
-            detected = p_value < 0.05
+            
+            embedding_rate = min(max(estimate["rate"], 0.0), 1.0)
+            confidence_score = min(embedding_rate / (2 * self.dct_embedding_rate_threshold), 1.0)
+            detected = confidence_score > 0.5
             return {
-                "detected": detected,
-                "p_value": p_value,
-                "ones_ratio": ones / len(lsb_values),
-                "details": "LSB of AC DCT coefficients show non-uniform distribution" if detected else "No strong sign of manipulation in DCT LSBs"
+                "detected": bool(detected),
+                "confidence": confidence_score,
+                "embedding_rate": embedding_rate,
+                "component_rates": [finite_or_none(rate) for rate in estimate["component_rates"]],
+                "p_value": finite_or_none(estimate["p_value"]),
+                "ones_ratio": finite_or_none(estimate["ones_ratio"]),
+                "details": f"DCT histogram asymmetry suggests JSteg in {embedding_rate:.1%} of usable coefficients" if detected else "No strong sign of manipulation in DCT LSBs"
             }
 
         except Exception as e:
             return {"detected": False, "error": str(e)}
     
+    def detect_f5(self, image_path):
+        """
+        Estimate the share of luminance AC coefficients changed by F5.
+        
+        Args:
+            image_path: Path to JPEG image file or an ImageContext
+            
+        Returns:
+            dict: Detection results
+        """
+        try:
+            context = ImageContext.coerce(image_path)
+            if not context.is_jpeg:
+                return {"detected": False, "reason": "Not a JPEG image"}
+            
+            estimate = f5_estimate(context.dct_histograms[0], context.calibrated_dct_histograms)
+            if not np.isfinite(estimate["beta"]):
+                return {"detected": False, "reason": "Too few low-frequency coefficients to analyze"}
+            if double_compressed(context.dct_histograms[0], context.calibrated_dct_histograms):
+                return self._double_compressed_result()
+            
+            beta = min(max(estimate["beta"], 0.0), 1.0)
+            confidence_score = min(beta / (2 * self.f5_threshold), 1.0)
+            detected = confidence_score > 0.5
+            return {
+                "detected": bool(detected),
+                "confidence": confidence_score,
+                "beta": beta,
+                "mode_betas": [finite_or_none(beta) for beta in estimate["mode_betas"]],
+                "details": f"Coefficient shrinkage suggests F5 changed {beta:.1%} of non-zero AC coefficients" if detected else "No sign of F5 coefficient shrinkage"
+            }
+            
+        except Exception as e:
+            return {"detected": False, "error": str(e)}
+    
+    def detect_outguess(self, image_path):
+        """
+        Detect OutGuess-style embedding with histogram corrections in JPEG images.
+        
+        Args:
+            image_path: Path to JPEG image file or an ImageContext
+            
+        Returns:
+            dict: Detection results
+        """
+        try:
+            context = ImageContext.coerce(image_path)
+            if not context.is_jpeg:
+                return {"detected": False, "reason": "Not a JPEG image"}
+            
+            estimate = outguess_estimate(context.dct_histograms[0], context.calibrated_dct_histograms)
+            if not estimate["pairs"]:
+                return {"detected": False, "reason": "Too few low-frequency coefficients to analyze"}
+            if double_compressed(context.dct_histograms[0], context.calibrated_dct_histograms):
+                return self._double_compressed_result()
+            
+            imbalance = estimate["imbalance"]
+            confidence_score = min(max(imbalance, 0.0) / (2 * self.outguess_threshold), 1.0)
+            detected = confidence_score > 0.5
+            return {
+                "detected": bool(detected),
+                "confidence": confidence_score,
+                "pair_imbalance": imbalance,
+                "pairs": estimate["pairs"],
+                "details": "Low-frequency coefficient pairs deviate from the calibrated cover" if detected else "Coefficient pairs match the calibrated cover"
+            }
+            
+        except Exception as e:
+            return {"detected": False, "error": str(e)}
+    
+    @staticmethod
+    def _double_compressed_result():
+        # Calibration cannot estimate the cover of a recompressed JPEG
+        return {
+            "detected": False,
+            "confidence": 0,
+            "double_compressed": True,
+            "details": "Image appears double-compressed; calibration is unreliable"
+        }
+    
     def chi_square_test(self, image_path):
         """
         Perform chi-square test to detect steganography.
         
         Args:
-            image_path: Path to the image file
+            image_path: Path to the image file or an ImageContext
             
         Returns:
             dict: Detection results
         """
         try:
-            # Open image with OpenCV for better histogram analysis
-            img = cv2.imread(image_path)
-            if img is None:
-                return {"detected": False, "reason": "Unable to read image with OpenCV"}
-            
-            # Convert to YCrCb color space which is better for steganography detection
-            if len(img.shape) == 3 and img.shape[2] == 3:
-                img_ycrcb = cv2.cvtColor(img, cv2.COLOR_BGR2YCrCb)
-                channels = cv2.split(img_ycrcb)
-            else:
-                channels = [img]  # Grayscale image
-            
-            chi_square_results = []
-            
-            for i, channel in enumerate(channels):
-                # Calculate histograms for even and odd values
-                hist_even = np.zeros(128, dtype=np.float32)
-                hist_odd = np.zeros(128, dtype=np.float32)
-                
-                for j in range(256):
-                    if j % 2 == 0:
-                        hist_even[j // 2] = cv2.calcHist([channel], [0], None, [256], [0, 256])[j]
-                    else:
-                        hist_odd[j // 2] = cv2.calcHist([channel], [0], None, [256], [0, 256])[j]
-                
-                # Calculate chi-square statistic
-                chi_square = 0
-                for k in range(128):
-                    expected = (hist_even[k] + hist_odd[k]) / 2
-                    if expected > 0:
-                        chi_square += ((hist_even[k] - expected) ** 2) / expected
-                        chi_square += ((hist_odd[k] - expected) ** 2) / expected
-                
-                # Normalize chi-square value
-                chi_square /= (2 * 128)
-                chi_square_results.append(chi_square)
-            
-            avg_chi_square = sum(chi_square_results) / len(chi_square_results)
-            confidence_score = 1 - (avg_chi_square / self.chi_square_threshold) if avg_chi_square < self.chi_square_threshold else 0
+            context = ImageContext.coerce(image_path)
+            
+            # YCrCb color space is better for steganography detection; the
+            # pairs-of-values statistic covers every channel at once
+            return self._chi_square_result(pair_chi_square(self._pixel_statistics(context).ycrcb_hists))
+            
+        except Exception as e:
+            return {"detected": False, "error": str(e)}
+    
+    def _chi_square_result(self, chi_square_results):
+        """
+        Score the per-channel statistics computed by chi_square_test or analyze_batch.
+        
+        Args:
+            chi_square_results: Pairs-of-values statistic of each YCrCb channel
+            
+        Returns:
+            dict: Detection results
+        """
+        avg_chi_square = float(chi_square_results.mean())
+        confidence_score = 1 - (avg_chi_square / self.chi_square_threshold) if avg_chi_square < self.chi_square_threshold else 0
+        
+        return {
+            "detected": bool(confidence_score > 0.5),
+            "confidence":confidence_score,
+            "chi_square_value": avg_chi_square,
+            "details": "Chi-square test indicates potential hidden data" if avg_chi_square < self.chi_square_threshold else "Chi-square test shows normal distribution"
+        }
+    
+    def progressive_chi_square_test(self, image_path, steps=100, p_threshold=0.5):
+        """
+        Westfeld-Pfitzmann chi-square attack over increasing image prefixes.
+        
+        Samples are scanned in the same order as extract_sample (row-major,
+        RGB interleaved) and the p-value of each prefix is reported, so a
+        sequentially embedded payload shows up as a leading run of high
+        p-values whose length estimates the payload size.
+        
+        Args:
+            image_path: Path to the image file or an ImageContext
+            steps: Number of prefixes to evaluate
+            p_threshold: p-value above which a prefix is considered embedded
+            
+        Returns:
+            dict: Detection results with the p-value curve
+        """
+        try:
+            context = ImageContext.coerce(image_path)
+            samples = context.pixels if context.pixels.ndim == 2 else context.rgb
+            
+            attack = progressive_chi_square(samples, steps=steps, p_threshold=p_threshold)
+            detected = attack["estimated_length_bits"] > 0
             
             return {
-                "detected": bool(confidence_score > 0.5),
-                "confidence":confidence_score,
-                "chi_square_value": avg_chi_square.item(),
-                "details": "Chi-square test indicates potential hidden data" if avg_chi_square < self.chi_square_threshold else "Chi-square test shows normal distribution"
+                "detected": detected,
+                **attack,
+                "details": f"Chi-square attack suggests about {attack['estimated_length_bytes']} embedded bytes" if detected else "Chi-square attack found no sequentially embedded data"
             }
             
         except Exception as e:
             return {"detected": False, "error": str(e)}
     
-    def extract_sample(self, image_path):
+    def localize(self, image_path, block_size=None):
+        """
+        Compute LSB statistics for every block of a grid, to find where data is hidden.
+        
+        A payload confined to one region is diluted in the global scores;
+        per-block statistics show it where it is.
+        
+        Args:
+            image_path: Path to the image file or an ImageContext
+            block_size: Side of the blocks in pixels (defaults to heatmap_block_size)
+            
+        Returns:
+            dict: The block size and per-block arrays of transition rate, ones
+            ratio, chi-square p-value and SPA embedding rate, plus
+            "suspicion", the embedding rate clipped to [0, 1]
+        """
+        context = ImageContext.coerce(image_path)
+        # Under a memory budget the blocks are read band by band
+        pixels = context.rgb if self.memory_budget is None else context.rgb_rows()
+        stats = block_statistics(pixels, block_size or self.heatmap_block_size)
+        stats["suspicion"] = np.clip(np.nan_to_num(stats["embedding_rate"]), 0, 1)
+        return stats
+    
+    def extract_sample(self, image_path, max_bytes=None, orders=None):
         """
         Attempt to extract a sample of potentially hidden data.
         
+        The LSB plane is sliced and bit-packed in bulk and the payload ends at
+        the first NUL byte or after max_bytes, whichever comes first.
+        
         Args:
-            image_path: Path to the image file
+            image_path: Path to the image file or an ImageContext
+            max_bytes: Maximum sample size in bytes (defaults to max_sample_bytes)
+            orders: Bit orders to try, e.g. ["rgb-msb-row", "planar-lsb-column"],
+                or "all" for every supported order
             
         Returns:
             dict: Extraction results
         """
         try:
-            # Manual LSB extraction for a sample
-            img = Image.open(image_path)
-            img_array = np.array(img)
+            context = ImageContext.coerce(image_path)
             
-            if len(img_array.shape) < 3:
+            if context.ndim < 3:
                 return {"detected": False, "reason": "Grayscale image, insufficient channels for sample extraction"}
             
-            # Extract LSB from a portion of the image
-            sample_size = img_array.shape[0] * img_array.shape[1]
-            lsb_bits = []
-            
-            for i in range(sample_size):
-                row = i // img_array.shape[1]
-                col = i % img_array.shape[1]
-                if row < img_array.shape[0]:
-                    pixel = img_array[row, col]
-                    if len(img_array.shape) == 3 and img_array.shape[2] >= 3:
-                        for channel in range(3):  # R, G, B
-                            lsb_bits.append(pixel[channel] & 1)
-                
-                if len(lsb_bits) >= 8 and sum(lsb_bits[-8:]) == 0:
-                    break
+            if max_bytes is None:
+                max_bytes = self.max_sample_bytes
+            if orders is None:
+                orders = [DEFAULT_ORDER]
+            elif orders == "all":
+                orders = list(ALL_ORDERS)
             
-            # Convert bits to bytes
-            if len(lsb_bits) >= 8:
-                byte_array = bytearray()
-                for i in range(0, len(lsb_bits) - 7, 8):
-                    byte = 0
-                    for j in range(8):
-                        byte = (byte << 1) | lsb_bits[i + j]
-                    byte_array.append(byte)
-                
-                sample_text = byte_array.decode('ascii', errors='replace')
-                sample_hex = binascii.hexlify(byte_array).decode('ascii')
-
-                return {
-                    'detected': True,
-                    'sample_text': sample_text,
-                    'sample_hex': sample_hex
-                }
+            # Only the leading rows or columns holding the sample are read
+            candidates = [describe_payload(extract_payload(context.rgb_region(*payload_region(context.shape, max_bytes, order)),
+                                                           max_bytes, order))
+                          for order in orders]
             
-            return {"detected": False, "reason": "No hidden data found in sample"}
+            # Prefer terminated, mostly printable payloads
+            best = max(candidates, key=lambda c: (c["terminated"] and c["length"] > 0, c["printable_ratio"]))
+            if best["length"] == 0:
+                return {"detected": False, "reason": "No hidden data found in sample"}
+            
+            result = {
+                'detected': True,
+                'order': best['order'],
+                'terminated': best['terminated'],
+                'sample_text': best['sample_text'],
+                'sample_hex': best['sample_hex']
+            }
+            if len(candidates) > 1:
+                result['candidates'] = candidates
+            return result
             
         except Exception as e:
             return {"detected": False, "error": str(e)}
@@ -285,72 +1013,62 @@ class SteganographyDetector:
         Analyze image histograms for signs of manipulation.
         
         Args:
-            image_path: Path to the image file
+            image_path: Path to the image file or an ImageContext
             
         Returns:
             dict: Analysis results
         """
         try:
-            # Open image with OpenCV
-            img = cv2.imread(image_path)
-            if img is None:
-                return {"detected": False, "reason": "Unable to read image with OpenCV"}
-            
-            # Split into channels
-            if len(img.shape) == 3 and img.shape[2] == 3:
-                channels = cv2.split(img)
-            else:
-                channels = [img]  # Grayscale image
-            
-            # Analyze each channel's histogram
-            suspicious_patterns = 0
-            details = []
-            
-            for i, channel in enumerate(channels):
-                hist = cv2.calcHist([channel], [0], None, [256], [0, 256])
-                
-                # Check for "comb" pattern in histogram (alternating high-low values)
-                comb_score = 0
-                for j in range(1, 255, 2):
-                    if hist[j-1] > 0 and hist[j+1] > 0 and hist[j] < (hist[j-1] + hist[j+1]) / 4:
-                        comb_score += 1
-                
-                # Check for unusual peaks at specific values
-                unusual_peaks = 0
-                for j in range(1, 255):
-                    if hist[j] > 3 * (hist[j-1] + hist[j+1]) / 2:
-                        unusual_peaks += 1
-                
-                # Check for abnormal distribution of even vs odd values
-                even_sum = sum(hist[j] for j in range(0, 256, 2))
-                odd_sum = sum(hist[j] for j in range(1, 256, 2))
-                even_odd_ratio = abs(even_sum - odd_sum) / (even_sum + odd_sum) if (even_sum + odd_sum) > 0 else 0
-                
-                channel_name = ["Blue", "Green", "Red"][i] if i < 3 else f"Channel {i}"
-                
-                if comb_score > 10:
-                    suspicious_patterns += 1
-                    details.append(f"{channel_name} channel shows comb pattern in histogram")
-                
-                if unusual_peaks > 5:
-                    suspicious_patterns += 1
-                    details.append(f"{channel_name} channel has unusual peaks in histogram")
-                
-                if even_odd_ratio > 0.1:
-                    suspicious_patterns += 1
-                    details.append(f"{channel_name} channel has abnormal even/odd value distribution")
-
-            confidence_score = min(suspicious_patterns / 6, 1.0) if suspicious_patterns > 0 else 0;
+            context = ImageContext.coerce(image_path)
             
-            return {
-                "detected": bool(confidence_score > 0.5),
-                "confidence": confidence_score,
-                "suspicious_patterns": suspicious_patterns,
-                "details": "; ".join(details) if details else "No suspicious histogram patterns detected"
-            }
+            # Exact per-channel counts, in BGR order
+            hists = self._pixel_statistics(context).value_hists[::-1]
+            
+            # Look for comb patterns, unusual peaks and even/odd imbalance
+            return self._histogram_result(*histogram_features(hists))
             
         except Exception as e:
             return {"detected": False, "error": str(e)}
+    
+    def _histogram_result(self, comb_scores, unusual_peaks, even_odd_ratios):
+        """
+        Score the per-channel histogram features computed by
+        histogram_analysis or analyze_batch.
+        
+        Args:
+            comb_scores: Number of comb-pattern bins in each BGR channel
+            unusual_peaks: Number of isolated peaks in each BGR channel
+            even_odd_ratios: Even/odd count imbalance of each BGR channel
+            
+        Returns:
+            dict: Analysis results
+        """
+        suspicious_patterns = 0
+        details = []
+        
+        for i, (comb_score, peaks, even_odd_ratio) in enumerate(zip(comb_scores, unusual_peaks, even_odd_ratios)):
+            channel_name = ["Blue", "Green", "Red"][i] if i < 3 else f"Channel {i}"
+            
+            if comb_score > 10:
+                suspicious_patterns += 1
+                details.append(f"{channel_name} channel shows comb pattern in histogram")
+            
+            if peaks > 5:
+                suspicious_patterns += 1
+                details.append(f"{channel_name} channel has unusual peaks in histogram")
+            
+            if even_odd_ratio > 0.1:
+                suspicious_patterns += 1
+                details.append(f"{channel_name} channel has abnormal even/odd value distribution")
+
+        confidence_score = min(suspicious_patterns / 6, 1.0) if suspicious_patterns > 0 else 0;
+        
+        return {
+            "detected": bool(confidence_score > 0.5),
+            "confidence": confidence_score,
+            "suspicious_patterns": suspicious_patterns,
+            "details": "; ".join(details) if details else "No suspicious histogram patterns detected"
+        }
 
 # Function to create test images with hidden data for testing
 def create_test_images(output_dir):
@@ -374,18 +1092,16 @@ def create_test_images(output_dir):
     
     # Hide a message in the LSB
     message = "This is a hidden message for testing steganography detection."
-    message_bits = []
-    for char in message:
-        bits = bin(ord(char))[2:].zfill(8)
-        message_bits.extend([int(bit) for bit in bits])
-    
-    # Embed bits in the image
-    for i, bit in enumerate(message_bits):
-        if i < steg_img.size // 3:  # Ensure we don't exceed image size
-            row = (i // steg_img.shape[1]) % steg_img.shape[0]
-            col = i % steg_img.shape[1]
-            channel = 0  # Use blue channel
-            steg_img[row, col, channel] = (steg_img[row, col, channel] & 0xFE) | bit
+    bit_string = ''.join(bin(ord(char))[2:].zfill(8) for char in message)
+    message_bits = np.frombuffer(bit_string.encode(), dtype=np.uint8) - ord('0')
+    
+    # Embed bits in the blue channel, one per pixel in raster order,
+    # without exceeding the image size
+    message_bits = message_bits[:steg_img.size // 3]
+    positions = np.arange(message_bits.size)
+    rows = (positions // steg_img.shape[1]) % steg_img.shape[0]
+    cols = positions % steg_img.shape[1]
+    steg_img[rows, cols, 0] = (steg_img[rows, cols, 0] & 0xFE) | message_bits
     
     cv2.imwrite(os.path.join(output_dir, "steg_test.png"), steg_img)
     
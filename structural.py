@@ -0,0 +1,209 @@
+from functools import lru_cache
+
+import numpy as np
+import cv2
+
+from chi_square import EXACT_HISTOGRAM_PIXELS
+
+# RS groups are runs of four horizontally adjacent samples; the flipping
+# mask changes the two inner samples
+RS_GROUP = 4
+# Differences between neighbours in a group are clipped to these bounds
+# (outer pair, inner pair, outer pair) without changing any classification
+RS_CLIPS = (3, 5, 3)
+# Packed group states: (d01 * 7 + d23) by (d12 * 16 + parity bits)
+RS_STATE_SHAPE = (7 * 7, 11 * 16)
+
+
+def _smoothness(group):
+    return abs(group[1] - group[0]) + abs(group[2] - group[1]) + abs(group[3] - group[2])
+
+
+def _flip(value):
+    """F1: 2i <-> 2i + 1."""
+    return value ^ 1
+
+
+def _shifted_flip(value):
+    """F-1: 2i - 1 <-> 2i."""
+    return value + 2 * (value & 1) - 1
+
+
+@lru_cache(maxsize=None)
+def rs_state_table():
+    """
+    Classify every packed RS group state.
+
+    A group's classification under F1 and F-1, for the image and for the
+    image with all LSBs flipped, depends only on the clipped differences
+    between its neighbours and on the parity of its samples. Each state is
+    evaluated once on a representative group.
+
+    Returns:
+        np.ndarray: int8 array of shape (4,) + RS_STATE_SHAPE holding +1
+        (regular), -1 (singular) or 0 for R_M, R_-M, then the same on the
+        flipped image; states that cannot occur are 0
+    """
+    table = np.zeros((4, 7, 7, 11, 16), dtype=np.int8)
+    for d01 in range(-3, 4):
+        for d12 in range(-5, 6):
+            for d23 in range(-3, 4):
+                for parity in range(16):
+                    bits = [(parity >> shift) & 1 for shift in (3, 2, 1, 0)]
+                    group = [100 + bits[0]]
+                    for i, (difference, clip) in enumerate(zip((d01, d12, d23), RS_CLIPS)):
+                        value = group[-1] + difference
+                        if value & 1 != bits[i + 1]:
+                            if abs(difference) < clip:
+                                break
+                            # Clipped differences stand for any larger one
+                            value += 1 if difference > 0 else -1
+                        group.append(value)
+                    else:
+                        for k, image in enumerate((group, [_flip(value) for value in group])):
+                            base = _smoothness(image)
+                            for j, flip in enumerate((_flip, _shifted_flip)):
+                                flipped = [image[0], flip(image[1]), flip(image[2]), image[3]]
+                                table[2 * k + j, d01 + 3, d23 + 3, d12 + 5, parity] = np.sign(_smoothness(flipped) - base)
+    return table.reshape((4,) + RS_STATE_SHAPE)
+
+
+def _clipped_difference(a, b, clip):
+    """clip(b - a, -clip, clip) + clip, computed with saturating uint8 arithmetic."""
+    rising = cv2.min(cv2.subtract(b, a), clip)
+    falling = cv2.min(cv2.subtract(a, b), clip)
+    return cv2.subtract(cv2.add(rising, clip), falling)
+
+
+def _planes(pixels):
+    if pixels.ndim == 2:
+        return [pixels]
+    return cv2.split(np.ascontiguousarray(pixels))
+
+
+def rs_state_counts(pixels):
+    """
+    Count the RS group states of every channel.
+
+    Args:
+        pixels: uint8 array of shape (height, width[, channels])
+
+    Returns:
+        np.ndarray: float64 array of shape (channels,) + RS_STATE_SHAPE
+    """
+    width = pixels.shape[1] // RS_GROUP * RS_GROUP
+    if width == 0:
+        return np.zeros((len(_planes(pixels)),) + RS_STATE_SHAPE)
+    rows = max(1, (EXACT_HISTOGRAM_PIXELS - 1) // max(width // RS_GROUP, 1))
+    counts = []
+    for plane in _planes(pixels):
+        total = np.zeros(RS_STATE_SHAPE)
+        # Row blocks keep calcHist's float32 counts exact
+        for top in range(0, plane.shape[0], rows):
+            block = np.ascontiguousarray(plane[top:top + rows, :width])
+            g = cv2.split(block.reshape(-1, 1, RS_GROUP))
+            outer = cv2.add(cv2.multiply(_clipped_difference(g[0], g[1], 3), 7), _clipped_difference(g[2], g[3], 3))
+            parity = cv2.bitwise_and(g[0], 1)
+            for sample in g[1:]:
+                parity = cv2.add(cv2.add(parity, parity), cv2.bitwise_and(sample, 1))
+            inner = cv2.add(cv2.multiply(_clipped_difference(g[1], g[2], 5), 16), parity)
+            total += cv2.calcHist([outer, inner], [0, 1], None, list(RS_STATE_SHAPE),
+                                  [0, RS_STATE_SHAPE[0], 0, RS_STATE_SHAPE[1]])
+        counts.append(total)
+    return np.stack(counts)
+
+
+def _smaller_root(a, b, c):
+    """Root of a*x**2 + b*x + c = 0 with the smaller magnitude, or NaN."""
+    if abs(a) < 1e-12:
+        return -c / b if b else float("nan")
+    # Near full embedding sampling noise can push the discriminant below
+    # zero; the double root is the best estimate then
+    discriminant = max(b * b - 4 * a * c, 0.0)
+    roots = ((-b + np.sqrt(discriminant)) / (2 * a), (-b - np.sqrt(discriminant)) / (2 * a))
+    return min(roots, key=abs)
+
+
+def rs_estimate(pixels):
+    """
+    Estimate the LSB embedding rate of each channel with RS analysis.
+
+    Follows Fridrich, Goljan and Du: the relative numbers of regular and
+    singular groups under the flipping mask and its negation, for the image
+    and for the image with every LSB flipped, give a quadratic whose
+    smaller root yields the message length.
+
+    Args:
+        pixels: uint8 array of shape (height, width[, channels])
+
+    Returns:
+        dict: Per-channel "rates" (fraction of samples carrying payload,
+        NaN where the image has too little texture) and the group
+        fractions "regular" and "singular" under the mask
+    """
+    table = rs_state_table()
+    counts = rs_state_counts(pixels)
+    groups = counts.sum(axis=(1, 2))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        regular = np.einsum("kij,cij->ck", table > 0, counts) / groups[:, np.newaxis]
+        singular = np.einsum("kij,cij->ck", table < 0, counts) / groups[:, np.newaxis]
+
+    rates = []
+    for r, s in zip(regular, singular):
+        d0, dn0, d1, dn1 = r - s
+        x = _smaller_root(2 * (d1 + d0), dn0 - dn1 - d1 - 3 * d0, d0 - dn0)
+        rates.append(x / (x - 0.5))
+    return {"rates": rates, "regular": regular[:, 0].tolist(), "singular": singular[:, 0].tolist()}
+
+
+# Trace sets of Sample Pair Analysis over all (u, v) value pairs
+_U, _V = np.meshgrid(np.arange(256), np.arange(256), indexing="ij")
+_SPA_X = ((_V % 2 == 0) & (_U < _V)) | ((_V % 2 == 1) & (_U > _V))
+_SPA_Y = ((_V % 2 == 0) & (_U > _V)) | ((_V % 2 == 1) & (_U < _V))
+_SPA_Z = _U == _V
+_SPA_W = (_U ^ _V) == 1
+
+
+def pair_histograms(pixels):
+    """
+    Joint histograms of horizontally adjacent samples for every channel.
+
+    Args:
+        pixels: uint8 array of shape (height, width[, channels])
+
+    Returns:
+        np.ndarray: float64 array of shape (channels, 256, 256) counting (left, right) pairs
+    """
+    planes = _planes(pixels)
+    rows = max(1, (EXACT_HISTOGRAM_PIXELS - 1) // max(pixels.shape[1] - 1, 1))
+    hists = np.zeros((len(planes), 256, 256))
+    if pixels.shape[1] < 2:
+        return hists
+    for i, plane in enumerate(planes):
+        for top in range(0, plane.shape[0], rows):
+            block = plane[top:top + rows]
+            hists[i] += cv2.calcHist([block[:, :-1], block[:, 1:]], [0, 1], None, [256, 256], [0, 256, 0, 256])
+    return hists
+
+
+def spa_estimate(pixels):
+    """
+    Estimate the LSB embedding rate of each channel with Sample Pair Analysis.
+
+    Follows Dumitrescu, Wu and Wang: with P the pairs of horizontally
+    adjacent samples and X, Y, Z, W its trace sets, the rate is the
+    smaller root of (|W| + |Z|) / 2 * p**2 + (2|X| - |P|) * p + |Y| - |X| = 0.
+
+    Args:
+        pixels: uint8 array of shape (height, width[, channels])
+
+    Returns:
+        dict: Per-channel "rates" (NaN where there are no usable pairs)
+    """
+    rates = []
+    for hist in pair_histograms(pixels):
+        total = hist.sum()
+        x, y = hist[_SPA_X].sum(), hist[_SPA_Y].sum()
+        z, w = hist[_SPA_Z].sum(), hist[_SPA_W].sum()
+        rates.append(_smaller_root((w + z) / 2, 2 * x - total, y - x) if total else float("nan"))
+    return {"rates": rates}
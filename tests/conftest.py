@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Analyze zip members in the test process
+os.environ.setdefault("STEG_POOL_SIZE", "0")
@@ -0,0 +1,75 @@
+import io
+import json
+import zipfile
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app import app
+from steg_detector import DETECTION_METHODS
+
+# Every method that can run on an upload, so that all their statistics are serialized
+ALL_METHODS = ",".join(name for name in DETECTION_METHODS if name != "known_cover")
+
+
+def _reject_constant(name):
+    raise ValueError(f"Not valid JSON: {name}")
+
+
+def strict_loads(text):
+    """Parse JSON as a strict parser would, rejecting NaN and Infinity."""
+    return json.loads(text, parse_constant=_reject_constant)
+
+
+def encode(image, format):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.fixture(params=["gradient", "flat"])
+def jpeg(request):
+    """An ordinary RGB JPEG; high-frequency and chroma statistics are undefined for both."""
+    if request.param == "gradient":
+        pixels = (np.add.outer(np.arange(120), np.arange(160)) % 256).astype(np.uint8)
+        image = Image.fromarray(pixels).convert("RGB")
+    else:
+        image = Image.new("RGB", (64, 64), (120, 120, 120))
+    return encode(image, "JPEG")
+
+
+def test_analyze_response_is_strict_json(client, jpeg):
+    response = client.post(f"/analyze?methods={ALL_METHODS}",
+                           data={"image": (io.BytesIO(jpeg), "image.jpg")})
+    assert response.status_code == 200
+    result = strict_loads(response.get_data(as_text=True))
+    assert "f5_analysis" in result["detection_methods"]
+
+
+@pytest.mark.parametrize("size", [(64, 64), (3, 3)])
+def test_flat_image_response_is_strict_json(client, size):
+    # Too small or too smooth for RS groups and pair statistics
+    png = encode(Image.new("RGB", size, (120, 120, 120)), "PNG")
+    response = client.post(f"/analyze?methods={ALL_METHODS}",
+                           data={"image": (io.BytesIO(png), "flat.png")})
+    assert response.status_code == 200
+    result = strict_loads(response.get_data(as_text=True))
+    assert "rs_analysis" in result["detection_methods"]
+
+
+def test_zip_stream_records_are_strict_json(client, jpeg):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("image.jpg", jpeg)
+    response = client.post(f"/analyzezip?methods={ALL_METHODS}&early_exit=0",
+                           data={"zip": (io.BytesIO(archive.getvalue()), "images.zip")},
+                           headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 200
+    records = [strict_loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+    assert any("file" in record for record in records)
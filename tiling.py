@@ -0,0 +1,17 @@
+# Strip-sized temporaries alive at once while a strip's statistics are
+# accumulated: the strip, its two neighbour XORs and a colour conversion,
+# with headroom
+STRIP_WORKING_COPIES = 8
+
+
+def strip_bytes(memory_budget):
+    """
+    Size of the strips processed under a working-memory budget.
+
+    Args:
+        memory_budget: Bytes of working memory allowed for one analysis
+
+    Returns:
+        int: Maximum bytes of pixel data per strip
+    """
+    return max(1, memory_budget // STRIP_WORKING_COPIES)
@@ -0,0 +1,116 @@
+import io
+import posixpath
+import zipfile
+
+from PIL import Image
+
+# Leading bytes of the image formats we analyze, mapped to their MIME type
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+)
+
+
+class ZipLimitError(ValueError):
+    """Raised when an archive exceeds one of the configured limits."""
+
+
+def sniff_image_type(header):
+    """
+    Identify an image from its leading bytes.
+
+    Args:
+        header: The first bytes of the file (16 are enough)
+
+    Returns:
+        str: MIME type of the image, or None if it is not a supported image
+    """
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return mime_type
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+class ZipImageReader:
+    """Reads the images of a zip archive member by member, without extracting it."""
+
+    def __init__(self, stream, max_members=10000, max_total_bytes=1 << 30,
+                 max_ratio=100, max_pixels=100_000_000):
+        """
+        Open the archive and check its central directory against the limits.
+
+        The declared sizes are checked before any member is decompressed, so
+        zip bombs are rejected without inflating them. zipfile itself stops
+        reading a member at its declared size.
+
+        Args:
+            stream: Seekable binary file object holding the archive
+            max_members: Maximum number of files in the archive
+            max_total_bytes: Maximum total uncompressed size of the files
+            max_ratio: Maximum uncompressed/compressed size ratio of a file
+            max_pixels: Maximum pixel count of a single image
+
+        Raises:
+            zipfile.BadZipFile: If the stream is not a zip archive
+            ZipLimitError: If the archive exceeds a limit
+        """
+        self.zip = zipfile.ZipFile(stream)
+        self.max_pixels = max_pixels
+        self.members = [info for info in self.zip.infolist() if not info.is_dir()]
+
+        if len(self.members) > max_members:
+            raise ZipLimitError(f"Archive has {len(self.members)} files, the limit is {max_members}")
+
+        total = sum(info.file_size for info in self.members)
+        if total > max_total_bytes:
+            raise ZipLimitError(f"Archive expands to {total} bytes, the limit is {max_total_bytes}")
+
+        for info in self.members:
+            if info.file_size > max_ratio * max(info.compress_size, 1):
+                raise ZipLimitError(f"{info.filename} has a compression ratio above {max_ratio}")
+
+    def __iter__(self):
+        """
+        Yield the image members in archive order.
+
+        Non-image members are skipped after reading their first bytes only.
+
+        Yields:
+            tuple: (name, data, mime_type, error) where error is set, and
+            data is None, for members that cannot be read and for images
+            that exceed the pixel limit
+        """
+        for info in self.members:
+            name = posixpath.basename(info.filename)
+            try:
+                with self.zip.open(info) as member:
+                    mime_type = sniff_image_type(member.read(16))
+                if mime_type is None:
+                    continue
+                data = self.zip.read(info)
+            except Exception as e:
+                yield name, None, None, f"Unreadable archive member: {e}"
+                continue
+
+            try:
+                with Image.open(io.BytesIO(data)) as img:
+                    width, height = img.size
+            except Exception as e:
+                yield name, None, mime_type, f"Unreadable image: {e}"
+                continue
+
+            if width * height > self.max_pixels:
+                yield name, None, mime_type, f"Image has {width * height} pixels, the limit is {self.max_pixels}"
+                continue
+
+            yield name, data, mime_type, None
+
+    def close(self):
+        self.zip.close()